@@ -1,309 +1,3421 @@
+import time
+
+# Inicio del proceso para el perfil de arranque (antes de importar Kivy)
+INICIO_ARRANQUE = time.perf_counter()
+
 from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.image import Image
 from kivy.uix.popup import Popup
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.camera import Camera
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.clock import Clock
+from kivy.logger import Logger
 from kivy.core.window import Window
+from kivy.graphics.texture import Texture
 from kivy.utils import platform
 import sqlite3
+import csv
+import sys
+import hashlib
 import json
 import os
-from datetime import datetime
+import gzip
+import math
+import queue
+import random
+import re
+import struct
 import threading
-import time
-from plyer import camera, gps, accelerometer
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from itertools import groupby, islice
+from concurrent.futures import Future
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Los módulos de plyer (GPS, acelerómetro) y la cámara se importan al usarlos por primera vez
+FIN_IMPORTACIONES = time.perf_counter()
+
+# NumPy es opcional (sin él las distancias en lote usan Python puro) y tarda decenas
+# de ms en importarse: se importa la primera vez que se calculan distancias en lote
+np = None
+_numpy_importado = False
+
+def importar_numpy():
+    """Importa NumPy bajo demanda; devuelve el módulo o None si no está instalado"""
+    global np, _numpy_importado
+    if not _numpy_importado:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+        _numpy_importado = True
+    return np
+
+# Configuración de la conexión SQLite
+DB_PATH = 'computer_store.db'
+
+# Pragmas aplicados a cada conexión nueva (ajustables por pool)
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -8000,  # Negativo = KiB (~8 MB)
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+
+class _ConexionDeHilo:
+    """Conexión persistente de un hilo y cuántos bloques la están usando
+    
+    Solo la referencia el thread-local del hilo: cuando el hilo termina se libera
+    y su finalizador cierra la conexión.
+    """
+    __slots__ = ('conn', 'generation', 'en_uso', 'cerrar', '__weakref__')
+    
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+        self.en_uso = 0
+        self.cerrar = False  # close_all la pidió cerrar mientras estaba en uso
+        weakref.finalize(self, conn.close)
+
+class ConnectionPool:
+    """Mantiene una conexión SQLite persistente por hilo"""
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_path=DB_PATH, pragmas=None, persistent=True, cached_statements=256):
+        self.db_path = db_path
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.persistent = persistent
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = weakref.WeakSet()  # _ConexionDeHilo de los hilos vivos
+        self._generation = 0
+        # Callbacks por nombre: registrar otro con el mismo nombre reemplaza al anterior
+        self.on_connect = {}  # (conn) al abrir cada conexión
+        self.on_commit = {}  # () tras cada transaction() confirmada
+        self.medir_hilo_ui = False  # Si es True acumula en io_hilo_ui el tiempo de SQLite en el hilo principal
+        self.io_hilo_ui = 0.0
+
+    @classmethod
+    def shared(cls, db_path=DB_PATH):
+        """Devuelve el pool compartido del proceso para una ruta"""
+        with cls._shared_lock:
+            pool = cls._shared.get(db_path)
+            if pool is None:
+                pool = cls._shared[db_path] = cls(db_path)
+            return pool
+
+    def _connect(self):
+        """Abre una conexión y aplica los pragmas configurados"""
+        # La caché de sentencias de sqlite3 reutiliza los statements preparados
+        # mientras la conexión siga viva
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for nombre, valor in self.pragmas.items():
+            conn.execute(f'PRAGMA {nombre} = {valor}')
+        for callback in list(self.on_connect.values()):
+            callback(conn)
+        return conn
+
+    def _thread_connection(self):
+        """Obtiene (o crea) la conexión del hilo actual y la marca en uso"""
+        actual = getattr(self._local, 'conexion', None)
+        with self._lock:
+            if actual is not None and actual.generation == self._generation:
+                actual.en_uso += 1
+                return actual
+        conn = self._connect()
+        with self._lock:
+            actual = _ConexionDeHilo(conn, self._generation)
+            actual.en_uso = 1
+            self._connections.add(actual)
+        self._local.conexion = actual
+        return actual
+    
+    def _liberar(self, conexion):
+        """Fin de un bloque que usaba la conexión del hilo; la cierra si close_all lo pidió"""
+        with self._lock:
+            conexion.en_uso -= 1
+            cerrar = conexion.cerrar and conexion.en_uso == 0
+        if cerrar:
+            conexion.conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Entrega una conexión; en modo no persistente se abre y cierra por llamada"""
+        activa = getattr(self._local, 'transaccion', None)
+        if activa is not None:
+            # Dentro de una transacción del hilo se usa su conexión (ve sus propias escrituras)
+            yield activa
+            return
+        if self.medir_hilo_ui and threading.current_thread() is threading.main_thread():
+            inicio = time.perf_counter()
+            try:
+                with self._abrir() as conn:
+                    yield conn
+            finally:
+                self.io_hilo_ui += time.perf_counter() - inicio
+            return
+        with self._abrir() as conn:
+            yield conn
+
+    @contextmanager
+    def _abrir(self):
+        if self.persistent:
+            conexion = self._thread_connection()
+            try:
+                yield conexion.conn
+            finally:
+                self._liberar(conexion)
+            return
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Entrega una conexión dentro de una transacción (commit o rollback)
+        
+        Con immediate=True se toma el lock de escritura al empezar (BEGIN IMMEDIATE),
+        así las lecturas de la transacción no pueden quedar obsoletas antes del commit.
+        Dentro de otra transacción del mismo hilo se anida con un SAVEPOINT: un error
+        deshace solo la parte anidada y el commit (y on_commit) ocurre al cerrar la externa.
+        """
+        activa = getattr(self._local, 'transaccion', None)
+        if activa is not None:
+            profundidad = self._local.profundidad
+            nombre = f'anidada_{profundidad}'
+            activa.execute(f'SAVEPOINT {nombre}')
+            self._local.profundidad = profundidad + 1
+            try:
+                yield activa
+            except BaseException:
+                activa.execute(f'ROLLBACK TO {nombre}')
+                activa.execute(f'RELEASE {nombre}')
+                raise
+            else:
+                activa.execute(f'RELEASE {nombre}')
+            finally:
+                self._local.profundidad = profundidad
+            return
+        
+        with self.connection() as conn:
+            self._local.transaccion = conn
+            self._local.profundidad = 1
+            try:
+                with conn:
+                    if immediate:
+                        conn.execute('BEGIN IMMEDIATE')
+                    yield conn
+            finally:
+                self._local.transaccion = None
+        for callback in list(self.on_commit.values()):
+            callback()
+
+    def close_all(self):
+        """Cierra las conexiones abiertas por el pool
+        
+        Las que otro hilo está usando en ese momento las cierra ese hilo al terminar
+        el bloque; cada hilo abre una conexión nueva en su próximo acceso.
+        """
+        with self._lock:
+            self._generation += 1
+            libres = []
+            for conexion in list(self._connections):
+                if conexion.en_uso:
+                    conexion.cerrar = True
+                else:
+                    libres.append(conexion.conn)
+            self._connections = weakref.WeakSet()
+        for conn in libres:
+            conn.close()
+
+# Caché en memoria de consultas de productos
+class ProductCache:
+    """LRU con TTL e invalidación por etiquetas para las lecturas del catálogo"""
+    def __init__(self, max_entradas=256, ttl=300):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidaciones = 0
+        self._entradas = OrderedDict()  # clave -> (valor, expira, etiquetas)
+        self._por_etiqueta = {}  # etiqueta -> claves
+        self._generation = 0
+        self._lock = threading.Lock()
+    
+    def obtener(self, clave, etiquetas, cargar):
+        """Devuelve el valor cacheado o lo carga con cargar() y lo guarda"""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[1] > ahora:
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return entrada[0]
+            if entrada is not None:
+                self._quitar(clave)
+            self.misses += 1
+            generation = self._generation
+        
+        valor = cargar()
+        
+        with self._lock:
+            # Si hubo una invalidación mientras se consultaba, el valor puede estar obsoleto
+            if generation == self._generation and self.max_entradas > 0:
+                self._entradas[clave] = (valor, ahora + self.ttl, etiquetas)
+                for etiqueta in etiquetas:
+                    self._por_etiqueta.setdefault(etiqueta, set()).add(clave)
+                while len(self._entradas) > self.max_entradas:
+                    self._quitar(next(iter(self._entradas)))
+                    self.evictions += 1
+        return valor
+    
+    def invalidar(self, etiquetas):
+        """Descarta las entradas que llevan alguna de las etiquetas"""
+        with self._lock:
+            self._generation += 1
+            for etiqueta in etiquetas:
+                for clave in self._por_etiqueta.pop(etiqueta, ()):
+                    if clave in self._entradas:
+                        self._quitar(clave)
+                        self.invalidaciones += 1
+    
+    def limpiar(self):
+        """Vacía la caché por completo"""
+        with self._lock:
+            self._generation += 1
+            self._entradas.clear()
+            self._por_etiqueta.clear()
+    
+    def _quitar(self, clave):
+        """Elimina una entrada y sus referencias por etiqueta (con el lock tomado)"""
+        _, _, etiquetas = self._entradas.pop(clave)
+        for etiqueta in etiquetas:
+            claves = self._por_etiqueta.get(etiqueta)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._por_etiqueta[etiqueta]
+    
+    def estadisticas(self):
+        """Contadores para dimensionar la caché"""
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'entradas': len(self._entradas),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidaciones': self.invalidaciones,
+                'hit_rate': self.hits / consultas if consultas else 0.0,
+            }
+
+def etiquetas_listado(categoria):
+    """Etiquetas de caché de un listado según su filtro de categoría"""
+    if categoria and categoria != 'Todos':
+        return (f'categoria:{categoria}',)
+    return ('categoria:*',)
+
+class InvalidacionProductos:
+    """Sumidero único por pool de los productos escritos: tras cada commit invalida todas sus cachés
+    
+    Cada conexión del pool registra una sola vez producto_modificado y sus triggers TEMP;
+    las etiquetas se acumulan por hilo y se reparten a cada ProductCache suscrita, así un
+    DatabaseManager nuevo sobre el mismo pool se suma a las conexiones ya abiertas en vez
+    de reemplazar al anterior.
+    """
+    _por_pool = weakref.WeakKeyDictionary()
+    _por_pool_lock = threading.Lock()
+    
+    def __init__(self):
+        self.caches = weakref.WeakSet()
+        self._pendientes = threading.local()
+    
+    @classmethod
+    def del_pool(cls, pool):
+        """Devuelve el sumidero del pool, creándolo la primera vez"""
+        with cls._por_pool_lock:
+            sumidero = cls._por_pool.get(pool)
+            if sumidero is None:
+                sumidero = cls._por_pool[pool] = cls()
+            return sumidero
+    
+    def suscribir(self, cache):
+        """Agrega una caché a las que se invalidan tras cada commit del pool"""
+        self.caches.add(cache)
+    
+    def registrar(self, conn):
+        """Registra producto_modificado en la conexión y crea sus triggers TEMP"""
+        conn.create_function('producto_modificado', 2, self._anotar, deterministic=False)
+        self.crear_triggers(conn)
+    
+    def crear_triggers(self, conn):
+        """Triggers TEMP de la conexión que llaman a producto_modificado (idempotente)"""
+        for evento, filas in (('INSERT', ('new',)), ('DELETE', ('old',)), ('UPDATE', ('old', 'new'))):
+            llamadas = ' '.join(
+                f'SELECT producto_modificado({fila}.codigo_barras, {fila}.categoria);' for fila in filas
+            )
+            conn.execute(f'''
+                CREATE TEMP TRIGGER IF NOT EXISTS cache_productos_{evento.lower()}
+                AFTER {evento} ON main.productos BEGIN {llamadas} END
+            ''')
+    
+    def _anotar(self, codigo, categoria):
+        """Acumula las etiquetas a invalidar hasta que la transacción se confirme"""
+        pendientes = getattr(self._pendientes, 'etiquetas', None)
+        if pendientes is None:
+            pendientes = self._pendientes.etiquetas = set()
+        pendientes.update((f'codigo:{codigo}', f'categoria:{categoria}', 'categoria:*'))
+    
+    def aplicar(self):
+        """Invalida las cachés después del commit, para no recachear datos previos"""
+        pendientes = getattr(self._pendientes, 'etiquetas', None)
+        if pendientes:
+            self._pendientes.etiquetas = set()
+            for cache in list(self.caches):
+                cache.invalidar(pendientes)
+
+# Migraciones del esquema: la posición en MIGRACIONES es la versión que alcanza
+def _migracion_esquema_inicial(cursor):
+    """Versión 1: tablas base de la tienda"""
+    # Tabla productos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS productos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            categoria TEXT NOT NULL,
+            precio REAL NOT NULL,
+            descripcion TEXT,
+            stock INTEGER DEFAULT 0,
+            codigo_barras TEXT,
+            imagen_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Tabla carrito
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS carrito (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            producto_id INTEGER,
+            cantidad INTEGER DEFAULT 1,
+            precio_unitario REAL,
+            FOREIGN KEY (producto_id) REFERENCES productos(id)
+        )
+    ''')
+    
+    # Tabla pedidos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            total REAL NOT NULL,
+            estado TEXT DEFAULT 'pendiente',
+            direccion TEXT,
+            ubicacion_gps TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Tabla detalles pedidos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS detalles_pedidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pedido_id INTEGER,
+            producto_id INTEGER,
+            cantidad INTEGER,
+            precio_unitario REAL,
+            FOREIGN KEY (pedido_id) REFERENCES pedidos(id),
+            FOREIGN KEY (producto_id) REFERENCES productos(id)
+        )
+    ''')
+
+def _migracion_datos_ejemplo(cursor):
+    """Versión 2: catálogo de ejemplo (solo si la tabla está vacía)"""
+    cursor.execute('SELECT COUNT(*) FROM productos')
+    if cursor.fetchone()[0] > 0:
+        return
+    
+    productos_ejemplo = [
+        ('AMD Ryzen 9 7950X', 'Procesadores', 2480000.00, 'Procesador 16 núcleos, 32 hilos, 4.5GHz base', 8, '1234567890123', 'ryzen_9_7950x.jpg'),
+        ('Intel Core i9-13900K', 'Procesadores', 2715000.00, 'Procesador 24 núcleos, 32 hilos, hasta 5.8GHz', 12, '1234567890124', 'intel_i9_13900k.jpg'),
+        ('AMD Ryzen 7 7700X', 'Procesadores', 1269000.10, 'Procesador 8 núcleos, 16 hilos, 4.5GHz base', 15, '1234567890125', 'ryzen_7_7700x.jpg'),
+        ('NVIDIA RTX 4090', 'Tarjetas Gráficas', 13693374.36, 'GPU de alta gama, 24GB GDDR6X', 5, '1234567890126', 'rtx_4090.jpg'),
+        ('AMD RX 7900 XTX', 'Tarjetas Gráficas', 4500000.14, 'GPU potente, 24GB GDDR6', 7, '1234567890127', 'rx_7900_xtx.jpg'),
+        ('NVIDIA RTX 4070', 'Tarjetas Gráficas', 4991750.14, 'GPU gaming, 12GB GDDR6X', 10, '1234567890128', 'rtx_4070.jpg'),
+        ('Corsair Vengeance DDR5 32GB', 'Memorias RAM', 975620.25, 'Kit 2x16GB DDR5-5600MHz RGB', 20, '1234567890129', 'corsair_ddr5_32gb.jpg'),
+        ('G.Skill Trident Z5 RGB 16GB', 'Memorias RAM', 520000.25, 'Kit 2x8GB DDR5-6000MHz', 25, '1234567890130', 'gskill_ddr5_16gb.jpg'),
+        ('Kingston Fury Beast 64GB', 'Memorias RAM', 107143.45, 'Kit 4x16GB DDR4-3200MHz', 8, '1234567890131', 'kingston_64gb.jpg'),
+        ('ASUS ROG Strix X670E-E', 'Motherboards', 2105900.25, 'Placa AM5, WiFi 6E, PCIe 5.0', 6, '1234567890132', 'asus_x670e.jpg'),
+        ('MSI MAG B550 Tomahawk', 'Motherboards', 749000.14, 'Placa AM4, PCIe 4.0, USB-C', 12, '1234567890133', 'msi_b550.jpg'),
+        ('Gigabyte Z790 AORUS Elite', 'Motherboards', 13150000.24, 'Placa LGA1700, DDR5, WiFi 6', 9, '1234567890134', 'gigabyte_z790.jpg'),
+        ('Samsung 980 PRO 2TB', 'Almacenamiento', 415000.58, 'SSD NVMe M.2, 7000MB/s lectura', 15, '1234567890135', 'samsung_980_pro.jpg'),
+        ('WD Black SN850X 1TB', 'Almacenamiento', 2273400.25, 'SSD NVMe gaming, 7300MB/s', 20, '1234567890136', 'wd_black_sn850x.jpg'),
+        ('Seagate IronWolf 4TB', 'Almacenamiento', 998500.69, 'HDD NAS, 5400RPM, CMR', 18, '1234567890137', 'seagate_ironwolf.jpg'),
+        ('Corsair RM850x', 'Fuentes de Poder', 930252.85, '850W 80+ Gold modular', 12, '1234567890138', 'corsair_rm850x.jpg'),
+        ('EVGA SuperNOVA 1000W', 'Fuentes de Poder', 187520.65, '1000W 80+ Platinum modular', 8, '1234567890139', 'evga_1000w.jpg'),
+        ('Seasonic Focus GX-650', 'Fuentes de Poder', 584000.35, '650W 80+ Gold semi-modular', 15, '1234567890140', 'seasonic_650w.jpg'),
+    ]
+    cursor.executemany('''
+        INSERT INTO productos (nombre, categoria, precio, descripcion, stock, codigo_barras, imagen_url)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', productos_ejemplo)
+
+def _migracion_indices(cursor):
+    """Versión 3: índices secundarios y código de barras único"""
+    # SQLite no permite añadir un UNIQUE con ALTER TABLE; un índice único es equivalente
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_codigo_barras ON productos(codigo_barras)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_categoria ON productos(categoria)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_carrito_producto ON carrito(producto_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_detalles_pedido ON detalles_pedidos(pedido_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_detalles_producto ON detalles_pedidos(producto_id)')
+
+def _migracion_busqueda_fts(cursor):
+    """Versión 4: índice de texto completo FTS5 sincronizado por triggers"""
+    try:
+        # remove_diacritics permite buscar "graficas" o "nucleos" sin tildes
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+                nombre, categoria, descripcion,
+                content='productos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        # SQLite compilado sin FTS5: get_productos sigue usando LIKE
+        return
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS productos_fts_insert AFTER INSERT ON productos BEGIN
+            INSERT INTO productos_fts(rowid, nombre, categoria, descripcion)
+            VALUES (new.id, new.nombre, new.categoria, new.descripcion);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS productos_fts_delete AFTER DELETE ON productos BEGIN
+            INSERT INTO productos_fts(productos_fts, rowid, nombre, categoria, descripcion)
+            VALUES ('delete', old.id, old.nombre, old.categoria, old.descripcion);
+        END
+    ''')
+    # Solo las columnas indexadas: los cambios de stock no tocan el índice
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS productos_fts_update
+        AFTER UPDATE OF nombre, categoria, descripcion ON productos BEGIN
+            INSERT INTO productos_fts(productos_fts, rowid, nombre, categoria, descripcion)
+            VALUES ('delete', old.id, old.nombre, old.categoria, old.descripcion);
+            INSERT INTO productos_fts(rowid, nombre, categoria, descripcion)
+            VALUES (new.id, new.nombre, new.categoria, new.descripcion);
+        END
+    ''')
+    cursor.execute("INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')")
+
+def _migracion_indice_listado(cursor):
+    """Versión 5: índice para la paginación por cursor (categoria, nombre, id)"""
+    # El rowid va implícito al final del índice; reemplaza al índice solo por categoría
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_productos_listado ON productos(categoria, nombre)')
+    cursor.execute('DROP INDEX IF EXISTS idx_productos_categoria')
+
+def _migracion_carrito_unico(cursor):
+    """Versión 6: una sola fila de carrito por producto (requisito del UPSERT)"""
+    # Fusionar duplicados existentes en la fila más antigua de cada producto
+    cursor.execute('''
+        UPDATE carrito
+        SET cantidad = (SELECT SUM(c2.cantidad) FROM carrito c2 WHERE c2.producto_id = carrito.producto_id)
+        WHERE id IN (SELECT MIN(id) FROM carrito GROUP BY producto_id HAVING COUNT(*) > 1)
+    ''')
+    cursor.execute('DELETE FROM carrito WHERE id NOT IN (SELECT MIN(id) FROM carrito GROUP BY producto_id)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_carrito_producto_unico ON carrito(producto_id)')
+    cursor.execute('DROP INDEX IF EXISTS idx_carrito_producto')
+
+def _migracion_tiendas(cursor):
+    """Versión 7: tabla de tiendas con índice espacial R*Tree sincronizado por triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tiendas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            direccion TEXT,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            telefono TEXT,
+            especialidad TEXT
+        )
+    ''')
+    try:
+        cursor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS tiendas_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)'
+        )
+    except sqlite3.OperationalError:
+        # SQLite compilado sin R*Tree: rango sobre un índice B-tree por latitud
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tiendas_lat_lon ON tiendas(lat, lon)')
+    else:
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tiendas_rtree_insert AFTER INSERT ON tiendas BEGIN
+                INSERT INTO tiendas_rtree VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tiendas_rtree_delete AFTER DELETE ON tiendas BEGIN
+                DELETE FROM tiendas_rtree WHERE id = old.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tiendas_rtree_update AFTER UPDATE OF lat, lon ON tiendas BEGIN
+                UPDATE tiendas_rtree SET min_lat = new.lat, max_lat = new.lat, min_lon = new.lon, max_lon = new.lon
+                WHERE id = new.id;
+            END
+        ''')
+    
+    cursor.execute('SELECT COUNT(*) FROM tiendas')
+    if cursor.fetchone()[0] > 0:
+        return
+    tiendas_ejemplo = [
+        ("Computerworking", "Calle 32 #25-45", 10.4250, -75.5390, "300-123-4567", "Procesadores y GPUs"),
+        ("Compulago", "Av. Pedro de Heredia #85-12", 10.4300, -75.5340, "300-234-5678", "RAM y Almacenamiento"),
+        ("Computo Segunda mano", "Cra 17 #45-23", 10.4150, -75.5450, "300-345-6789", "Motherboards y Fuentes"),
+        ("Celuclock", "Centro Comercial la castellana", 10.4100, -75.5500, "300-456-7890", "Celulares y Accesorios"),
+    ]
+    cursor.executemany('''
+        INSERT INTO tiendas (nombre, direccion, lat, lon, telefono, especialidad)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', tiendas_ejemplo)
+
+def _reconstruir_tabla(cursor, tabla, columnas, select):
+    """Crea la tabla de nuevo con otras columnas (procedimiento de ALTER TABLE de SQLite)
+    
+    columnas define la tabla nueva y select son las expresiones que la llenan desde la
+    vieja, en el mismo orden. Los índices y triggers de la tabla se recrean tal cual.
+    """
+    esquema = [fila[0] for fila in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (tabla,)
+    ).fetchall()]
+    cursor.execute(f'CREATE TABLE {tabla}_nueva ({columnas})')
+    cursor.execute(f'INSERT INTO {tabla}_nueva SELECT {select} FROM {tabla}')
+    cursor.execute(f'DROP TABLE {tabla}')
+    cursor.execute(f'ALTER TABLE {tabla}_nueva RENAME TO {tabla}')
+    for sql in esquema:
+        cursor.execute(sql)
+
+def _migracion_precios_en_centavos(cursor):
+    """Versión 8: precios y totales como centavos enteros (sin error de punto flotante)"""
+    # Se conserva el orden de las columnas: hay consultas que leen productos.* por posición
+    _reconstruir_tabla(cursor, 'productos', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        precio_centavos INTEGER NOT NULL,
+        descripcion TEXT,
+        stock INTEGER DEFAULT 0,
+        codigo_barras TEXT,
+        imagen_url TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ''', 'id, nombre, categoria, CAST(ROUND(precio * 100) AS INTEGER), descripcion, stock, '
+        'codigo_barras, imagen_url, created_at')
+    _reconstruir_tabla(cursor, 'carrito', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto_id INTEGER,
+        cantidad INTEGER DEFAULT 1,
+        precio_unitario_centavos INTEGER,
+        FOREIGN KEY (producto_id) REFERENCES productos(id)
+    ''', 'id, producto_id, cantidad, CAST(ROUND(precio_unitario * 100) AS INTEGER)')
+    _reconstruir_tabla(cursor, 'pedidos', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        total_centavos INTEGER NOT NULL,
+        estado TEXT DEFAULT 'pendiente',
+        direccion TEXT,
+        ubicacion_gps TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ''', 'id, CAST(ROUND(total * 100) AS INTEGER), estado, direccion, ubicacion_gps, created_at')
+    _reconstruir_tabla(cursor, 'detalles_pedidos', '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pedido_id INTEGER,
+        producto_id INTEGER,
+        cantidad INTEGER,
+        precio_unitario_centavos INTEGER,
+        FOREIGN KEY (pedido_id) REFERENCES pedidos(id),
+        FOREIGN KEY (producto_id) REFERENCES productos(id)
+    ''', 'id, pedido_id, producto_id, cantidad, CAST(ROUND(precio_unitario * 100) AS INTEGER)')
+
+# Triggers que mantienen el resumen de ventas al insertar o borrar pedidos y sus detalles
+TRIGGERS_RESUMEN_VENTAS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS ventas_pedido_insert AFTER INSERT ON pedidos BEGIN
+        INSERT INTO ventas_diarias (dia, pedidos, ingresos_centavos)
+        VALUES (date(new.created_at, 'localtime'), 1, new.total_centavos)
+        ON CONFLICT(dia) DO UPDATE SET pedidos = pedidos + 1,
+                                       ingresos_centavos = ingresos_centavos + excluded.ingresos_centavos;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ventas_pedido_delete AFTER DELETE ON pedidos BEGIN
+        UPDATE ventas_diarias
+        SET pedidos = pedidos - 1, ingresos_centavos = ingresos_centavos - old.total_centavos,
+            unidades = unidades - (SELECT COALESCE(SUM(cantidad), 0) FROM detalles_pedidos WHERE pedido_id = old.id)
+        WHERE dia = date(old.created_at, 'localtime');
+    END
+    ''',
+    # Las ventas cuentan para la categoría actual del producto (igual que la reconstrucción);
+    # los detalles que se borren después que su pedido ya no tienen día que descontar
+    '''
+    CREATE TRIGGER IF NOT EXISTS ventas_detalle_insert AFTER INSERT ON detalles_pedidos BEGIN
+        UPDATE ventas_diarias SET unidades = unidades + new.cantidad
+        WHERE dia = (SELECT date(created_at, 'localtime') FROM pedidos WHERE id = new.pedido_id);
+        INSERT INTO ventas_categoria (categoria, unidades, ingresos_centavos)
+        VALUES (COALESCE((SELECT categoria FROM productos WHERE id = new.producto_id), 'Sin categoría'),
+                new.cantidad, new.cantidad * new.precio_unitario_centavos)
+        ON CONFLICT(categoria) DO UPDATE SET unidades = unidades + excluded.unidades,
+                                             ingresos_centavos = ingresos_centavos + excluded.ingresos_centavos;
+        INSERT INTO ventas_producto (producto_id, unidades, ingresos_centavos)
+        VALUES (new.producto_id, new.cantidad, new.cantidad * new.precio_unitario_centavos)
+        ON CONFLICT(producto_id) DO UPDATE SET unidades = unidades + excluded.unidades,
+                                               ingresos_centavos = ingresos_centavos + excluded.ingresos_centavos;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ventas_detalle_delete AFTER DELETE ON detalles_pedidos BEGIN
+        UPDATE ventas_diarias SET unidades = unidades - old.cantidad
+        WHERE dia = (SELECT date(created_at, 'localtime') FROM pedidos WHERE id = old.pedido_id);
+        UPDATE ventas_categoria
+        SET unidades = unidades - old.cantidad,
+            ingresos_centavos = ingresos_centavos - old.cantidad * old.precio_unitario_centavos
+        WHERE categoria = COALESCE((SELECT categoria FROM productos WHERE id = old.producto_id), 'Sin categoría');
+        UPDATE ventas_producto
+        SET unidades = unidades - old.cantidad,
+            ingresos_centavos = ingresos_centavos - old.cantidad * old.precio_unitario_centavos
+        WHERE producto_id = old.producto_id;
+    END
+    ''',
+    # Cambiar la categoría de un producto mueve sus ventas acumuladas a la nueva
+    '''
+    CREATE TRIGGER IF NOT EXISTS ventas_producto_categoria AFTER UPDATE OF categoria ON productos
+    WHEN old.categoria IS NOT new.categoria BEGIN
+        UPDATE ventas_categoria
+        SET unidades = unidades - (SELECT unidades FROM ventas_producto WHERE producto_id = old.id),
+            ingresos_centavos = ingresos_centavos - (SELECT ingresos_centavos FROM ventas_producto WHERE producto_id = old.id)
+        WHERE categoria = COALESCE(old.categoria, 'Sin categoría')
+          AND EXISTS (SELECT 1 FROM ventas_producto WHERE producto_id = old.id);
+        INSERT INTO ventas_categoria (categoria, unidades, ingresos_centavos)
+        SELECT COALESCE(new.categoria, 'Sin categoría'), unidades, ingresos_centavos
+        FROM ventas_producto WHERE producto_id = new.id
+        ON CONFLICT(categoria) DO UPDATE SET unidades = unidades + excluded.unidades,
+                                             ingresos_centavos = ingresos_centavos + excluded.ingresos_centavos;
+    END
+    ''',
+    # Las ventas de un producto borrado pasan a 'Sin categoría'
+    '''
+    CREATE TRIGGER IF NOT EXISTS ventas_producto_delete AFTER DELETE ON productos
+    WHEN old.categoria IS NOT NULL BEGIN
+        UPDATE ventas_categoria
+        SET unidades = unidades - (SELECT unidades FROM ventas_producto WHERE producto_id = old.id),
+            ingresos_centavos = ingresos_centavos - (SELECT ingresos_centavos FROM ventas_producto WHERE producto_id = old.id)
+        WHERE categoria = old.categoria
+          AND EXISTS (SELECT 1 FROM ventas_producto WHERE producto_id = old.id);
+        INSERT INTO ventas_categoria (categoria, unidades, ingresos_centavos)
+        SELECT 'Sin categoría', unidades, ingresos_centavos
+        FROM ventas_producto WHERE producto_id = old.id
+        ON CONFLICT(categoria) DO UPDATE SET unidades = unidades + excluded.unidades,
+                                             ingresos_centavos = ingresos_centavos + excluded.ingresos_centavos;
+    END
+    ''',
+)
+
+def _reconstruir_resumen_ventas(cursor):
+    """Recalcula las tablas de resumen de ventas desde pedidos y detalles_pedidos
+    
+    Las ventas se asignan a la categoría actual de cada producto, la misma regla
+    que siguen los triggers.
+    """
+    for tabla in ('ventas_diarias', 'ventas_categoria', 'ventas_producto'):
+        cursor.execute(f'DELETE FROM {tabla}')
+    cursor.execute('''
+        INSERT INTO ventas_diarias (dia, pedidos, unidades, ingresos_centavos)
+        SELECT date(p.created_at, 'localtime'), COUNT(*), COALESCE(SUM(d.unidades), 0), SUM(p.total_centavos)
+        FROM pedidos p
+        LEFT JOIN (SELECT pedido_id, SUM(cantidad) AS unidades FROM detalles_pedidos GROUP BY pedido_id) d
+            ON d.pedido_id = p.id
+        GROUP BY 1
+    ''')
+    cursor.execute('''
+        INSERT INTO ventas_categoria (categoria, unidades, ingresos_centavos)
+        SELECT COALESCE(pr.categoria, 'Sin categoría'), SUM(d.cantidad), SUM(d.cantidad * d.precio_unitario_centavos)
+        FROM detalles_pedidos d
+        LEFT JOIN productos pr ON pr.id = d.producto_id
+        GROUP BY 1
+    ''')
+    cursor.execute('''
+        INSERT INTO ventas_producto (producto_id, unidades, ingresos_centavos)
+        SELECT producto_id, SUM(cantidad), SUM(cantidad * precio_unitario_centavos)
+        FROM detalles_pedidos
+        GROUP BY producto_id
+    ''')
+
+def _migracion_resumen_ventas(cursor):
+    """Versión 9: resumen de ventas por día, categoría y producto, mantenido por triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            dia TEXT PRIMARY KEY,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            ingresos_centavos INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ventas_categoria (
+            categoria TEXT PRIMARY KEY,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            ingresos_centavos INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ventas_producto (
+            producto_id INTEGER PRIMARY KEY,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            ingresos_centavos INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Los más vendidos se leen recorriendo este índice desde el final, sin ordenar
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ventas_producto_ingresos ON ventas_producto(ingresos_centavos)')
+    for trigger in TRIGGERS_RESUMEN_VENTAS:
+        cursor.execute(trigger)
+    _reconstruir_resumen_ventas(cursor)
+
+def _encolar_pedidos(cursor, pedido_id=None):
+    """Agrega al outbox el pedido indicado, o todos los que nunca se encolaron
+    
+    Cada pedido se guarda como documento JSON (cabecera y líneas) con una clave de
+    idempotencia propia, para que el back office descarte los reenvíos.
+    """
+    if pedido_id is not None:
+        filtro, params = 'WHERE p.id = ?', (pedido_id,)
+    else:
+        filtro, params = 'WHERE p.id NOT IN (SELECT pedido_id FROM outbox_pedidos)', ()
+    filas = cursor.execute(f'''
+        SELECT p.id, p.total_centavos, p.estado, p.direccion, p.ubicacion_gps, p.created_at,
+               d.producto_id, pr.codigo_barras, d.cantidad, d.precio_unitario_centavos
+        FROM pedidos p
+        LEFT JOIN detalles_pedidos d ON d.pedido_id = p.id
+        LEFT JOIN productos pr ON pr.id = d.producto_id
+        {filtro}
+        ORDER BY p.id, d.id
+    ''', params)
+    
+    def documentos():
+        for numero, lineas in groupby(filas, key=lambda fila: fila[0]):
+            lineas = list(lineas)
+            _, total, estado, direccion, ubicacion, creado = lineas[0][:6]
+            documento = {
+                'pedido_id': numero, 'total_centavos': total, 'estado': estado, 'direccion': direccion,
+                'ubicacion_gps': ubicacion, 'created_at': creado,
+                'lineas': [
+                    {'producto_id': fila[6], 'codigo_barras': fila[7], 'cantidad': fila[8],
+                     'precio_unitario_centavos': fila[9]}
+                    for fila in lineas if fila[6] is not None
+                ],
+            }
+            yield numero, uuid.uuid4().hex, json.dumps(documento, ensure_ascii=False, separators=(',', ':'))
+    
+    # Otro cursor para insertar mientras se recorre la consulta
+    cursor.connection.executemany(
+        'INSERT INTO outbox_pedidos (pedido_id, clave_idempotencia, payload) VALUES (?, ?, ?)', documentos()
+    )
+
+def _migracion_outbox_pedidos(cursor):
+    """Versión 10: outbox de pedidos para sincronizar con el back office"""
+    # estado: 'pendiente' hasta que el servidor lo acepta ('enviado', sin payload) o lo rechaza ('rechazado')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox_pedidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pedido_id INTEGER NOT NULL UNIQUE,
+            clave_idempotencia TEXT NOT NULL UNIQUE,
+            payload TEXT,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            proximo_intento REAL NOT NULL DEFAULT 0,
+            ultimo_error TEXT,
+            enviado_at TIMESTAMP,
+            FOREIGN KEY (pedido_id) REFERENCES pedidos(id)
+        )
+    ''')
+    # Índice parcial: solo los pendientes, en el orden en que el sincronizador los toma
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_outbox_pendientes ON outbox_pedidos(proximo_intento, id)
+        WHERE estado = 'pendiente'
+    ''')
+    # Los pedidos anteriores tampoco llegaron nunca al back office
+    _encolar_pedidos(cursor)
+
+def _migracion_resumen_categoria_actual(cursor):
+    """Versión 11: el resumen por categoría sigue la categoría actual de cada producto"""
+    # El trigger de borrado de pedidos cambió: se recrea y se recalcula lo acumulado
+    cursor.execute('DROP TRIGGER IF EXISTS ventas_pedido_delete')
+    for trigger in TRIGGERS_RESUMEN_VENTAS:
+        cursor.execute(trigger)
+    _reconstruir_resumen_ventas(cursor)
+
+MIGRACIONES = [
+    _migracion_esquema_inicial,
+    _migracion_datos_ejemplo,
+    _migracion_indices,
+    _migracion_busqueda_fts,
+    _migracion_indice_listado,
+    _migracion_carrito_unico,
+    _migracion_tiendas,
+    _migracion_precios_en_centavos,
+    _migracion_resumen_ventas,
+    _migracion_outbox_pedidos,
+    _migracion_resumen_categoria_actual,
+]
+
+# Columnas que muestra la lista del catálogo (id, nombre, categoria, precio en centavos, stock)
+COLUMNAS_LISTADO = ('productos.id, productos.nombre, productos.categoria, productos.precio_centavos, '
+                    'productos.stock, productos.imagen_url')
+TAMANO_PAGINA = 50
+DIAS_RESUMEN_VENTAS = 30
+
+RADIO_TIERRA_KM = 6371
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180
+COLUMNAS_TIENDA = ('id', 'nombre', 'direccion', 'lat', 'lon', 'telefono', 'especialidad')
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia de círculo máximo entre dos puntos en km"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+def distancias_km(lat1, lon1, lats2, lons2):
+    """Distancias haversine de (lat1, lon1) a cada punto, en una sola pasada
+    
+    lat1/lon1 pueden ser escalares o secuencias del mismo largo que lats2/lons2
+    (distancias par a par). Con NumPy devuelve un ndarray calculado vectorizado;
+    sin NumPy, una lista con los mismos valores.
+    """
+    if importar_numpy() is not None:
+        lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lats2, lons2))
+        a = (np.sin((lat2 - lat1) / 2) ** 2 +
+             np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+        return 2 * RADIO_TIERRA_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    
+    if isinstance(lat1, (int, float)) and isinstance(lon1, (int, float)):
+        # Origen único: sus términos se calculan una vez fuera del bucle
+        rlat1, rlon1 = math.radians(lat1), math.radians(lon1)
+        cos_lat1 = math.cos(rlat1)
+        sin, cos, atan2, sqrt, radians = math.sin, math.cos, math.atan2, math.sqrt, math.radians
+        distancias = []
+        for lat2, lon2 in zip(lats2, lons2):
+            rlat2 = radians(lat2)
+            a = sin((rlat2 - rlat1) / 2) ** 2 + cos_lat1 * cos(rlat2) * sin((radians(lon2) - rlon1) / 2) ** 2
+            distancias.append(2 * RADIO_TIERRA_KM * atan2(sqrt(a), sqrt(1 - a)))
+        return distancias
+    return [haversine_km(*punto) for punto in zip(lat1, lon1, lats2, lons2)]
+
+def caja_de_radio(lat, lon, radio_km):
+    """Rectángulo (min_lat, max_lat, min_lon, max_lon) que contiene el círculo de radio dado
+    
+    Cerca de los polos (o si el radio es enorme) abarca todas las longitudes; no se
+    parte el rectángulo en el antimeridiano, las tiendas al otro lado de ±180° se pierden.
+    """
+    dlat = radio_km / KM_POR_GRADO
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+    if cos_lat <= 0 or radio_km / (KM_POR_GRADO * cos_lat) >= 180:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = radio_km / (KM_POR_GRADO * cos_lat)
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+def a_centavos(valor):
+    """Convierte un precio en pesos (texto, número o Decimal) a centavos enteros
+    
+    Redondea a la mitad hacia arriba sin pasar por float. Lanza ValueError si no es un número.
+    """
+    try:
+        return int(Decimal(str(valor).strip()).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP).scaleb(2))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'precio inválido: {valor!r}') from None
+
+def pesos_texto(centavos):
+    """Centavos como texto decimal en pesos ('1234.56'), para archivos de intercambio"""
+    signo = '-' if centavos < 0 else ''
+    pesos, resto = divmod(abs(centavos), 100)
+    return f'{signo}{pesos}.{resto:02d}'
+
+def formatear_precio(centavos):
+    """Centavos con formato de moneda para la interfaz ('$1,234.56')"""
+    signo = '-' if centavos < 0 else ''
+    pesos, resto = divmod(abs(centavos), 100)
+    return f'{signo}${pesos:,}.{resto:02d}'
+
+def fts_query(texto):
+    """Convierte texto libre en una consulta FTS5 de prefijos (todas las palabras)"""
+    palabras = re.findall(r'\w+', texto)
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+class SchemaMigrator:
+    """Aplica solo las migraciones pendientes según PRAGMA user_version"""
+    def __init__(self, migraciones=MIGRACIONES):
+        self.migraciones = migraciones
+    
+    def version_actual(self, conn):
+        """Devuelve la versión del esquema guardada en la base de datos"""
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    def migrate(self, conn):
+        """Lleva la base de datos a la última versión; devuelve los pasos aplicados"""
+        aplicadas = 0
+        for version, migracion in enumerate(self.migraciones, start=1):
+            if version <= self.version_actual(conn):
+                continue
+            # Cada paso es atómico y se revalida la versión con el lock de escritura tomado
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if version > self.version_actual(conn):
+                    migracion(conn.cursor())
+                    conn.execute(f'PRAGMA user_version = {version}')
+                    aplicadas += 1
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return aplicadas
+
+# Inserta o suma la cantidad en una sola sentencia; el precio se toma de productos
+SQL_AGREGAR_AL_CARRITO = '''
+    INSERT INTO carrito (producto_id, cantidad, precio_unitario_centavos)
+    SELECT id, ?, precio_centavos FROM productos WHERE id = ?
+    ON CONFLICT(producto_id) DO UPDATE SET cantidad = cantidad + excluded.cantidad
+'''
+
+# Una línea del carrito con la forma de get_carrito:
+# (id, nombre, cantidad, precio_unitario_centavos, subtotal_centavos, producto_id)
+SQL_LINEA_CARRITO = '''
+    SELECT c.id, p.nombre, c.cantidad, c.precio_unitario_centavos, c.cantidad * c.precio_unitario_centavos, p.id
+    FROM carrito c
+    JOIN productos p ON c.producto_id = p.id
+    WHERE c.producto_id = ?
+'''
+
+# Importación y exportación del catálogo: columnas de los archivos, en este orden
+COLUMNAS_CATALOGO = ('codigo_barras', 'nombre', 'categoria', 'precio', 'descripcion', 'stock', 'imagen_url')
+# Las mismas columnas en productos: en los archivos el precio va en pesos, en la base en centavos
+COLUMNAS_PRODUCTO_CATALOGO = tuple('precio_centavos' if c == 'precio' else c for c in COLUMNAS_CATALOGO)
+INDICE_PRECIO_CATALOGO = COLUMNAS_CATALOGO.index('precio')
+
+# Inserta o actualiza por código de barras; las filas sin cambios no se reescriben
+SQL_UPSERT_PRODUCTO = f'''
+    INSERT INTO productos ({', '.join(COLUMNAS_PRODUCTO_CATALOGO)})
+    VALUES ({', '.join('?' * len(COLUMNAS_PRODUCTO_CATALOGO))})
+    ON CONFLICT(codigo_barras) DO UPDATE SET
+        {', '.join(f'{c} = excluded.{c}' for c in COLUMNAS_PRODUCTO_CATALOGO[1:])}
+    WHERE ({', '.join(COLUMNAS_PRODUCTO_CATALOGO[1:])})
+        IS NOT ({', '.join(f'excluded.{c}' for c in COLUMNAS_PRODUCTO_CATALOGO[1:])})
+'''
+
+def normalizar_producto(registro):
+    """Convierte un registro del archivo (dict de texto o JSON) en la tupla de COLUMNAS_PRODUCTO_CATALOGO
+    
+    El precio pasa de pesos a centavos. Lanza ValueError si falta un campo obligatorio
+    o el precio/stock no es numérico.
+    """
+    codigo = str(registro.get('codigo_barras') or '').strip()
+    nombre = str(registro.get('nombre') or '').strip()
+    categoria = str(registro.get('categoria') or '').strip()
+    if not codigo or not nombre or not categoria:
+        raise ValueError('faltan codigo_barras, nombre o categoria')
+    precio = a_centavos(registro.get('precio'))
+    stock = registro.get('stock')
+    return (codigo, nombre, categoria, precio, registro.get('descripcion') or None,
+            int(stock) if stock not in (None, '') else 0, registro.get('imagen_url') or None)
+
+class ErroresImportacion:
+    """Cuenta las filas rechazadas y guarda solo las primeras (memoria acotada en feeds muy malos)"""
+    def __init__(self, maximo=20):
+        self.maximo = maximo
+        self.total = 0
+        self.primeros = []
+    
+    def append(self, error):
+        self.total += 1
+        if len(self.primeros) < self.maximo:
+            self.primeros.append(error)
+
+def leer_catalogo(ruta, errores=None):
+    """Genera los productos de un archivo CSV (con encabezado) o JSONL, fila a fila
+    
+    Las filas inválidas se saltan; si se pasa una lista o un ErroresImportacion,
+    se anotan en errores como (número de línea, motivo).
+    """
+    with open(ruta, newline='', encoding='utf-8') as f:
+        jsonl = ruta.endswith('.jsonl')
+        registros = f if jsonl else csv.DictReader(f)
+        for numero, registro in enumerate(registros, 1 if jsonl else 2):  # El CSV empieza tras el encabezado
+            if jsonl and not registro.strip():
+                continue
+            try:
+                yield normalizar_producto(json.loads(registro) if jsonl else registro)
+            except (ValueError, TypeError, AttributeError) as e:
+                if errores is not None:
+                    errores.append((numero, str(e)))
+
+def en_bloques(filas, tamano):
+    """Agrupa un iterable en listas de hasta tamano elementos sin materializarlo"""
+    iterador = iter(filas)
+    while True:
+        bloque = list(islice(iterador, tamano))
+        if not bloque:
+            return
+        yield bloque
+
+class StockInsuficienteError(Exception):
+    """El carrito pide más unidades de las que hay en stock"""
+    def __init__(self, productos):
+        super().__init__(f"Stock insuficiente para: {', '.join(productos)}")
+        self.productos = productos
 
 # Configuración de la base de datos
 class DatabaseManager:
-    def __init__(self):
+    _shared = {}
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, db_path=DB_PATH, pool=None, migrator=None, cache=None):
+        self.db_path = db_path
+        self.pool = pool or ConnectionPool.shared(db_path)
+        self.migrator = migrator or SchemaMigrator()
+        self.cache = cache or ProductCache()
+        self._invalidacion = None
+        if self.cache.max_entradas > 0:
+            # Un sumidero por pool que reparte a todas las cachés de los DatabaseManager del pool
+            self._invalidacion = InvalidacionProductos.del_pool(self.pool)
+            self._invalidacion.suscribir(self.cache)
         self.init_database()
+        if self._invalidacion is not None:
+            # Con las tablas ya creadas; otro DatabaseManager del pool registra el mismo sumidero
+            self.pool.on_connect['cache_productos'] = self._invalidacion.registrar
+            self.pool.on_commit['cache_productos'] = self._invalidacion.aplicar
+    
+    @classmethod
+    def shared(cls, db_path=DB_PATH):
+        """Devuelve el DatabaseManager único del proceso para una ruta"""
+        with cls._shared_lock:
+            db = cls._shared.get(db_path)
+            if db is None:
+                db = cls._shared[db_path] = cls(db_path)
+            return db
     
     def init_database(self):
-        """Inicializa las tablas de la base de datos y fuerza la reinicialización si es necesario"""
-        db_path = 'computer_store.db'
-        if os.path.exists(db_path):
-            # Opcional: Forzar reinicialización eliminando la base de datos existente
-            os.remove(db_path)
+        """Inicializa la base de datos aplicando las migraciones pendientes"""
+        with self.pool.connection() as conn:
+            aplicadas = self.migrator.migrate(conn)
+            self.fts_disponible = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'productos_fts'"
+            ).fetchone() is not None
+            self.rtree_disponible = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'tiendas_rtree'"
+            ).fetchone() is not None
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_productos_listado'").fetchone() is None:
+                # Una importación se interrumpió antes de restaurar índices y triggers
+                self._restaurar_indices_catalogo()
+            # Las tablas ya existen: registrar la invalidación de caché en esta conexión (las próximas la
+            # registran en on_connect)
+            if self._invalidacion is not None:
+                self._invalidacion.registrar(conn)
+        self.cache.limpiar()
+        return aplicadas
+    
+    def get_productos(self, categoria=None, busqueda=None):
+        """Obtiene productos con filtros opcionales (cacheado)"""
+        return list(self.cache.obtener(
+            ('productos', categoria, busqueda),
+            etiquetas_listado(categoria),
+            lambda: self._get_productos(categoria, busqueda)
+        ))
+    
+    def _get_productos(self, categoria=None, busqueda=None):
+        """Consulta productos con filtros opcionales"""
+        if busqueda and self.fts_disponible and fts_query(busqueda):
+            return self.buscar_productos(busqueda, categoria)
         
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        query = 'SELECT * FROM productos WHERE 1=1'
+        params = []
         
-        # Tabla productos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS productos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                categoria TEXT NOT NULL,
-                precio REAL NOT NULL,
-                descripcion TEXT,
-                stock INTEGER DEFAULT 0,
-                codigo_barras TEXT,
-                imagen_url TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        if categoria and categoria != 'Todos':
+            query += ' AND categoria = ?'
+            params.append(categoria)
         
-        # Tabla carrito
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS carrito (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                producto_id INTEGER,
-                cantidad INTEGER DEFAULT 1,
-                precio_unitario REAL,
-                FOREIGN KEY (producto_id) REFERENCES productos(id)
+        if busqueda:
+            query += ' AND (nombre LIKE ? OR descripcion LIKE ?)'
+            params.extend([f'%{busqueda}%', f'%{busqueda}%'])
+        
+        with self.pool.connection() as conn:
+            return conn.execute(query, params).fetchall()
+    
+    def buscar_productos(self, busqueda, categoria=None, columnas='productos.*', limite=-1, desplazamiento=0):
+        """Búsqueda de texto completo por prefijos, ordenada por relevancia (bm25)"""
+        # El nombre pesa más que la categoría y esta más que la descripción
+        query = f'''
+            SELECT {columnas} FROM productos_fts
+            JOIN productos ON productos.id = productos_fts.rowid
+            WHERE productos_fts MATCH ?
+        '''
+        params = [fts_query(busqueda)]
+        
+        if categoria and categoria != 'Todos':
+            query += ' AND productos.categoria = ?'
+            params.append(categoria)
+        
+        query += ' ORDER BY bm25(productos_fts, 10.0, 2.0, 1.0), productos.id LIMIT ? OFFSET ?'
+        params.extend([limite, desplazamiento])
+        
+        with self.pool.connection() as conn:
+            return conn.execute(query, params).fetchall()
+    
+    def get_productos_pagina(self, categoria=None, busqueda=None, cursor=None, limite=TAMANO_PAGINA):
+        """Obtiene una página del catálogo y el cursor de la siguiente (cacheado)"""
+        filas, siguiente = self.cache.obtener(
+            ('pagina', categoria, busqueda, cursor, limite),
+            etiquetas_listado(categoria),
+            lambda: self._get_productos_pagina(categoria, busqueda, cursor, limite)
+        )
+        return list(filas), siguiente
+    
+    def _get_productos_pagina(self, categoria=None, busqueda=None, cursor=None, limite=TAMANO_PAGINA):
+        """Consulta una página del catálogo y el cursor de la siguiente (None al final)
+        
+        Sin búsqueda se pagina por keyset sobre (categoria, nombre, id). Con búsqueda
+        FTS el orden es por relevancia, que no admite keyset, y el cursor es un desplazamiento.
+        """
+        if busqueda and self.fts_disponible and fts_query(busqueda):
+            desplazamiento = cursor or 0
+            filas = self.buscar_productos(busqueda, categoria, COLUMNAS_LISTADO, limite, desplazamiento)
+            siguiente = desplazamiento + limite if len(filas) == limite else None
+            return filas, siguiente
+        
+        query = f'SELECT {COLUMNAS_LISTADO} FROM productos WHERE 1=1'
+        params = []
+        
+        if categoria and categoria != 'Todos':
+            query += ' AND categoria = ?'
+            params.append(categoria)
+            if cursor:
+                query += ' AND (nombre, id) > (?, ?)'
+                params.extend(cursor[1:])
+        elif cursor:
+            query += ' AND (categoria, nombre, id) > (?, ?, ?)'
+            params.extend(cursor)
+        
+        if busqueda:
+            query += ' AND (nombre LIKE ? OR descripcion LIKE ?)'
+            params.extend([f'%{busqueda}%', f'%{busqueda}%'])
+        
+        query += ' ORDER BY categoria, nombre, id LIMIT ?'
+        params.append(limite)
+        
+        with self.pool.connection() as conn:
+            filas = conn.execute(query, params).fetchall()
+        
+        siguiente = None
+        if len(filas) == limite:
+            ultima = filas[-1]
+            siguiente = (ultima[2], ultima[1], ultima[0])
+        return filas, siguiente
+    
+    def get_producto_por_codigo(self, codigo):
+        """Busca producto por código de barras (cacheado)"""
+        return self.cache.obtener(
+            ('codigo', codigo),
+            (f'codigo:{codigo}',),
+            lambda: self._get_producto_por_codigo(codigo)
+        )
+    
+    def _get_producto_por_codigo(self, codigo):
+        """Consulta un producto por código de barras"""
+        with self.pool.connection() as conn:
+            cursor = conn.execute('SELECT * FROM productos WHERE codigo_barras = ?', (codigo,))
+            return cursor.fetchone()
+    
+    def get_productos_por_codigos(self, codigos):
+        """Resuelve varios códigos de barras con una consulta IN por bloque; devuelve {codigo: fila}"""
+        codigos = list(codigos)
+        encontrados = {}
+        with self.pool.connection() as conn:
+            # Bloques por debajo del límite de parámetros de SQLite en versiones antiguas (999)
+            for i in range(0, len(codigos), 500):
+                bloque = codigos[i:i + 500]
+                marcadores = ','.join('?' * len(bloque))
+                for fila in conn.execute(
+                    f'SELECT * FROM productos WHERE codigo_barras IN ({marcadores})', bloque
+                ):
+                    encontrados[fila[6]] = fila
+        return encontrados
+    
+    def importar_catalogo(self, ruta, tamano_bloque=5000, bloques_por_transaccion=10, on_progreso=None):
+        """Importa un CSV o JSONL de productos haciendo upsert por codigo_barras
+        
+        El archivo se lee por bloques (memoria constante) y cada transacción confirma
+        bloques_por_transaccion bloques de executemany. Mientras dura, el índice del
+        listado, los triggers del FTS y los de invalidación de caché se desactivan; al
+        terminar se reconstruyen una sola vez. on_progreso(filas) se llama tras cada commit.
+        Devuelve un resumen con filas leídas, insertadas, actualizadas, sin cambios,
+        rechazadas (con las primeras 20 como errores) y filas por segundo.
+        """
+        inicio = time.perf_counter()
+        errores = ErroresImportacion()
+        filas = cambios = 0
+        with self.pool.connection() as conn:
+            antes = conn.execute('SELECT COUNT(*) FROM productos').fetchone()[0]
+        self._desactivar_indices_catalogo()
+        try:
+            bloques = en_bloques(leer_catalogo(ruta, errores), tamano_bloque)
+            pendientes = True
+            while pendientes:
+                # Los bloques se leen dentro de la transacción: en memoria solo hay uno
+                with self.pool.transaction() as conn:
+                    procesados = 0
+                    for bloque in islice(bloques, bloques_por_transaccion):
+                        # rowcount cuenta solo las filas del upsert; total_changes sumaría
+                        # las que escriben los triggers (p. ej. el resumen de ventas)
+                        cambios += conn.executemany(SQL_UPSERT_PRODUCTO, bloque).rowcount
+                        filas += len(bloque)
+                        procesados += 1
+                    pendientes = procesados == bloques_por_transaccion
+                self.cache.limpiar()
+                if on_progreso is not None:
+                    on_progreso(filas)
+        finally:
+            self._restaurar_indices_catalogo()
+            self.cache.limpiar()
+        with self.pool.connection() as conn:
+            insertadas = conn.execute('SELECT COUNT(*) FROM productos').fetchone()[0] - antes
+        segundos = time.perf_counter() - inicio
+        return {
+            'filas': filas,
+            'insertadas': insertadas,
+            'actualizadas': cambios - insertadas,
+            'sin_cambios': filas - cambios,
+            'rechazadas': errores.total,
+            'errores': errores.primeros,
+            'segundos': segundos,
+            'filas_por_segundo': filas / segundos if segundos else 0.0,
+        }
+    
+    def _desactivar_indices_catalogo(self):
+        """Quita el mantenimiento por fila de productos (el índice único por código se queda)"""
+        with self.pool.transaction() as conn:
+            conn.execute('DROP INDEX IF EXISTS idx_productos_listado')
+            for trigger in ('insert', 'delete', 'update'):
+                conn.execute(f'DROP TRIGGER IF EXISTS productos_fts_{trigger}')
+                conn.execute(f'DROP TRIGGER IF EXISTS temp.cache_productos_{trigger}')
+    
+    def _restaurar_indices_catalogo(self):
+        """Recrea el índice del listado y los triggers y reconstruye el FTS (idempotente)"""
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            _migracion_indice_listado(cursor)
+            if self.fts_disponible:
+                _migracion_busqueda_fts(cursor)  # Recrea los triggers y hace 'rebuild'
+            if self._invalidacion is not None:
+                # La función ya está registrada en la conexión; solo faltan sus triggers TEMP
+                self._invalidacion.crear_triggers(conn)
+    
+    def exportar_catalogo(self, ruta, tamano_bloque=5000):
+        """Escribe el catálogo en CSV o JSONL (según la extensión) leyendo por bloques
+        
+        El archivo se escribe en un temporal y se renombra al terminar. Devuelve las filas escritas.
+        """
+        temporal = f'{ruta}.tmp'
+        filas = 0
+        with self.pool.connection() as conn, open(temporal, 'w', newline='', encoding='utf-8') as f:
+            cursor = conn.execute(f'SELECT {", ".join(COLUMNAS_PRODUCTO_CATALOGO)} FROM productos ORDER BY id')
+            if ruta.endswith('.jsonl'):
+                # centavos / 100 es el float más cercano: json lo escribe con sus dos decimales exactos
+                def escribir(fila):
+                    registro = dict(zip(COLUMNAS_CATALOGO, fila))
+                    registro['precio'] = fila[INDICE_PRECIO_CATALOGO] / 100
+                    f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            else:
+                escritor = csv.writer(f)
+                escritor.writerow(COLUMNAS_CATALOGO)
+                
+                def escribir(fila):
+                    fila = list(fila)
+                    fila[INDICE_PRECIO_CATALOGO] = pesos_texto(fila[INDICE_PRECIO_CATALOGO])
+                    escritor.writerow(fila)
+            while True:
+                bloque = cursor.fetchmany(tamano_bloque)
+                if not bloque:
+                    break
+                for fila in bloque:
+                    escribir(fila)
+                filas += len(bloque)
+        os.replace(temporal, ruta)
+        return filas
+    
+    def agregar_al_carrito(self, producto_id, cantidad=1):
+        """Agrega producto al carrito y devuelve la línea resultante (None si el producto no existe)"""
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_AGREGAR_AL_CARRITO, (cantidad, producto_id))
+            return conn.execute(SQL_LINEA_CARRITO, (producto_id,)).fetchone()
+    
+    def agregar_lote_al_carrito(self, items):
+        """Agrega varios pares (producto_id, cantidad) al carrito en una transacción"""
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                SQL_AGREGAR_AL_CARRITO,
+                ((cantidad, producto_id) for producto_id, cantidad in items)
             )
-        ''')
+    
+    def get_carrito(self):
+        """Obtiene items del carrito con información del producto"""
+        with self.pool.connection() as conn:
+            cursor = conn.execute('''
+                SELECT c.id, p.nombre, c.cantidad, c.precio_unitario_centavos,
+                       (c.cantidad * c.precio_unitario_centavos) as subtotal_centavos, p.id as producto_id
+                FROM carrito c
+                JOIN productos p ON c.producto_id = p.id
+                ORDER BY c.id
+            ''')
+            return cursor.fetchall()
+    
+    def get_total_carrito(self):
+        """Devuelve (líneas, unidades, total en centavos) del carrito en una sola consulta agregada"""
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(cantidad), 0), COALESCE(SUM(cantidad * precio_unitario_centavos), 0)
+                FROM carrito
+            ''').fetchone()
+    
+    def actualizar_cantidad_carrito(self, producto_id, cantidad):
+        """Fija la cantidad de un producto del carrito (0 lo elimina); devuelve la línea o None"""
+        with self.pool.transaction() as conn:
+            if cantidad <= 0:
+                conn.execute('DELETE FROM carrito WHERE producto_id = ?', (producto_id,))
+                return None
+            conn.execute('UPDATE carrito SET cantidad = ? WHERE producto_id = ?', (cantidad, producto_id))
+            return conn.execute(SQL_LINEA_CARRITO, (producto_id,)).fetchone()
+    
+    def eliminar_del_carrito(self, item_id):
+        """Elimina un item del carrito"""
+        with self.pool.transaction() as conn:
+            conn.execute('DELETE FROM carrito WHERE id = ?', (item_id,))
+    
+    def eliminar_producto_del_carrito(self, producto_id):
+        """Elimina la línea de un producto del carrito"""
+        with self.pool.transaction() as conn:
+            conn.execute('DELETE FROM carrito WHERE producto_id = ?', (producto_id,))
+    
+    def limpiar_carrito(self):
+        """Limpia el carrito de compras"""
+        with self.pool.transaction() as conn:
+            conn.execute('DELETE FROM carrito')
+    
+    def crear_pedido(self, direccion, ubicacion_gps):
+        """Convierte el carrito en un pedido, descuenta stock y vacía el carrito
         
-        # Tabla pedidos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS pedidos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                total REAL NOT NULL,
-                estado TEXT DEFAULT 'pendiente',
-                direccion TEXT,
-                ubicacion_gps TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        Todo ocurre en una sola transacción BEGIN IMMEDIATE, que también encola el pedido
+        en el outbox. Devuelve (pedido_id, total en centavos),
+        None si el carrito está vacío, o lanza StockInsuficienteError sin modificar nada.
+        """
+        with self.pool.transaction(immediate=True) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT COUNT(DISTINCT c.producto_id), SUM(c.cantidad * c.precio_unitario_centavos)
+                FROM carrito c
+                JOIN productos p ON c.producto_id = p.id
+            ''')
+            productos_distintos, total = cursor.fetchone()
+            if productos_distintos == 0:
+                return None
+            
+            # Con el lock de escritura tomado, verificar y descontar stock no puede intercalarse
+            cursor.execute('''
+                SELECT p.nombre
+                FROM (SELECT producto_id, SUM(cantidad) AS cantidad FROM carrito GROUP BY producto_id) c
+                JOIN productos p ON p.id = c.producto_id
+                WHERE p.stock < c.cantidad
+            ''')
+            faltantes = [fila[0] for fila in cursor.fetchall()]
+            if faltantes:
+                raise StockInsuficienteError(faltantes)
+            
+            cursor.execute('''
+                UPDATE productos
+                SET stock = stock - (SELECT SUM(cantidad) FROM carrito WHERE producto_id = productos.id)
+                WHERE id IN (SELECT producto_id FROM carrito)
+            ''')
+            
+            # Crear pedido
+            cursor.execute('''
+                INSERT INTO pedidos (total_centavos, direccion, ubicacion_gps)
+                VALUES (?, ?, ?)
+            ''', (total, direccion, ubicacion_gps))
+            
+            pedido_id = cursor.lastrowid
+            
+            # Agregar detalles del pedido en una sola sentencia
+            cursor.execute('''
+                INSERT INTO detalles_pedidos (pedido_id, producto_id, cantidad, precio_unitario_centavos)
+                SELECT ?, c.producto_id, c.cantidad, c.precio_unitario_centavos
+                FROM carrito c
+                JOIN productos p ON c.producto_id = p.id
+            ''', (pedido_id,))
+            
+            # En la misma transacción: el pedido no puede quedar sin encolar para el back office
+            _encolar_pedidos(cursor, pedido_id)
+            
+            cursor.execute('DELETE FROM carrito')
+        
+        return pedido_id, total
+    
+    def get_pedidos_pagina(self, cursor=None, limite=TAMANO_PAGINA):
+        """Una página del historial, del pedido más reciente al más antiguo, y el cursor de la siguiente
+        
+        Filas (id, fecha local, estado, total_centavos, unidades). El cursor es el último
+        id mostrado (keyset), así que cada página cuesta lo mismo sin importar su profundidad.
+        """
+        query = '''
+            SELECT p.id, datetime(p.created_at, 'localtime'), p.estado, p.total_centavos,
+                   (SELECT COALESCE(SUM(d.cantidad), 0) FROM detalles_pedidos d WHERE d.pedido_id = p.id)
+            FROM pedidos p
+        '''
+        params = []
+        if cursor is not None:
+            query += ' WHERE p.id < ?'
+            params.append(cursor)
+        query += ' ORDER BY p.id DESC LIMIT ?'
+        params.append(limite)
+        with self.pool.connection() as conn:
+            filas = conn.execute(query, params).fetchall()
+        siguiente = filas[-1][0] if len(filas) == limite else None
+        return filas, siguiente
+    
+    def get_detalle_pedido(self, pedido_id):
+        """Líneas de un pedido: (nombre, cantidad, precio_unitario_centavos, subtotal_centavos)"""
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT COALESCE(p.nombre, '(producto eliminado)'), d.cantidad, d.precio_unitario_centavos,
+                       d.cantidad * d.precio_unitario_centavos
+                FROM detalles_pedidos d
+                LEFT JOIN productos p ON p.id = d.producto_id
+                WHERE d.pedido_id = ?
+                ORDER BY d.id
+            ''', (pedido_id,)).fetchall()
+    
+    def get_resumen_ventas(self, dias=DIAS_RESUMEN_VENTAS, mas_vendidos=5):
+        """Lee el tablero de ventas de las tablas de resumen (sin agrupar los detalles)
+        
+        Devuelve un dict con 'dias' [(dia, pedidos, unidades, ingresos_centavos)] de los
+        últimos dias días, 'categorias' [(categoria, unidades, ingresos_centavos)] y
+        'mas_vendidos' [(producto_id, nombre, unidades, ingresos_centavos)] históricos.
+        """
+        with self.pool.connection() as conn:
+            # BEGIN diferido explícito: en modo legacy los SELECT no abren transacción y
+            # las tres lecturas podrían ver estados distintos. Dentro de una transacción
+            # del hilo ya comparten su instantánea.
+            propia = not conn.in_transaction
+            if propia:
+                conn.execute('BEGIN')
+            try:
+                return {
+                    'dias': conn.execute('''
+                        SELECT dia, pedidos, unidades, ingresos_centavos FROM ventas_diarias
+                        WHERE dia >= date('now', 'localtime', ?) AND pedidos > 0
+                        ORDER BY dia DESC
+                    ''', (f'-{dias - 1} days',)).fetchall(),
+                    'categorias': conn.execute('''
+                        SELECT categoria, unidades, ingresos_centavos FROM ventas_categoria
+                        WHERE unidades > 0
+                        ORDER BY ingresos_centavos DESC
+                    ''').fetchall(),
+                    'mas_vendidos': conn.execute('''
+                        SELECT v.producto_id, COALESCE(p.nombre, '(producto eliminado)'), v.unidades, v.ingresos_centavos
+                        FROM ventas_producto v
+                        LEFT JOIN productos p ON p.id = v.producto_id
+                        WHERE v.unidades > 0
+                        ORDER BY v.ingresos_centavos DESC
+                        LIMIT ?
+                    ''', (mas_vendidos,)).fetchall(),
+                }
+            finally:
+                if propia:
+                    conn.execute('COMMIT')
+    
+    def reconstruir_resumen_ventas(self):
+        """Recalcula el resumen de ventas desde cero (tras editar pedidos a mano o restaurar un respaldo)
+        
+        Devuelve cuántas filas quedaron en ventas_diarias, ventas_categoria y ventas_producto.
+        """
+        with self.pool.transaction(immediate=True) as conn:
+            _reconstruir_resumen_ventas(conn.cursor())
+            return {
+                tabla: conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+                for tabla in ('ventas_diarias', 'ventas_categoria', 'ventas_producto')
+            }
+    
+    def encolar_pedidos_sin_enviar(self):
+        """Encola los pedidos que no están en el outbox (p. ej. tras restaurar un respaldo); devuelve cuántos"""
+        with self.pool.transaction() as conn:
+            antes = conn.total_changes
+            _encolar_pedidos(conn.cursor())
+            return conn.total_changes - antes
+    
+    def get_outbox_pendiente(self, limite, ahora=None):
+        """Pedidos del outbox listos para enviarse: [(id, clave_idempotencia, payload, intentos)]"""
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT id, clave_idempotencia, payload, intentos FROM outbox_pedidos
+                WHERE estado = 'pendiente' AND proximo_intento <= ?
+                ORDER BY proximo_intento, id
+                LIMIT ?
+            ''', (time.time() if ahora is None else ahora, limite)).fetchall()
+    
+    def proximo_envio_outbox(self):
+        """Momento (time.time()) del próximo pendiente, o None si el outbox está al día"""
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT MIN(proximo_intento) FROM outbox_pedidos WHERE estado = 'pendiente'"
+            ).fetchone()[0]
+    
+    def confirmar_outbox(self, ids):
+        """Marca como enviados los pedidos que el servidor aceptó (el payload ya no hace falta)"""
+        with self.pool.transaction() as conn:
+            conn.executemany('''
+                UPDATE outbox_pedidos SET estado = 'enviado', payload = NULL, enviado_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', ((outbox_id,) for outbox_id in ids))
+    
+    def reprogramar_outbox(self, reintentos, error):
+        """Suma un intento y fija el próximo a cada (id, proximo_intento)"""
+        with self.pool.transaction() as conn:
+            conn.executemany('''
+                UPDATE outbox_pedidos SET intentos = intentos + 1, proximo_intento = ?, ultimo_error = ?
+                WHERE id = ?
+            ''', ((proximo, error, outbox_id) for outbox_id, proximo in reintentos))
+    
+    def rechazar_outbox(self, ids, error):
+        """Saca de la cola los pedidos que el servidor rechaza sin posibilidad de reintento"""
+        with self.pool.transaction() as conn:
+            conn.executemany('''
+                UPDATE outbox_pedidos SET estado = 'rechazado', intentos = intentos + 1, ultimo_error = ?
+                WHERE id = ?
+            ''', ((error, outbox_id) for outbox_id in ids))
+    
+    def estado_outbox(self):
+        """Cantidad de pedidos del outbox por estado"""
+        with self.pool.connection() as conn:
+            return dict(conn.execute('SELECT estado, COUNT(*) FROM outbox_pedidos GROUP BY estado').fetchall())
+    
+    def _candidatos_tiendas(self, conn, caja):
+        """Tiendas dentro del rectángulo (min_lat, max_lat, min_lon, max_lon) según el índice espacial"""
+        columnas = ', '.join(f'tiendas.{c}' for c in COLUMNAS_TIENDA)
+        if self.rtree_disponible:
+            return conn.execute(f'''
+                SELECT {columnas} FROM tiendas_rtree
+                JOIN tiendas ON tiendas.id = tiendas_rtree.id
+                WHERE tiendas_rtree.max_lat >= ? AND tiendas_rtree.min_lat <= ?
+                  AND tiendas_rtree.max_lon >= ? AND tiendas_rtree.min_lon <= ?
+            ''', caja)
+        return conn.execute(
+            f'SELECT {columnas} FROM tiendas WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?', caja
+        )
+    
+    def get_tiendas_en_radio(self, lat, lon, radio_km, limite=None):
+        """Tiendas a menos de radio_km, ordenadas por distancia (dicts con 'distancia' en km)
+        
+        El índice espacial devuelve los candidatos del rectángulo que contiene el
+        círculo; la distancia exacta solo se calcula para esos candidatos.
+        """
+        with self.pool.connection() as conn:
+            filas = self._candidatos_tiendas(conn, caja_de_radio(lat, lon, radio_km)).fetchall()
+        distancias = distancias_km(lat, lon, [fila[3] for fila in filas], [fila[4] for fila in filas])
+        tiendas = []
+        for fila, distancia in zip(filas, distancias):
+            if distancia <= radio_km:
+                tienda = dict(zip(COLUMNAS_TIENDA, fila))
+                tienda['distancia'] = float(distancia)
+                tiendas.append(tienda)
+        tiendas.sort(key=lambda t: (t['distancia'], t['id']))
+        return tiendas[:limite] if limite is not None else tiendas
+    
+    def get_tiendas_cercanas(self, lat, lon, k=10, radio_inicial_km=2.0):
+        """Las k tiendas más cercanas, ampliando el radio de búsqueda hasta reunir k
+        
+        Con k tiendas dentro del círculo el resultado es exacto: cualquier tienda
+        fuera de él está más lejos que todas las de dentro.
+        """
+        radio = radio_inicial_km
+        while True:
+            tiendas = self.get_tiendas_en_radio(lat, lon, radio, limite=k)
+            # Media circunferencia terrestre cubre todo el planeta
+            if len(tiendas) >= k or radio >= math.pi * RADIO_TIERRA_KM:
+                return tiendas
+            radio *= 4
+
+# Ubicación por defecto mientras no hay ninguna lectura del GPS (Cartagena)
+UBICACION_POR_DEFECTO = (10.4236, -75.5378)
+
+class FiltroKalmanPosicion:
+    """Suavizado de lat/lon con un filtro de Kalman de varianza escalar
+    
+    La precisión que reporta el GPS (en metros) es el ruido de la medición; la
+    incertidumbre de la posición crece con el tiempo según la velocidad esperada.
+    """
+    def __init__(self, velocidad=3.0):
+        self.velocidad = velocidad  # m/s, ruido del proceso
+        self.reiniciar()
+    
+    def reiniciar(self):
+        self.lat = self.lon = None
+        self.varianza = None  # m²
+        self.t = None
+    
+    def actualizar(self, t, lat, lon, precision):
+        """Incorpora una lectura y devuelve (lat, lon, precision) suavizados"""
+        precision = max(precision, 1.0)
+        if self.varianza is None:
+            self.lat, self.lon, self.varianza, self.t = lat, lon, precision ** 2, t
+        else:
+            if t > self.t:
+                self.varianza += (t - self.t) * self.velocidad ** 2
+                self.t = t
+            ganancia = self.varianza / (self.varianza + precision ** 2)
+            self.lat += ganancia * (lat - self.lat)
+            self.lon += ganancia * (lon - self.lon)
+            self.varianza *= 1 - ganancia
+        return self.lat, self.lon, self.varianza ** 0.5
+
+class GPSTrack:
+    """Recorrido de lecturas (t, lat, lon, precision) que sustituye al GPS en pruebas"""
+    def __init__(self, puntos):
+        self.puntos = puntos
+        self._pendientes = deque()
+        self._evento = None
+    
+    @classmethod
+    def cargar(cls, ruta):
+        """Lee un CSV con columnas t,lat,lon,precision (la cabecera es opcional)"""
+        puntos = []
+        with open(ruta) as f:
+            for linea in f:
+                try:
+                    puntos.append(tuple(float(c) for c in linea.strip().split(',')[:4]))
+                except ValueError:
+                    continue  # Cabecera o línea vacía
+        return cls(puntos)
+    
+    def start(self, on_location):
+        """Entrega las lecturas con el Clock respetando sus tiempos relativos"""
+        self.stop()
+        self._on_location = on_location
+        self._pendientes = deque(self.puntos)
+        self._inicio = time.time() - (self.puntos[0][0] if self.puntos else 0.0)
+        self._evento = Clock.schedule_once(self._entregar)
+    
+    def _entregar(self, dt):
+        """Entrega las lecturas cuyo tiempo ya pasó y programa la siguiente"""
+        ahora = time.time() - self._inicio
+        while self._pendientes and self._pendientes[0][0] <= ahora:
+            t, lat, lon, precision = self._pendientes.popleft()
+            self._on_location(lat=lat, lon=lon, accuracy=precision)
+        self._evento = None
+        if self._pendientes:
+            self._evento = Clock.schedule_once(self._entregar, self._pendientes[0][0] - ahora)
+    
+    def stop(self):
+        if self._evento is not None:
+            self._evento.cancel()
+            self._evento = None
+
+# Servicio de ubicación compartido por toda la app
+class GPSManager:
+    """Un único listener del GPS para toda la app, con conteo de referencias
+    
+    Cada pantalla que necesita ubicación llama start() al entrar y stop() al
+    salir; el sensor solo está encendido mientras alguna lo usa. Las lecturas se
+    suavizan y se guarda la última lectura buena con su edad y precisión.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, fuente=None, intervalo_minimo=2.0, precision_maxima=100.0, filtro=None):
+        self.fuente = fuente  # GPSTrack en pruebas; None usa el GPS de plyer
+        self.intervalo_minimo = intervalo_minimo  # Segundos entre avisos a los suscriptores
+        self.precision_maxima = precision_maxima  # Lecturas peor que esto (m) se descartan
+        self.filtro = filtro or FiltroKalmanPosicion()
+        self.ultima_lectura = None  # {'lat', 'lon', 'precision', 'timestamp'}
+        self.lecturas = 0
+        self.descartadas = 0
+        self.avisos = 0
+        self._referencias = 0
+        self._suscriptores = []
+        self._ultimo_aviso = float('-inf')
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def shared(cls):
+        """Devuelve el GPSManager único de la app"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+    
+    @property
+    def activo(self):
+        return self._referencias > 0
+    
+    def start(self):
+        """Suma un usuario del GPS; el primero enciende el sensor"""
+        self._referencias += 1
+        if self._referencias == 1:
+            self.configure_gps()
+    
+    def stop(self):
+        """Resta un usuario del GPS; el último lo apaga"""
+        if self._referencias == 0:
+            return
+        self._referencias -= 1
+        if self._referencias == 0:
+            if self.fuente is not None:
+                self.fuente.stop()
+            elif platform == 'android':
+                from plyer import gps
+                try:
+                    gps.stop()
+                except NotImplementedError:
+                    pass
+    
+    def configure_gps(self):
+        """Configura el GPS usando plyer (o la fuente simulada)"""
+        if self.fuente is not None:
+            self.fuente.start(self.on_location)
+            return
+        if platform != 'android':
+            return
+        from plyer import gps
+        try:
+            gps.configure(on_location=self.on_location)
+            gps.start(minTime=int(self.intervalo_minimo * 1000), minDistance=1)
+        except NotImplementedError:
+            print("GPS no soportado en esta plataforma")
+    
+    def suscribir(self, callback):
+        """Registra callback(ubicacion) para las actualizaciones (a lo sumo una por intervalo_minimo)"""
+        if callback not in self._suscriptores:
+            self._suscriptores.append(callback)
+    
+    def cancelar_suscripcion(self, callback):
+        if callback in self._suscriptores:
+            self._suscriptores.remove(callback)
+    
+    def on_location(self, **kwargs):
+        """Incorpora una lectura (plyer la entrega desde otro hilo en Android)"""
+        self.procesar(time.time(), kwargs.get('lat'), kwargs.get('lon'), kwargs.get('accuracy'))
+    
+    def procesar(self, t, lat, lon, precision=None):
+        """Filtra, suaviza y guarda una lectura; avisa a los suscriptores con throttle"""
+        with self._lock:
+            self.lecturas += 1
+            if lat is None or lon is None or (precision is not None and precision > self.precision_maxima):
+                self.descartadas += 1
+                return
+            lat, lon, precision = self.filtro.actualizar(
+                t, lat, lon, precision if precision is not None else self.precision_maxima
             )
-        ''')
+            self.ultima_lectura = {'lat': lat, 'lon': lon, 'precision': precision, 'timestamp': t}
+            # Las lecturas dentro del intervalo solo actualizan la última ubicación
+            if t - self._ultimo_aviso < self.intervalo_minimo:
+                return
+            self._ultimo_aviso = t
+            self.avisos += 1
+        Clock.schedule_once(self._avisar)
+    
+    def _avisar(self, dt):
+        """Entrega la última lectura a los suscriptores en el hilo de UI"""
+        ubicacion = self.get_current_location()
+        for callback in list(self._suscriptores):
+            callback(ubicacion)
+    
+    def get_current_location(self):
+        """Última ubicación buena sin bloquear, con su edad en segundos y precisión en metros
         
-        # Tabla detalles pedidos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS detalles_pedidos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                pedido_id INTEGER,
-                producto_id INTEGER,
-                cantidad INTEGER,
-                precio_unitario REAL,
-                FOREIGN KEY (pedido_id) REFERENCES pedidos(id),
-                FOREIGN KEY (producto_id) REFERENCES productos(id)
+        Sin ninguna lectura devuelve la ubicación por defecto con edad y precisión None.
+        """
+        lectura = self.ultima_lectura
+        if lectura is None:
+            lat, lon = UBICACION_POR_DEFECTO
+            return {'lat': lat, 'lon': lon, 'precision': None, 'edad': None}
+        return {'lat': lectura['lat'], 'lon': lectura['lon'], 'precision': lectura['precision'],
+                'edad': max(0.0, time.time() - lectura['timestamp'])}
+    
+    def calculate_distance(self, lat1, lon1, lat2, lon2):
+        """Calcula distancia entre dos puntos"""
+        return haversine_km(lat1, lon1, lat2, lon2)
+    
+    def calculate_distances(self, lat1, lon1, lats2, lons2):
+        """Calcula en lote las distancias a muchos puntos (ver distancias_km)"""
+        return distancias_km(lat1, lon1, lats2, lons2)
+
+# Detección de sacudidas sobre una ventana de muestras del acelerómetro (m/s²)
+class ShakeDetector:
+    """Clasifica sacudidas con un buffer circular de picos de aceleración lineal
+    
+    La gravedad se separa con un filtro paso bajo. Una sacudida exige varios picos
+    dentro de la ventana con cambios de sentido, así un golpe aislado o una
+    aceleración sostenida (un vehículo, caminar) no la disparan.
+    """
+    def __init__(self, umbral=12.0, picos_minimos=3, inversiones_minimas=2, ventana=0.8,
+                 enfriamiento=2.0, alfa_gravedad=0.8):
+        self.umbral = umbral
+        self.picos_minimos = picos_minimos
+        self.inversiones_minimas = inversiones_minimas
+        self.ventana = ventana
+        self.enfriamiento = enfriamiento
+        self.alfa_gravedad = alfa_gravedad
+        self.picos = deque(maxlen=32)  # (t, eje, signo) de las muestras sobre el umbral
+        self.reiniciar()
+    
+    def reiniciar(self):
+        """Olvida el estado (al reanudar tras una pausa la gravedad puede haber cambiado)"""
+        self.picos.clear()
+        self.gravedad = None
+        self.ultima_sacudida = float('-inf')
+        self.magnitud = 0.0  # Aceleración lineal de la última muestra
+    
+    def agregar(self, t, x, y, z):
+        """Procesa una muestra; devuelve True si completa una sacudida"""
+        if self.gravedad is None:
+            self.gravedad = [x, y, z]
+        a = self.alfa_gravedad
+        g = self.gravedad
+        g[0] = a * g[0] + (1 - a) * x
+        g[1] = a * g[1] + (1 - a) * y
+        g[2] = a * g[2] + (1 - a) * z
+        lineal = (x - g[0], y - g[1], z - g[2])
+        self.magnitud = (lineal[0] ** 2 + lineal[1] ** 2 + lineal[2] ** 2) ** 0.5
+        
+        while self.picos and t - self.picos[0][0] > self.ventana:
+            self.picos.popleft()
+        if self.magnitud < self.umbral or t - self.ultima_sacudida < self.enfriamiento:
+            return False
+        
+        eje = max(range(3), key=lambda i: abs(lineal[i]))
+        self.picos.append((t, eje, lineal[eje] > 0))
+        if len(self.picos) < self.picos_minimos:
+            return False
+        inversiones = sum(
+            1 for (_, eje_a, signo_a), (_, eje_b, signo_b) in zip(self.picos, list(self.picos)[1:])
+            if eje_a == eje_b and signo_a != signo_b
+        )
+        if inversiones < self.inversiones_minimas:
+            return False
+        self.ultima_sacudida = t
+        self.picos.clear()
+        return True
+
+class SensorTrace:
+    """Traza grabada del acelerómetro (t, x, y, z) que se puede reproducir sin el sensor"""
+    def __init__(self, muestras):
+        self.muestras = muestras
+        self._indice = 0
+    
+    @classmethod
+    def cargar(cls, ruta):
+        """Lee un CSV con columnas t,x,y,z (la cabecera es opcional)"""
+        muestras = []
+        with open(ruta) as f:
+            for linea in f:
+                campos = linea.strip().split(',')
+                try:
+                    muestras.append(tuple(float(c) for c in campos[:4]))
+                except ValueError:
+                    continue  # Cabecera o línea vacía
+        return cls(muestras)
+    
+    @property
+    def duracion(self):
+        return self.muestras[-1][0] - self.muestras[0][0] if self.muestras else 0.0
+    
+    def muestra_en(self, t):
+        """Última muestra registrada hasta el instante t (lecturas en orden creciente)"""
+        while self._indice + 1 < len(self.muestras) and self.muestras[self._indice + 1][0] <= t:
+            self._indice += 1
+        return self.muestras[self._indice][1:]
+
+# Clase para manejo del acelerómetro
+class AccelerometerManager:
+    """Muestrea el acelerómetro solo mientras se monitorea, con frecuencia adaptativa
+    
+    En reposo se lee a baja frecuencia; cuando aparece movimiento se sube a la
+    frecuencia activa durante un rato para tener muestras suficientes en la ventana.
+    """
+    def __init__(self, detector=None, intervalo_reposo=0.25, intervalo_activo=0.04,
+                 umbral_movimiento=6.0, duracion_activa=1.0, max_errores=5):
+        self.detector = detector or ShakeDetector()
+        self.intervalo_reposo = intervalo_reposo
+        self.intervalo_activo = intervalo_activo
+        self.umbral_movimiento = umbral_movimiento
+        self.duracion_activa = duracion_activa
+        self.max_errores = max_errores
+        self.intervalo = intervalo_reposo
+        self.shake_callback = None
+        self.enabled = False
+        self.sensor = None  # plyer.accelerometer, importado al empezar a monitorear
+        self.muestras = 0
+        self.errores = 0
+        self._activo_hasta = float('-inf')
+        self._evento = None
+    
+    def start_monitoring(self, callback):
+        """Inicia monitoreo del acelerómetro"""
+        self.shake_callback = callback
+        if self.enabled:
+            return
+        if self.sensor is None:
+            from plyer import accelerometer
+            self.sensor = accelerometer
+        try:
+            self.sensor.enable()
+        except NotImplementedError:
+            print("Acelerómetro no soportado")
+            return
+        self.enabled = True
+        self.errores = 0
+        self.detector.reiniciar()
+        self._programar(self.intervalo_reposo)
+    
+    def _programar(self, intervalo):
+        """(Re)programa la lectura periódica con el intervalo dado"""
+        self.intervalo = intervalo
+        if self._evento is not None:
+            self._evento.cancel()
+            self._evento = None
+        if self.enabled:
+            self._evento = Clock.schedule_interval(self.check_accelerometer, intervalo)
+    
+    def check_accelerometer(self, dt):
+        """Lee una muestra del sensor"""
+        try:
+            accel_data = self.sensor.acceleration
+        except Exception as e:
+            self.errores += 1
+            print(f"Error leyendo el acelerómetro: {e}")
+            if self.errores >= self.max_errores:
+                self.stop_monitoring()
+            return
+        if accel_data and None not in accel_data[:3]:
+            self.procesar(time.time(), *accel_data[:3])
+    
+    def procesar(self, t, x, y, z):
+        """Pasa una muestra al detector y ajusta la frecuencia de muestreo"""
+        self.muestras += 1
+        if self.detector.agregar(t, x, y, z) and self.shake_callback:
+            self.shake_callback()
+        
+        if self.detector.magnitud >= self.umbral_movimiento:
+            self._activo_hasta = t + self.duracion_activa
+        intervalo = self.intervalo_activo if t < self._activo_hasta else self.intervalo_reposo
+        if intervalo != self.intervalo:
+            self._programar(intervalo)
+    
+    def simulate_shake(self):
+        """Inyecta una sacudida sintética por el mismo camino que las lecturas reales"""
+        inicio = max(time.time(), self.detector.ultima_sacudida + self.detector.enfriamiento)
+        for t, x, y, z in traza_sacudida(inicio).muestras:
+            self.procesar(t, x, y, z)
+    
+    def stop_monitoring(self):
+        """Detiene el monitoreo"""
+        if self.enabled:
+            self.enabled = False
+            self._programar(self.intervalo_reposo)
+            try:
+                self.sensor.disable()
+            except NotImplementedError:
+                pass
+
+def traza_sacudida(inicio=0.0, duracion=0.6, frecuencia=5.0, amplitud=15.0, muestreo=0.02):
+    """Traza sintética de una sacudida: oscilación en el eje X sobre la gravedad en Z"""
+    muestras = []
+    pasos = int(duracion / muestreo)
+    for i in range(pasos + 1):
+        t = i * muestreo
+        # Onda cuadrada suavizada: picos alternos de ±amplitud
+        fase = (t * frecuencia * 2) % 2
+        x = amplitud if fase < 1 else -amplitud
+        muestras.append((inicio + t, x, 0.0, 9.81))
+    return SensorTrace(muestras)
+
+# Decodificación de códigos de barras EAN-13 / UPC-A a partir de frames de la cámara
+def _anchos_de_bits(bits):
+    """Longitudes de las rachas de un patrón de módulos, p. ej. '0001101' -> (3, 2, 1, 1)"""
+    anchos = [1]
+    for anterior, actual in zip(bits, bits[1:]):
+        if actual == anterior:
+            anchos[-1] += 1
+        else:
+            anchos.append(1)
+    return tuple(anchos)
+
+# Codificación L de cada dígito; R es su complemento (mismos anchos) y G es R invertido
+CODIGOS_EAN_L = ['0001101', '0011001', '0010011', '0111101', '0100011',
+                 '0110001', '0101111', '0111011', '0110111', '0001011']
+ANCHOS_EAN_L = [_anchos_de_bits(bits) for bits in CODIGOS_EAN_L]
+ANCHOS_EAN_G = [tuple(reversed(anchos)) for anchos in ANCHOS_EAN_L]
+# Paridad L/G de los 6 dígitos izquierdos -> primer dígito del EAN-13
+PARIDADES_EAN = {
+    'LLLLLL': '0', 'LLGLGG': '1', 'LLGGLG': '2', 'LLGGGL': '3', 'LGLLGG': '4',
+    'LGGLLG': '5', 'LGGGLL': '6', 'LGLGLG': '7', 'LGLGGL': '8', 'LGGLGL': '9',
+}
+
+def digito_control_ean13(doce_digitos):
+    """Calcula el dígito de control EAN-13 de los primeros 12 dígitos"""
+    suma = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(doce_digitos))
+    return str((10 - suma % 10) % 10)
+
+def lineas_de_escaneo(pixels, ancho, alto, lineas=6, paso=1):
+    """Extrae filas y columnas de un frame RGBA en escala de grises, reducidas por paso
+    
+    Se usa el canal verde como luminancia: basta para separar barras de espacios y
+    los slices de bytes se hacen en C, sin recorrer el frame completo en Python.
+    """
+    bytes_por_fila = ancho * 4
+    resultado = []
+    for i in range(1, lineas + 1):
+        y = alto * i // (lineas + 1)
+        inicio = y * bytes_por_fila + 1
+        resultado.append(pixels[inicio:inicio + bytes_por_fila:4 * paso])
+        # Columnas: el código puede llegar girado 90° con el teléfono en vertical
+        x = ancho * i // (lineas + 1)
+        resultado.append(pixels[x * 4 + 1::bytes_por_fila * paso])
+    return resultado
+
+class BarcodeDecoder:
+    """Decodificador EAN-13 / UPC-A en Python puro sobre líneas de escaneo en grises"""
+    def __init__(self, contraste_minimo=40, error_maximo=1.8):
+        self.contraste_minimo = contraste_minimo
+        self.error_maximo = error_maximo
+    
+    def decodificar(self, lineas):
+        """Devuelve el primer código válido encontrado en las líneas, o None"""
+        for linea in lineas:
+            codigo = self.decodificar_linea(linea)
+            if codigo:
+                return codigo
+        return None
+    
+    def decodificar_linea(self, valores):
+        """Decodifica una línea en cualquiera de los dos sentidos"""
+        if len(valores) < 95:
+            return None
+        minimo, maximo = min(valores), max(valores)
+        if maximo - minimo < self.contraste_minimo:
+            return None
+        umbral = (minimo + maximo) // 2
+        
+        # Longitudes de las rachas claro/oscuro
+        anchos = []
+        oscuro_anterior = valores[0] < umbral
+        ancho = 0
+        for valor in valores:
+            oscuro = valor < umbral
+            if oscuro == oscuro_anterior:
+                ancho += 1
+            else:
+                anchos.append(ancho)
+                ancho = 1
+                oscuro_anterior = oscuro
+        anchos.append(ancho)
+        
+        primera_oscura = valores[0] < umbral
+        return self._buscar_codigo(anchos, primera_oscura) or self._buscar_codigo(
+            anchos[::-1], primera_oscura == (len(anchos) % 2 == 1)
+        )
+    
+    def _buscar_codigo(self, anchos, primera_oscura):
+        """Prueba cada barra precedida de espacio como posible guarda de inicio"""
+        # Un EAN-13 son 59 rachas: guarda 3 + 6x4 + centro 5 + 6x4 + guarda 3
+        inicio = 2 if primera_oscura else 1
+        for k in range(inicio, len(anchos) - 58, 2):
+            modulo = sum(anchos[k:k + 59]) / 95
+            if anchos[k - 1] < 3 * modulo:
+                continue  # Sin zona de silencio antes de la guarda
+            if not all(0.5 * modulo <= a <= 1.6 * modulo for a in anchos[k:k + 3]):
+                continue
+            codigo = self._decodificar_desde(anchos, k, modulo)
+            if codigo:
+                return codigo
+        return None
+    
+    def _decodificar_desde(self, anchos, k, modulo):
+        """Decodifica los 12 dígitos codificados a partir de la guarda en la posición k"""
+        paridad = ''
+        digitos = ''
+        for d in range(12):
+            if d == 6:
+                k += 5  # Guarda central
+            posicion = k + 3 + 4 * d
+            segmento = anchos[posicion:posicion + 4]
+            total = sum(segmento)
+            if not 5 * modulo <= total <= 9 * modulo:
+                return None
+            normalizado = [a * 7 / total for a in segmento]
+            digito, tipo = self._mejor_digito(normalizado, izquierdo=d < 6)
+            if digito is None:
+                return None
+            digitos += digito
+            if d < 6:
+                paridad += tipo
+        primero = PARIDADES_EAN.get(paridad)
+        if primero is None:
+            return None
+        codigo = primero + digitos
+        if digito_control_ean13(codigo[:12]) != codigo[12]:
+            return None
+        return codigo
+    
+    def _mejor_digito(self, normalizado, izquierdo):
+        """Dígito cuyo patrón de anchos más se parece al segmento medido"""
+        candidatos = [('L', ANCHOS_EAN_L)]
+        if izquierdo:
+            candidatos.append(('G', ANCHOS_EAN_G))
+        mejor = (self.error_maximo, None, None)
+        for tipo, patrones in candidatos:
+            for digito, patron in enumerate(patrones):
+                error = sum(abs(a - b) for a, b in zip(normalizado, patron))
+                if error < mejor[0]:
+                    mejor = (error, str(digito), tipo)
+        return mejor[1], mejor[2]
+
+class BarcodeScanner:
+    """Decodifica frames de la cámara en un hilo de trabajo a una tasa acotada
+    
+    Solo hay un hueco para el frame pendiente: si el decodificador va atrasado el
+    frame nuevo reemplaza al anterior, que se cuenta como descartado. Un frame que
+    no se puede decodificar (p. ej. un buffer con otro formato) se cuenta como
+    error y el hilo sigue con el siguiente.
+    """
+    def __init__(self, on_code, fps=8, decoder=None, ancho_objetivo=640, enfriamiento=2.0):
+        self.on_code = on_code
+        self.fps = fps
+        self.decoder = decoder or BarcodeDecoder()
+        self.ancho_objetivo = ancho_objetivo
+        self.enfriamiento = enfriamiento  # Segundos antes de repetir el mismo código
+        self.frames_procesados = 0
+        self.frames_descartados = 0
+        self.errores = 0
+        self.ultimo_error = None
+        self.latencias = deque(maxlen=100)  # Frame -> resultado, en ms
+        self._frame = None
+        self._ocupado = False
+        self._ultimo = (None, 0.0)
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+    
+    def listo_para_frame(self):
+        """Indica si conviene leer un frame; si no, lo cuenta como descartado"""
+        with self._cond:
+            if self._ocupado or self._frame is not None:
+                self.frames_descartados += 1
+                return False
+            return True
+    
+    def enviar_frame(self, pixels, ancho, alto, capturado=None):
+        """Entrega un frame RGBA al hilo de trabajo"""
+        with self._cond:
+            if self._frame is not None:
+                self.frames_descartados += 1
+            self._frame = (pixels, ancho, alto, capturado or time.perf_counter())
+            self._cond.notify()
+    
+    def _run(self):
+        """Bucle del hilo de trabajo"""
+        while True:
+            with self._cond:
+                while self._frame is None:
+                    self._cond.wait()
+                pixels, ancho, alto, capturado = self._frame
+                self._frame = None
+                self._ocupado = True
+            try:
+                paso = max(1, ancho // self.ancho_objetivo)
+                codigo = self.decoder.decodificar(lineas_de_escaneo(pixels, ancho, alto, paso=paso))
+            except Exception as e:
+                codigo = None
+                self.errores += 1
+                error = f'{type(e).__name__}: {e}'
+                if error != self.ultimo_error:  # Un formato de cámara inesperado falla en cada frame
+                    Logger.error(f'BarcodeScanner: {error}', exc_info=e)
+                self.ultimo_error = error
+            finally:
+                with self._cond:
+                    self._ocupado = False
+                    self.frames_procesados += 1
+            if codigo:
+                self._resultado(codigo, capturado)
+    
+    def _resultado(self, codigo, capturado):
+        """Registra la latencia y entrega el código al hilo de UI (salvo repeticiones)"""
+        ahora = time.perf_counter()
+        self.latencias.append((ahora - capturado) * 1000)
+        ultimo, instante = self._ultimo
+        if codigo == ultimo and ahora - instante < self.enfriamiento:
+            return
+        self._ultimo = (codigo, ahora)
+        Clock.schedule_once(lambda dt: self.on_code(codigo))
+    
+    def estadisticas(self):
+        """Frames procesados/descartados y latencia frame -> resultado en ms"""
+        ordenadas = sorted(self.latencias)
+        return {
+            'procesados': self.frames_procesados,
+            'descartados': self.frames_descartados,
+            'errores': self.errores,
+            'lecturas': len(ordenadas),
+            'latencia_p50': ordenadas[len(ordenadas) // 2] if ordenadas else None,
+            'latencia_max': ordenadas[-1] if ordenadas else None,
+        }
+
+# Acceso a SQLite fuera del hilo de UI
+class ColaLlenaError(Exception):
+    """La cola del DatabaseExecutor está llena (backpressure)"""
+
+# Lo que ve el usuario cuando el executor rechaza una operación por tener la cola llena
+MENSAJE_OCUPADO = "La tienda está ocupada guardando datos.\nInténtalo de nuevo en un momento."
+
+class DatabaseExecutor:
+    """Ejecuta las operaciones de base de datos en hilos de trabajo
+    
+    Las escrituras van a un único hilo escritor que agrupa lo que haya en cola
+    en una transacción (cada operación en su SAVEPOINT); las lecturas se reparten
+    entre hilos lectores, que en WAL no esperan al escritor. Cada llamada devuelve
+    un Future y, si se pasan, on_result/on_error se ejecutan en el hilo de UI.
+    Los errores sin on_error van al Logger de Kivy. stop() termina lo encolado y
+    detiene los hilos; hay que llamarlo antes de cerrar el pool.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, db, lectores=2, max_pendientes=256, lote_max=32):
+        self.db = db
+        self.lote_max = lote_max
+        self.escrituras = 0
+        self.lotes = 0
+        self.rechazadas = 0
+        self._cola_escritura = queue.Queue(maxsize=max_pendientes)
+        self._cola_lectura = queue.Queue(maxsize=max_pendientes)
+        self._detenido = False
+        self._hilo_escritor = threading.Thread(target=self._escritor, daemon=True)
+        self._hilos_lectores = [threading.Thread(target=self._lector, daemon=True) for _ in range(lectores)]
+        self._hilos = [self._hilo_escritor] + self._hilos_lectores
+        for hilo in self._hilos:
+            hilo.start()
+    
+    @classmethod
+    def shared(cls):
+        """Devuelve el executor de la app sobre el DatabaseManager compartido"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(DatabaseManager.shared())
+            return cls._shared
+    
+    def leer(self, func, *args, on_result=None, on_error=None, bloquear=False):
+        """Ejecuta func(*args) en un hilo lector"""
+        return self._encolar(self._cola_lectura, func, args, on_result, on_error, bloquear)
+    
+    def escribir(self, func, *args, on_result=None, on_error=None, bloquear=False):
+        """Ejecuta func(*args) en el hilo escritor, en orden de llegada
+        
+        También sirve para lecturas que deben ver las escrituras encoladas antes.
+        """
+        return self._encolar(self._cola_escritura, func, args, on_result, on_error, bloquear)
+    
+    def _encolar(self, cola, func, args, on_result, on_error, bloquear):
+        """Con la cola llena lanza ColaLlenaError, o espera si bloquear=True (nunca desde la UI)"""
+        if self._detenido:
+            raise RuntimeError('El DatabaseExecutor está detenido')
+        future = Future()
+        try:
+            cola.put((future, func, args, on_result, on_error), block=bloquear)
+        except queue.Full:
+            self.rechazadas += 1
+            raise ColaLlenaError('Demasiadas operaciones de base de datos pendientes')
+        return future
+    
+    def _entregar(self, future, on_result, on_error, resultado=None, error=None):
+        """Completa el Future y programa el callback en el hilo de UI"""
+        if error is not None:
+            future.set_exception(error)
+            if on_error is not None:
+                Clock.schedule_once(lambda dt: on_error(error))
+            else:
+                Logger.error(f'DatabaseExecutor: {type(error).__name__}: {error}', exc_info=error)
+        else:
+            future.set_result(resultado)
+            if on_result is not None:
+                Clock.schedule_once(lambda dt: on_result(resultado))
+    
+    def stop(self, timeout=None):
+        """Deja de aceptar operaciones, ejecuta las ya encoladas y espera a que terminen los hilos"""
+        self._detenido = True
+        # Un marcador de fin por hilo, detrás de lo que ya estaba en cola
+        self._cola_escritura.put(None)
+        for _ in self._hilos_lectores:
+            self._cola_lectura.put(None)
+        for hilo in self._hilos:
+            hilo.join(timeout)
+    
+    def _lector(self):
+        while True:
+            tarea = self._cola_lectura.get()
+            if tarea is None:
+                return
+            future, func, args, on_result, on_error = tarea
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                resultado = func(*args)
+            except Exception as e:
+                self._entregar(future, on_result, on_error, error=e)
+            else:
+                self._entregar(future, on_result, on_error, resultado)
+    
+    def _escritor(self):
+        fin = False
+        while not fin:
+            lote = [self._cola_escritura.get()]
+            while len(lote) < self.lote_max and lote[-1] is not None:
+                try:
+                    lote.append(self._cola_escritura.get_nowait())
+                except queue.Empty:
+                    break
+            if lote[-1] is None:
+                # Marcador de stop(): se confirma lo que venía antes y el hilo termina
+                fin = True
+                lote.pop()
+                if not lote:
+                    break
+            lote = [tarea for tarea in lote if tarea[0].set_running_or_notify_cancel()]
+            resultados = []
+            try:
+                with self.db.pool.transaction(immediate=True):
+                    for future, func, args, on_result, on_error in lote:
+                        # Un error (p. ej. stock insuficiente) deshace solo su SAVEPOINT
+                        try:
+                            with self.db.pool.transaction():
+                                resultados.append((func(*args), None))
+                        except Exception as e:
+                            resultados.append((None, e))
+            except Exception as e:
+                # Falló el commit del lote: ninguna operación quedó escrita
+                resultados = [(None, e)] * len(lote)
+            self.lotes += 1
+            self.escrituras += len(lote)
+            # Los resultados se entregan después del commit
+            for (future, func, args, on_result, on_error), (resultado, error) in zip(lote, resultados):
+                self._entregar(future, on_result, on_error, resultado, error)
+    
+    def pendientes(self):
+        """Operaciones en cola (escrituras, lecturas)"""
+        return self._cola_escritura.qsize(), self._cola_lectura.qsize()
+
+# Sincronización de pedidos con el back office: outbox durable + hilo de envío
+class OrderSyncWorker:
+    """Envía los pedidos del outbox al back office en lotes comprimidos
+    
+    Cada lote es un POST de {"pedidos": [{"clave_idempotencia", "pedido"}, ...]} en
+    gzip; un 2xx confirma el lote completo, así que el servidor debe descartar las
+    claves que ya procesó (un lote puede llegar dos veces si se corta la respuesta).
+    Un error de contenido (400, 409, 413, 422) se reintenta pedido por pedido para
+    rechazar solo el que el servidor no acepta. Cualquier otra falla (red caída, 5xx,
+    429, o 401/403/404/405 por credenciales o URL mal configuradas) no es culpa del
+    pedido: se reprograma el lote con backoff exponencial y jitter y se corta la
+    pasada, sin probar los lotes siguientes. Todo ocurre en un hilo propio: la UI
+    solo llama a despertar() tras crear un pedido.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    # Respuestas que culpan al contenido del lote; el resto pausa toda la cola
+    ESTADOS_DE_CONTENIDO = {400, 409, 413, 422}
+    
+    def __init__(self, db, url, tamano_lote=200, comprimir=True, timeout=15,
+                 espera_base=1.0, espera_max=300.0, cabeceras=None):
+        partes = urlsplit(url)
+        if partes.scheme not in ('http', 'https') or not partes.hostname:
+            raise ValueError(f"URL de sincronización inválida: {url}")
+        self.db = db
+        self.url = url
+        self.tamano_lote = tamano_lote
+        self.comprimir = comprimir
+        self.timeout = timeout
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.cabeceras = dict(cabeceras or {})
+        self.enviados = 0
+        self.lotes = 0
+        self.reintentos = 0
+        self.rechazados = 0
+        self.bytes_json = 0
+        self.bytes_enviados = 0
+        self.ultimo_error = None
+        self._fallos_seguidos = 0
+        self._pausa_hasta = 0.0
+        self._partes = partes
+        self._conexion = None
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+    
+    @classmethod
+    def shared(cls):
+        """Sincronizador de la app según MITIENDA_SYNC_URL (y MITIENDA_SYNC_TOKEN); None si no hay URL"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                url = os.environ.get('MITIENDA_SYNC_URL')
+                if not url:
+                    return None
+                token = os.environ.get('MITIENDA_SYNC_TOKEN')
+                cabeceras = {'Authorization': f'Bearer {token}'} if token else None
+                cls._shared = cls(DatabaseManager.shared(), url, cabeceras=cabeceras)
+            return cls._shared
+    
+    def start(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, daemon=True)
+            self._hilo.start()
+    
+    def stop(self, timeout=None):
+        """Detiene el hilo; lo que quede pendiente sigue en el outbox para el próximo arranque"""
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+            self._hilo = None
+    
+    def despertar(self):
+        """Pide un intento inmediato (nuevo pedido, volvió la conexión); no bloquea
+        
+        No adelanta la pausa que impuso una respuesta de error del servidor.
+        """
+        self._despertar.set()
+    
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._despertar.clear()
+            try:
+                espera = self.sincronizar()
+            except Exception as e:
+                # p. ej. la base ocupada: se reintenta más tarde sin matar el hilo
+                self.ultimo_error = str(e)
+                espera = self.espera_base
+            self._despertar.wait(espera)
+        self._cerrar_conexion()
+    
+    def sincronizar(self):
+        """Envía lotes mientras haya pendientes vencidos; devuelve cuánto esperar (None: hasta despertar)"""
+        while not self._detener.is_set():
+            pausa = self._pausa_hasta - time.time()
+            if pausa > 0:
+                return pausa
+            filas = self.db.get_outbox_pendiente(self.tamano_lote)
+            if filas:
+                espera = self._enviar_lote(filas)
+                if espera is not None:
+                    return espera
+                continue
+            proximo = self.db.proximo_envio_outbox()
+            if proximo is None:
+                return None
+            return max(0.0, proximo - time.time())
+        return 0
+    
+    def _enviar_lote(self, filas):
+        """Envía filas del outbox y registra el resultado en la base
+        
+        Devuelve cuánto esperar si hay que cortar la pasada, o None para seguir.
+        """
+        # Import diferido: http.client solo hace falta si hay sincronización configurada
+        import http.client
+        try:
+            estado, reintentar_en, detalle = self._post(filas)
+        except (OSError, http.client.HTTPException) as e:
+            estado, reintentar_en, detalle = None, None, f"{type(e).__name__}: {e}"
+        
+        if estado is not None and 200 <= estado < 300:
+            self.db.confirmar_outbox([fila[0] for fila in filas])
+            self.enviados += len(filas)
+            self.ultimo_error = None
+            self._fallos_seguidos = 0
+            return None
+        if estado in self.ESTADOS_DE_CONTENIDO:
+            if len(filas) == 1:
+                self.ultimo_error = detalle
+                self.rechazados += 1
+                self.db.rechazar_outbox([filas[0][0]], detalle)
+                return None
+            # Un pedido que el servidor no acepta no debe bloquear a los demás del lote
+            for fila in filas:
+                espera = self._enviar_lote([fila])
+                if espera is not None:
+                    return espera
+            return None
+        
+        # Red caída o servidor que no atiende: los demás lotes fallarían igual
+        self.ultimo_error = detalle
+        self.reintentos += len(filas)
+        ahora = time.time()
+        self.db.reprogramar_outbox(
+            [(fila[0], ahora + (reintentar_en if reintentar_en is not None else self._espera(fila[3])))
+             for fila in filas],
+            detalle,
+        )
+        espera = reintentar_en if reintentar_en is not None else self._espera(self._fallos_seguidos)
+        self._fallos_seguidos += 1
+        if estado is not None:
+            # El servidor respondió: ni un pedido nuevo ni despertar() justifican insistir antes
+            self._pausa_hasta = ahora + espera
+        return espera
+    
+    def _espera(self, intentos):
+        """Backoff exponencial con jitter (entre la mitad y el total de la espera)"""
+        return min(self.espera_max, self.espera_base * 2 ** intentos) * random.uniform(0.5, 1.0)
+    
+    def _post(self, filas):
+        """POST del lote; devuelve (estado HTTP, segundos de Retry-After o None, detalle)"""
+        import http.client
+        # Los payloads ya son JSON: se concatenan en vez de decodificarlos y volver a codificarlos
+        cuerpo = ('{"pedidos":[' + ','.join(
+            f'{{"clave_idempotencia":"{clave}","pedido":{payload}}}' for _, clave, payload, _ in filas
+        ) + ']}').encode('utf-8')
+        self.bytes_json += len(cuerpo)
+        cabeceras = {
+            'Content-Type': 'application/json; charset=utf-8',
+            # La misma clave para el mismo conjunto de pedidos, aunque se reintente
+            'Idempotency-Key': hashlib.sha256(' '.join(fila[1] for fila in filas).encode()).hexdigest(),
+            **self.cabeceras,
+        }
+        if self.comprimir:
+            cuerpo = gzip.compress(cuerpo, compresslevel=6)
+            cabeceras['Content-Encoding'] = 'gzip'
+        self.lotes += 1
+        self.bytes_enviados += len(cuerpo)
+        
+        ruta = self._partes.path or '/'
+        if self._partes.query:
+            ruta += '?' + self._partes.query
+        reutilizada = self._conexion is not None
+        try:
+            respuesta = self._request(ruta, cuerpo, cabeceras)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # El servidor cerró la conexión keep-alive mientras estaba inactiva: una nueva y otra vez
+            if not reutilizada:
+                raise
+            respuesta = self._request(ruta, cuerpo, cabeceras)
+        detalle = f"HTTP {respuesta.status} {respuesta.reason}"
+        reintentar_en = None
+        retry_after = respuesta.getheader('Retry-After')
+        if retry_after and retry_after.strip().isdigit():
+            reintentar_en = min(self.espera_max, float(retry_after))
+        cuerpo_respuesta = respuesta.read()
+        if respuesta.status >= 400 and cuerpo_respuesta:
+            detalle += f": {cuerpo_respuesta[:200].decode('utf-8', 'replace')}"
+        if respuesta.will_close:
+            self._cerrar_conexion()
+        return respuesta.status, reintentar_en, detalle
+    
+    def _request(self, ruta, cuerpo, cabeceras):
+        import http.client
+        if self._conexion is None:
+            clase = http.client.HTTPSConnection if self._partes.scheme == 'https' else http.client.HTTPConnection
+            self._conexion = clase(self._partes.hostname, self._partes.port, timeout=self.timeout)
+        try:
+            self._conexion.request('POST', ruta, body=cuerpo, headers=cabeceras)
+            return self._conexion.getresponse()
+        except BaseException:
+            self._cerrar_conexion()
+            raise
+    
+    def _cerrar_conexion(self):
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+    
+    def estadisticas(self):
+        """Contadores del sincronizador y estado del outbox"""
+        return {
+            'enviados': self.enviados,
+            'lotes': self.lotes,
+            'reintentos': self.reintentos,
+            'rechazados': self.rechazados,
+            'bytes_json': self.bytes_json,
+            'bytes_enviados': self.bytes_enviados,
+            'ultimo_error': self.ultimo_error,
+            'outbox': self.db.estado_outbox(),
+        }
+
+# Instrumentación de frames: detecta frames perdidos y cuánto I/O hubo en ellos
+class FrameMonitor:
+    """Mide la duración de cada frame y atribuye los frames perdidos al I/O de SQLite
+    
+    Activa la medición del pool en el hilo principal; un frame cuenta como perdido
+    si dura más de tolerancia veces el presupuesto, y como causado por I/O si
+    SQLite ocupó en él más de la mitad del presupuesto.
+    """
+    def __init__(self, pool, fps=60, tolerancia=1.5):
+        self.pool = pool
+        self.presupuesto = 1 / fps
+        self.tolerancia = tolerancia
+        self.duraciones = deque(maxlen=3600)
+        self.frames = 0
+        self.perdidos = 0
+        self.perdidos_por_io = 0
+        self.io_total = 0.0
+        self._io_anterior = 0.0
+        self._evento = None
+    
+    def start(self):
+        self.pool.medir_hilo_ui = True
+        self._io_anterior = self.pool.io_hilo_ui
+        if self._evento is None:
+            self._evento = Clock.schedule_interval(lambda dt: self.registrar_frame(dt), 0)
+    
+    def stop(self):
+        if self._evento is not None:
+            self._evento.cancel()
+            self._evento = None
+        self.pool.medir_hilo_ui = False
+    
+    def registrar_frame(self, dt):
+        """Registra un frame de duración dt y el I/O hecho en el hilo de UI desde el anterior"""
+        io = self.pool.io_hilo_ui - self._io_anterior
+        self._io_anterior = self.pool.io_hilo_ui
+        self.frames += 1
+        self.io_total += io
+        self.duraciones.append(dt)
+        if dt > self.presupuesto * self.tolerancia:
+            self.perdidos += 1
+            if io > self.presupuesto / 2:
+                self.perdidos_por_io += 1
+    
+    def estadisticas(self):
+        """Frames, perdidos (total y por I/O), I/O en el hilo de UI y percentiles en ms"""
+        ordenadas = sorted(self.duraciones)
+        return {
+            'frames': self.frames,
+            'perdidos': self.perdidos,
+            'perdidos_por_io': self.perdidos_por_io,
+            'io_hilo_ui_ms': self.io_total * 1000,
+            'p50_ms': ordenadas[len(ordenadas) // 2] * 1000 if ordenadas else None,
+            'p95_ms': ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))] * 1000 if ordenadas else None,
+        }
+
+# Modelo observable del carrito: la interfaz aplica cambios por línea en vez de recargar
+class CartModel:
+    """Líneas del carrito y total acumulado, actualizados por deltas
+    
+    Cada operación escribe en SQLite y aplica solo la línea afectada; los
+    observadores reciben (evento, linea) con evento 'agregada', 'actualizada',
+    'eliminada' o 'recargada'. La consulta completa del carrito queda para
+    reconciliar cuando el modelo no está sincronizado (al inicio o tras
+    escrituras hechas por fuera del modelo).
+    
+    Con un DatabaseExecutor las escrituras corren en su hilo escritor y los deltas
+    se aplican al volver al hilo de UI; on_done/on_error reciben el resultado. Si
+    la cola del executor está llena la operación no se encola y se lanza
+    ColaLlenaError al que llamó. Sin executor todo es síncrono y los errores se
+    propagan si no hay on_error.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, db, executor=None):
+        self.db = db
+        self.executor = executor
+        self.lineas = OrderedDict()  # producto_id -> dict de la línea
+        self.total_centavos = 0  # Entero: la suma por deltas no acumula error
+        self.unidades = 0
+        self.sincronizado = False
+        self._observadores = []
+    
+    @classmethod
+    def shared(cls):
+        """Devuelve el carrito único de la app sobre el DatabaseManager compartido"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(DatabaseManager.shared(), DatabaseExecutor.shared())
+            return cls._shared
+    
+    def observar(self, callback):
+        self._observadores.append(callback)
+    
+    def _notificar(self, evento, linea):
+        for callback in self._observadores:
+            callback(evento, linea)
+    
+    def _ejecutar(self, func, args, aplicar, on_done=None, on_error=None):
+        """Ejecuta la operación de base de datos y aplica su resultado en el hilo de UI"""
+        def listo(resultado):
+            valor = aplicar(resultado)
+            if on_done is not None:
+                on_done(valor)
+        
+        if self.executor is not None:
+            # En el hilo escritor también las lecturas: así ven las escrituras encoladas antes
+            self.executor.escribir(func, *args, on_result=listo, on_error=on_error)
+            return
+        try:
+            resultado = func(*args)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(e)
+            return
+        listo(resultado)
+    
+    def reconciliar(self, on_done=None):
+        """Reconstruye el modelo desde SQL (consulta completa)"""
+        self._ejecutar(self.db.get_carrito, (), self._reconstruir, on_done)
+    
+    def _reconstruir(self, filas):
+        self.lineas.clear()
+        self.total_centavos = 0
+        self.unidades = 0
+        for fila in filas:
+            linea = self._linea(fila)
+            self.lineas[linea['producto_id']] = linea
+            self.total_centavos += linea['subtotal_centavos']
+            self.unidades += linea['cantidad']
+        self.sincronizado = True
+        self._notificar('recargada', None)
+    
+    def marcar_desincronizado(self):
+        """Indica que el carrito cambió por fuera del modelo; se reconcilia al volver a usarlo"""
+        self.sincronizado = False
+    
+    @staticmethod
+    def _linea(fila):
+        item_id, nombre, cantidad, precio_unitario_centavos, subtotal_centavos, producto_id = fila
+        return {'item_id': item_id, 'producto_id': producto_id, 'nombre': nombre, 'cantidad': cantidad,
+                'precio_unitario_centavos': precio_unitario_centavos, 'subtotal_centavos': subtotal_centavos}
+    
+    def _aplicar(self, fila):
+        """Aplica la línea devuelta por la base de datos y ajusta el total"""
+        if fila is None:
+            return False  # El producto no existe
+        nueva = self._linea(fila)
+        linea = self.lineas.get(nueva['producto_id'])
+        if linea is None:
+            self.lineas[nueva['producto_id']] = nueva
+            self.total_centavos += nueva['subtotal_centavos']
+            self.unidades += nueva['cantidad']
+            self._notificar('agregada', nueva)
+            return True
+        self.total_centavos += nueva['subtotal_centavos'] - linea['subtotal_centavos']
+        self.unidades += nueva['cantidad'] - linea['cantidad']
+        linea.update(nueva)
+        self._notificar('actualizada', linea)
+        return True
+    
+    def _quitar(self, producto_id):
+        linea = self.lineas.pop(producto_id, None)
+        if linea is not None:
+            self.total_centavos -= linea['subtotal_centavos']
+            self.unidades -= linea['cantidad']
+            self._notificar('eliminada', linea)
+    
+    def agregar(self, producto_id, cantidad=1, on_done=None, on_error=None):
+        """Suma cantidad del producto; on_done recibe False si el producto no existe"""
+        self._ejecutar(self.db.agregar_al_carrito, (producto_id, cantidad), self._aplicar, on_done, on_error)
+    
+    def cambiar_cantidad(self, producto_id, cantidad, on_done=None, on_error=None):
+        """Fija la cantidad de una línea; con 0 o menos la elimina"""
+        def aplicar(fila):
+            if fila is None:
+                self._quitar(producto_id)
+            else:
+                self._aplicar(fila)
+        self._ejecutar(self.db.actualizar_cantidad_carrito, (producto_id, cantidad), aplicar, on_done, on_error)
+    
+    def eliminar(self, producto_id, on_done=None, on_error=None):
+        self._ejecutar(self.db.eliminar_producto_del_carrito, (producto_id,),
+                       lambda _: self._quitar(producto_id), on_done, on_error)
+    
+    def _vaciar(self, _=None):
+        self.lineas.clear()
+        self.total_centavos = 0
+        self.unidades = 0
+        self.sincronizado = True
+        self._notificar('recargada', None)
+    
+    def limpiar(self, on_done=None, on_error=None):
+        self._ejecutar(self.db.limpiar_carrito, (), self._vaciar, on_done, on_error)
+    
+    def crear_pedido(self, direccion, ubicacion_gps, on_done=None, on_error=None):
+        """Confirma el pedido (ver DatabaseManager.crear_pedido); on_done recibe su resultado"""
+        def aplicar(resultado):
+            if resultado is not None:
+                self._vaciar()
+            return resultado
+        self._ejecutar(self.db.crear_pedido, (direccion, ubicacion_gps), aplicar, on_done, on_error)
+
+# Escaneo por lotes: acumula lecturas en memoria y las confirma de una vez
+class BatchScanSession:
+    """Conteo de códigos escaneados que se resuelve y se lleva al carrito al terminar"""
+    def __init__(self):
+        self.conteos = OrderedDict()
+    
+    def agregar(self, codigo, cantidad=1):
+        """Suma una lectura del código y devuelve su conteo acumulado"""
+        self.conteos[codigo] = self.conteos.get(codigo, 0) + cantidad
+        return self.conteos[codigo]
+    
+    def quitar(self, codigo):
+        """Deshace la última lectura de un código"""
+        if self.conteos.get(codigo, 0) > 1:
+            self.conteos[codigo] -= 1
+        else:
+            self.conteos.pop(codigo, None)
+    
+    @property
+    def total_lecturas(self):
+        return sum(self.conteos.values())
+    
+    def confirmar(self, db):
+        """Resuelve los códigos con una consulta y los agrega al carrito en una transacción
+        
+        Devuelve (agregados, desconocidos): filas de producto con su cantidad y
+        códigos que no existen en el catálogo. La sesión queda vacía.
+        """
+        productos = db.get_productos_por_codigos(self.conteos)
+        agregados = [(productos[codigo], cantidad) for codigo, cantidad in self.conteos.items()
+                     if codigo in productos]
+        desconocidos = [codigo for codigo in self.conteos if codigo not in productos]
+        if agregados:
+            db.agregar_lote_al_carrito((producto[0], cantidad) for producto, cantidad in agregados)
+        self.conteos.clear()
+        return agregados, desconocidos
+
+# Búsqueda asíncrona con debounce para el catálogo
+class SearchPipeline:
+    """Ejecuta las búsquedas en un hilo de trabajo y descarta las obsoletas"""
+    def __init__(self, db, on_results, debounce=0.3):
+        self.db = db
+        self.on_results = on_results
+        self.debounce = debounce
+        self.latencias = deque(maxlen=200)  # Tecla -> render, en ms
+        self.errores = 0
+        self._generation = 0
+        self._params = (None, None, None, 0.0)
+        self._pendiente = None
+        self._cond = threading.Condition()
+        self._trigger = Clock.create_trigger(self._dispatch, debounce)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+    
+    def submit(self, categoria=None, busqueda=None, inmediato=False):
+        """Programa una búsqueda e invalida cualquier consulta anterior"""
+        with self._cond:
+            self._generation += 1
+            self._params = (categoria, busqueda, None, time.perf_counter())
+        self._trigger.cancel()
+        if inmediato:
+            self._dispatch(0)
+        else:
+            self._trigger()
+    
+    def siguiente_pagina(self, cursor):
+        """Pide la página siguiente de la búsqueda vigente sin invalidarla"""
+        if self._trigger.is_triggered:
+            return  # Hay una búsqueda nueva pendiente: el cursor ya no aplica
+        with self._cond:
+            categoria, busqueda = self._params[:2]
+            self._params = (categoria, busqueda, cursor, time.perf_counter())
+        self._dispatch(0)
+    
+    def _dispatch(self, dt):
+        """Entrega al hilo de trabajo la última búsqueda (hilo de UI)"""
+        with self._cond:
+            self._pendiente = (self._generation,) + self._params
+            self._cond.notify()
+    
+    def _run(self):
+        """Bucle del hilo de trabajo: solo ejecuta la búsqueda más reciente"""
+        while True:
+            with self._cond:
+                while self._pendiente is None:
+                    self._cond.wait()
+                generation, categoria, busqueda, cursor, inicio = self._pendiente
+                self._pendiente = None
+            if generation != self._generation:
+                continue
+            try:
+                with self.db.pool.connection() as conn:
+                    # Aborta la consulta en curso en cuanto llega una entrada más nueva
+                    conn.set_progress_handler(lambda: generation != self._generation, 1000)
+                    try:
+                        filas, siguiente = self.db.get_productos_pagina(categoria, busqueda, cursor)
+                    finally:
+                        conn.set_progress_handler(None, 0)
+            except Exception as e:
+                # Una consulta interrumpida por otra más nueva no es un error; cualquier otro
+                # se registra y el hilo sigue atendiendo las búsquedas siguientes
+                if generation == self._generation:
+                    self.errores += 1
+                    print(f"Error en la búsqueda: {e}")
+                continue
+            Clock.schedule_once(
+                lambda dt, f=filas, s=siguiente, a=cursor is not None: self._deliver(generation, f, s, a, inicio)
             )
-        ''')
+    
+    def _deliver(self, generation, filas, siguiente, anexar, inicio):
+        """Muestra los resultados si siguen vigentes (hilo de UI)"""
+        if generation != self._generation:
+            return
+        self.on_results(filas, siguiente, anexar)
+        if not anexar:
+            self.latencias.append((time.perf_counter() - inicio) * 1000)
+    
+    def estadisticas(self):
+        """Resumen de latencias tecla -> render en milisegundos y búsquedas fallidas"""
+        if not self.latencias:
+            return {'muestras': 0, 'errores': self.errores}
+        ordenadas = sorted(self.latencias)
+        return {
+            'muestras': len(ordenadas),
+            'errores': self.errores,
+            'p50': ordenadas[len(ordenadas) // 2],
+            'p95': ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))],
+            'max': ordenadas[-1],
+        }
+
+# Miniaturas de productos: se generan una vez en disco y se cargan fuera del hilo de UI
+IMAGENES_DIR = 'imagenes'  # Donde se resuelven los imagen_url relativos
+MINIATURAS_DIR = 'miniaturas'
+LADO_MINIATURA = 96  # px del lado mayor
+MEMORIA_MINIATURAS = 8 * 1024 * 1024  # Bytes de texturas RGBA en memoria
+
+# Pillow es opcional: decodifica y reduce sin tomar el GIL, así las miniaturas se generan
+# en hilos sin congelar la interfaz. Se importa al generar la primera miniatura
+_pillow = None
+_pillow_importado = False
+
+def importar_pillow():
+    """Importa PIL.Image bajo demanda; devuelve el módulo o None si Pillow no está instalado"""
+    global _pillow, _pillow_importado
+    if not _pillow_importado:
+        try:
+            from PIL import Image as pillow
+        except ImportError:
+            pillow = None
+            Logger.warning('Miniaturas: Pillow no está instalado; solo se muestran las ya generadas')
+        _pillow = pillow
+        _pillow_importado = True
+    return _pillow
+
+def _chunk_png(tipo, datos):
+    return struct.pack('>I', len(datos)) + tipo + datos + struct.pack('>I', zlib.crc32(tipo + datos))
+
+def escribir_png(ruta, ancho, alto, rgba):
+    """Guarda RGBA (filas de arriba abajo) como PNG, de forma atómica"""
+    fila = ancho * 4
+    crudo = b''.join(b'\x00' + rgba[y * fila:(y + 1) * fila] for y in range(alto))  # Filtro 0 por fila
+    png = (b'\x89PNG\r\n\x1a\n' + _chunk_png(b'IHDR', struct.pack('>IIBBBBB', ancho, alto, 8, 6, 0, 0, 0)) +
+           _chunk_png(b'IDAT', zlib.compress(crudo, 6)) + _chunk_png(b'IEND', b''))
+    temporal = f'{ruta}.{threading.get_ident()}.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(png)
+    os.replace(temporal, ruta)
+
+def leer_png(ruta):
+    """Lee un PNG escrito por escribir_png; devuelve (ancho, alto, rgba)"""
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+    if datos[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError(f'{ruta} no es un PNG')
+    posicion, idat, ancho, alto = 8, [], None, None
+    while posicion < len(datos):
+        largo, tipo = struct.unpack('>I4s', datos[posicion:posicion + 8])
+        contenido = datos[posicion + 8:posicion + 8 + largo]
+        if tipo == b'IHDR':
+            ancho, alto, bits, color = struct.unpack('>IIBB', contenido[:10])
+            if (bits, color) != (8, 6):
+                raise ValueError(f'{ruta}: solo se admite RGBA de 8 bits')
+        elif tipo == b'IDAT':
+            idat.append(contenido)
+        posicion += 12 + largo
+    crudo = zlib.decompress(b''.join(idat))
+    fila = ancho * 4
+    if len(crudo) != (fila + 1) * alto or any(crudo[y * (fila + 1)] for y in range(alto)):
+        raise ValueError(f'{ruta}: formato de filas no soportado')
+    return ancho, alto, b''.join(crudo[y * (fila + 1) + 1:(y + 1) * (fila + 1)] for y in range(alto))
+
+def generar_miniatura(origen, destino, lado):
+    """Decodifica la imagen original con Pillow, la reduce y guarda la miniatura en destino
+    
+    El lado mayor queda en lado px (promedio por bloques). Lanza RuntimeError si
+    Pillow no está instalado.
+    """
+    pillow = importar_pillow()
+    if pillow is None:
+        raise RuntimeError('Pillow no está instalado')
+    with pillow.open(origen) as imagen:
+        # thumbnail() pide al decodificador de JPEG la imagen ya reducida por DCT
+        imagen.thumbnail((lado, lado), pillow.Resampling.BOX)
+        rgba = imagen.convert('RGBA')
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    escribir_png(destino, rgba.width, rgba.height, rgba.tobytes())
+
+class ThumbnailCache:
+    """Miniaturas de imagen_url: caché en disco por contenido y LRU de texturas
+    
+    obtener() devuelve la textura si ya está en memoria; si no, pide la miniatura
+    a los hilos de trabajo (los pedidos más recientes primero, que son las filas
+    visibles) y la entrega en el hilo de UI con callback(imagen_url, textura).
+    En disco cada miniatura se guarda con el hash del archivo original y el lado,
+    así una imagen compartida por varios productos se genera una sola vez.
+    
+    Las miniaturas nuevas se generan con Pillow en los hilos de trabajo: a diferencia
+    del decodificador de SDL2 de Kivy, suelta el GIL y la interfaz sigue fluida. Sin
+    Pillow solo se muestran las miniaturas que ya están en disco.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, directorio_imagenes=IMAGENES_DIR, directorio_cache=MINIATURAS_DIR, lado=LADO_MINIATURA,
+                 memoria_maxima=MEMORIA_MINIATURAS, hilos=2):
+        self.directorio_imagenes = directorio_imagenes
+        self.directorio_cache = directorio_cache
+        self.lado = lado
+        self.memoria_maxima = memoria_maxima
+        self.memoria = 0
+        self.solicitudes = 0
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.generadas = 0
+        self.faltantes = 0
+        self.errores = 0
+        self.evicciones = 0
+        self._texturas = OrderedDict()  # imagen_url -> textura
+        self._pendientes = {}  # imagen_url -> callbacks esperando
+        self._no_disponibles = set()  # Sin archivo o sin poder decodificar: siempre placeholder
+        self._hashes = {}  # (ruta, mtime, tamaño) -> hash del contenido
+        self._cola = queue.LifoQueue()
+        for _ in range(hilos):
+            threading.Thread(target=self._run, daemon=True).start()
+    
+    @classmethod
+    def shared(cls):
+        """Devuelve la caché de miniaturas de la app"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+    
+    def obtener(self, imagen_url, callback=None):
+        """Textura en memoria o None (placeholder); si falta, la carga y llama a callback al tenerla"""
+        if not imagen_url or imagen_url in self._no_disponibles:
+            return None
+        self.solicitudes += 1
+        textura = self._texturas.get(imagen_url)
+        if textura is not None:
+            self._texturas.move_to_end(imagen_url)
+            self.hits_memoria += 1
+            return textura
+        esperando = self._pendientes.get(imagen_url)
+        if esperando is None:
+            self._pendientes[imagen_url] = esperando = []
+            self._cola.put(imagen_url)
+        if callback is not None:
+            esperando.append(callback)
+        return None
+    
+    def ruta_origen(self, imagen_url):
+        return os.path.join(self.directorio_imagenes, imagen_url)
+    
+    def _hash_contenido(self, ruta):
+        info = os.stat(ruta)
+        clave = (ruta, info.st_mtime_ns, info.st_size)
+        digest = self._hashes.get(clave)
+        if digest is None:
+            with open(ruta, 'rb') as f:
+                digest = self._hashes[clave] = hashlib.sha1(f.read()).hexdigest()
+        return digest
+    
+    def ruta_miniatura(self, digest):
+        return os.path.join(self.directorio_cache, digest[:2], f'{digest[2:]}_{self.lado}.png')
+    
+    def cargar_miniatura(self, imagen_url):
+        """En un hilo de trabajo: lee la miniatura de disco o la genera desde el original"""
+        origen = self.ruta_origen(imagen_url)
+        if not os.path.exists(origen):
+            self.faltantes += 1
+            return None
+        destino = self.ruta_miniatura(self._hash_contenido(origen))
+        if os.path.exists(destino):
+            try:
+                resultado = leer_png(destino)
+                self.hits_disco += 1
+                return resultado
+            except (ValueError, zlib.error, struct.error):
+                pass  # Miniatura dañada: se vuelve a generar
+        if importar_pillow() is None:
+            return None
+        generar_miniatura(origen, destino, self.lado)
+        self.generadas += 1
+        return leer_png(destino)
+    
+    def _run(self):
+        while True:
+            imagen_url = self._cola.get()
+            try:
+                resultado = self.cargar_miniatura(imagen_url)
+            except Exception as e:
+                self.errores += 1
+                print(f"Error generando la miniatura de {imagen_url}: {e}")
+                resultado = None
+            Clock.schedule_once(lambda dt, u=imagen_url, r=resultado: self._entregar(u, r))
+    
+    def _entregar(self, imagen_url, resultado):
+        """En el hilo de UI: crea la textura, la guarda en la LRU y avisa a los que esperaban"""
+        callbacks = self._pendientes.pop(imagen_url, [])
+        if resultado is None:
+            self._no_disponibles.add(imagen_url)
+            return
+        ancho, alto, rgba = resultado
+        textura = Texture.create(size=(ancho, alto), colorfmt='rgba')
+        textura.blit_buffer(rgba, colorfmt='rgba', bufferfmt='ubyte')
+        textura.flip_vertical()  # Las filas vienen de arriba abajo
+        self._texturas[imagen_url] = textura
+        self.memoria += ancho * alto * 4
+        while self.memoria > self.memoria_maxima and len(self._texturas) > 1:
+            _, vieja = self._texturas.popitem(last=False)
+            self.memoria -= vieja.width * vieja.height * 4
+            self.evicciones += 1
+        for callback in callbacks:
+            callback(imagen_url, textura)
+    
+    def estadisticas(self):
+        """Contadores, memoria usada y tasas de acierto en memoria y en disco"""
+        cargas = self.hits_disco + self.generadas
+        return {
+            'solicitudes': self.solicitudes,
+            'hits_memoria': self.hits_memoria,
+            'hits_disco': self.hits_disco,
+            'generadas': self.generadas,
+            'faltantes': self.faltantes,
+            'errores': self.errores,
+            'evicciones': self.evicciones,
+            'texturas': len(self._texturas),
+            'memoria_bytes': self.memoria,
+            'tasa_memoria': self.hits_memoria / self.solicitudes if self.solicitudes else None,
+            'tasa_disco': self.hits_disco / cargas if cargas else None,
+        }
+
+# Listas virtualizadas: solo se instancian las filas visibles y se reciclan al hacer scroll
+def crear_lista_reciclable(viewclass, altura, espaciado=10):
+    """Crea un RecycleView vertical con filas de altura fija"""
+    lista = RecycleView()
+    layout = RecycleBoxLayout(
+        orientation='vertical',
+        default_size=(None, altura),
+        default_size_hint=(1, None),
+        size_hint_y=None,
+        spacing=espaciado
+    )
+    layout.bind(minimum_height=layout.setter('height'))
+    lista.add_widget(layout)
+    lista.viewclass = viewclass
+    return lista
+
+class ProductRow(RecycleDataViewBehavior, BoxLayout):
+    """Fila reciclable del catálogo"""
+    COLOR_PLACEHOLDER = [0.85, 0.85, 0.85, 1]
+    
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', padding=5, **kwargs)
+        self.data = {}
+        self.imagen_url = None
         
-        # Insertar datos de ejemplo si no existen
-        cursor.execute('SELECT COUNT(*) FROM productos')
-        if cursor.fetchone()[0] == 0:
-            productos_ejemplo = [
-                ('AMD Ryzen 9 7950X', 'Procesadores', 2480000.00, 'Procesador 16 núcleos, 32 hilos, 4.5GHz base', 8, '1234567890123', 'ryzen_9_7950x.jpg'),
-                ('Intel Core i9-13900K', 'Procesadores', 2715000.00, 'Procesador 24 núcleos, 32 hilos, hasta 5.8GHz', 12, '1234567890124', 'intel_i9_13900k.jpg'),
-                ('AMD Ryzen 7 7700X', 'Procesadores', 1269000.10, 'Procesador 8 núcleos, 16 hilos, 4.5GHz base', 15, '1234567890125', 'ryzen_7_7700x.jpg'),
-                ('NVIDIA RTX 4090', 'Tarjetas Gráficas', 13693374.36, 'GPU de alta gama, 24GB GDDR6X', 5, '1234567890126', 'rtx_4090.jpg'),
-                ('AMD RX 7900 XTX', 'Tarjetas Gráficas', 4500000.14, 'GPU potente, 24GB GDDR6', 7, '1234567890127', 'rx_7900_xtx.jpg'),
-                ('NVIDIA RTX 4070', 'Tarjetas Gráficas', 4991750.14, 'GPU gaming, 12GB GDDR6X', 10, '1234567890128', 'rtx_4070.jpg'),
-                ('Corsair Vengeance DDR5 32GB', 'Memorias RAM', 975620.25, 'Kit 2x16GB DDR5-5600MHz RGB', 20, '1234567890129', 'corsair_ddr5_32gb.jpg'),
-                ('G.Skill Trident Z5 RGB 16GB', 'Memorias RAM', 520000.25, 'Kit 2x8GB DDR5-6000MHz', 25, '1234567890130', 'gskill_ddr5_16gb.jpg'),
-                ('Kingston Fury Beast 64GB', 'Memorias RAM', 107143.45, 'Kit 4x16GB DDR4-3200MHz', 8, '1234567890131', 'kingston_64gb.jpg'),
-                ('ASUS ROG Strix X670E-E', 'Motherboards', 2105900.25, 'Placa AM5, WiFi 6E, PCIe 5.0', 6, '1234567890132', 'asus_x670e.jpg'),
-                ('MSI MAG B550 Tomahawk', 'Motherboards', 749000.14, 'Placa AM4, PCIe 4.0, USB-C', 12, '1234567890133', 'msi_b550.jpg'),
-                ('Gigabyte Z790 AORUS Elite', 'Motherboards', 13150000.24, 'Placa LGA1700, DDR5, WiFi 6', 9, '1234567890134', 'gigabyte_z790.jpg'),
-                ('Samsung 980 PRO 2TB', 'Almacenamiento', 415000.58, 'SSD NVMe M.2, 7000MB/s lectura', 15, '1234567890135', 'samsung_980_pro.jpg'),
-                ('WD Black SN850X 1TB', 'Almacenamiento', 2273400.25, 'SSD NVMe gaming, 7300MB/s', 20, '1234567890136', 'wd_black_sn850x.jpg'),
-                ('Seagate IronWolf 4TB', 'Almacenamiento', 998500.69, 'HDD NAS, 5400RPM, CMR', 18, '1234567890137', 'seagate_ironwolf.jpg'),
-                ('Corsair RM850x', 'Fuentes de Poder', 930252.85, '850W 80+ Gold modular', 12, '1234567890138', 'corsair_rm850x.jpg'),
-                ('EVGA SuperNOVA 1000W', 'Fuentes de Poder', 187520.65, '1000W 80+ Platinum modular', 8, '1234567890139', 'evga_1000w.jpg'),
-                ('Seasonic Focus GX-650', 'Fuentes de Poder', 584000.35, '650W 80+ Gold semi-modular', 15, '1234567890140', 'seasonic_650w.jpg'),
-            ]
-            cursor.executemany('''
-                INSERT INTO productos (nombre, categoria, precio, descripcion, stock, codigo_barras, imagen_url)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', productos_ejemplo)
-        
-        conn.commit()
-        conn.close()
+        # Miniatura (placeholder gris hasta que llega la textura)
+        self.imagen = Image(size_hint_x=0.2, color=self.COLOR_PLACEHOLDER)
+        
+        # Información del producto
+        info_layout = BoxLayout(orientation='vertical', size_hint_x=0.55)
+        
+        self.nombre_label = Label(font_size=14, bold=True, text_size=(250, None), halign='left')
+        self.categoria_label = Label(font_size=11, text_size=(250, None), halign='left')
+        self.precio_label = Label(font_size=13, bold=True, color=[0, 0.7, 0, 1])
+        self.stock_label = Label(font_size=11, text_size=(250, None), halign='left')
+        
+        info_layout.add_widget(self.nombre_label)
+        info_layout.add_widget(self.categoria_label)
+        info_layout.add_widget(self.precio_label)
+        info_layout.add_widget(self.stock_label)
+        
+        # Botón agregar al carrito
+        add_btn = Button(text='Agregar\nal Carrito', size_hint_x=0.25)
+        add_btn.bind(on_press=lambda x: self.data['accion'](self.data['producto_id']))
+        
+        self.add_widget(self.imagen)
+        self.add_widget(info_layout)
+        self.add_widget(add_btn)
     
-    def get_productos(self, categoria=None, busqueda=None):
-        """Obtiene productos con filtros opcionales"""
-        conn = sqlite3.connect('computer_store.db')
-        cursor = conn.cursor()
+    def refresh_view_attrs(self, rv, index, data):
+        """Actualiza la fila reciclada con los datos de otro producto"""
+        self.data = data
+        self.nombre_label.text = data['nombre']
+        self.categoria_label.text = f"📦 {data['categoria']}"
+        self.precio_label.text = f"💲 {formatear_precio(data['precio_centavos'])}"
+        self.stock_label.text = f"📊 Stock: {data['stock']} unidades"
+        self.imagen_url = data.get('imagen_url')
+        self.mostrar_miniatura(self.imagen_url, ThumbnailCache.shared().obtener(self.imagen_url, self.mostrar_miniatura))
+    
+    def mostrar_miniatura(self, imagen_url, textura):
+        """Muestra la textura si la fila sigue mostrando esa imagen (las filas se reciclan)"""
+        if imagen_url != self.imagen_url:
+            return
+        self.imagen.texture = textura
+        self.imagen.color = [1, 1, 1, 1] if textura is not None else self.COLOR_PLACEHOLDER
+
+class CartRow(RecycleDataViewBehavior, BoxLayout):
+    """Fila reciclable del carrito"""
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', padding=5, **kwargs)
+        self.data = {}
+        
+        # Información del item
+        info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
+        
+        self.nombre_label = Label(font_size=14, bold=True)
+        self.cantidad_label = Label()
+        self.precio_label = Label()
+        self.subtotal_label = Label(bold=True)
+        
+        info_layout.add_widget(self.nombre_label)
+        info_layout.add_widget(self.cantidad_label)
+        info_layout.add_widget(self.precio_label)
+        info_layout.add_widget(self.subtotal_label)
+        
+        # Botones de cantidad y eliminar
+        buttons_layout = BoxLayout(orientation='vertical', size_hint_x=0.3)
         
-        query = 'SELECT * FROM productos WHERE 1=1'
-        params = []
+        cantidad_layout = BoxLayout(orientation='horizontal')
+        menos_btn = Button(text='-')
+        menos_btn.bind(on_press=lambda x: self.data['cambiar'](self.data['producto_id'], self.data['cantidad'] - 1))
+        mas_btn = Button(text='+')
+        mas_btn.bind(on_press=lambda x: self.data['cambiar'](self.data['producto_id'], self.data['cantidad'] + 1))
+        cantidad_layout.add_widget(menos_btn)
+        cantidad_layout.add_widget(mas_btn)
         
-        if categoria and categoria != 'Todos':
-            query += ' AND categoria = ?'
-            params.append(categoria)
+        remove_btn = Button(text='Eliminar')
+        remove_btn.bind(on_press=lambda x: self.data['accion'](self.data['producto_id']))
         
-        if busqueda:
-            query += ' AND (nombre LIKE ? OR descripcion LIKE ?)'
-            params.extend([f'%{busqueda}%', f'%{busqueda}%'])
+        buttons_layout.add_widget(cantidad_layout)
+        buttons_layout.add_widget(remove_btn)
         
-        cursor.execute(query, params)
-        productos = cursor.fetchall()
-        conn.close()
-        return productos
+        self.add_widget(info_layout)
+        self.add_widget(buttons_layout)
     
-    def get_producto_por_codigo(self, codigo):
-        """Busca producto por código de barras"""
-        conn = sqlite3.connect('computer_store.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM productos WHERE codigo_barras = ?', (codigo,))
-        producto = cursor.fetchone()
-        conn.close()
-        return producto
-    
-    def agregar_al_carrito(self, producto_id, cantidad=1):
-        """Agrega producto al carrito"""
-        conn = sqlite3.connect('computer_store.db')
-        cursor = conn.cursor()
-        
-        # Verificar si el producto ya está en el carrito
-        cursor.execute('SELECT * FROM carrito WHERE producto_id = ?', (producto_id,))
-        item_existente = cursor.fetchone()
-        
-        if item_existente:
-            # Actualizar cantidad
-            nueva_cantidad = item_existente[2] + cantidad
-            cursor.execute('UPDATE carrito SET cantidad = ? WHERE producto_id = ?', 
-                         (nueva_cantidad, producto_id))
-        else:
-            # Obtener precio del producto
-            cursor.execute('SELECT precio FROM productos WHERE id = ?', (producto_id,))
-            precio = cursor.fetchone()[0]
-            
-            # Insertar nuevo item
-            cursor.execute('''
-                INSERT INTO carrito (producto_id, cantidad, precio_unitario)
-                VALUES (?, ?, ?)
-            ''', (producto_id, cantidad, precio))
+    def refresh_view_attrs(self, rv, index, data):
+        """Actualiza la fila reciclada con los datos de otro item"""
+        self.data = data
+        self.nombre_label.text = data['nombre']
+        self.cantidad_label.text = f"Cantidad: {data['cantidad']}"
+        self.precio_label.text = f"{formatear_precio(data['precio_unitario_centavos'])} c/u"
+        self.subtotal_label.text = f"Subtotal: {formatear_precio(data['subtotal_centavos'])}"
+
+class StoreRow(RecycleDataViewBehavior, BoxLayout):
+    """Fila reciclable de tiendas cercanas"""
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', padding=5, **kwargs)
+        self.data = {}
         
-        conn.commit()
-        conn.close()
-    
-    def get_carrito(self):
-        """Obtiene items del carrito con información del producto"""
-        conn = sqlite3.connect('computer_store.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT c.id, p.nombre, c.cantidad, c.precio_unitario, 
-                   (c.cantidad * c.precio_unitario) as subtotal, p.id as producto_id
-            FROM carrito c
-            JOIN productos p ON c.producto_id = p.id
-        ''')
-        items = cursor.fetchall()
-        conn.close()
-        return items
-    
-    def limpiar_carrito(self):
-        """Limpia el carrito de compras"""
-        conn = sqlite3.connect('computer_store.db')
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM carrito')
-        conn.commit()
-        conn.close()
-    
-    def crear_pedido(self, total, direccion, ubicacion_gps):
-        """Crea un nuevo pedido"""
-        conn = sqlite3.connect('computer_store.db')
-        cursor = conn.cursor()
-        
-        # Crear pedido
-        cursor.execute('''
-            INSERT INTO pedidos (total, direccion, ubicacion_gps)
-            VALUES (?, ?, ?)
-        ''', (total, direccion, ubicacion_gps))
+        # Información de la tienda
+        info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
         
-        pedido_id = cursor.lastrowid
+        self.nombre_label = Label(font_size=14, bold=True)
+        self.direccion_label = Label(font_size=12)
+        self.distancia_label = Label(font_size=12)
+        self.especialidad_label = Label(font_size=11, color=[0, 0.7, 0, 1])
         
-        # Agregar detalles del pedido
-        items_carrito = self.get_carrito()
-        for item in items_carrito:
-            cursor.execute('''
-                INSERT INTO detalles_pedidos (pedido_id, producto_id, cantidad, precio_unitario)
-                VALUES (?, ?, ?, ?)
-            ''', (pedido_id, item[5], item[2], item[3]))
+        info_layout.add_widget(self.nombre_label)
+        info_layout.add_widget(self.direccion_label)
+        info_layout.add_widget(self.distancia_label)
+        info_layout.add_widget(self.especialidad_label)
         
-        conn.commit()
-        conn.close()
-        return pedido_id
-
-# Clase para manejo de GPS real
-class GPSManager:
-    def __init__(self):
-        self.current_location = {"lat": 10.4236, "lon": -75.5378}  # Valor por defecto
-        if platform == 'android':
-            self.configure_gps()
-    
-    def configure_gps(self):
-        """Configura el GPS usando plyer"""
-        try:
-            gps.configure(on_location=self.on_location)
-            gps.start(minTime=1000, minDistance=1)
-        except NotImplementedError:
-            print("GPS no soportado en esta plataforma")
-    
-    def on_location(self, **kwargs):
-        """Actualiza la ubicación cuando se recibe nueva data"""
-        self.current_location = {"lat": kwargs.get('lat', 10.4236), "lon": kwargs.get('lon', -75.5378)}
-    
-    def get_current_location(self):
-        """Obtiene la ubicación actual"""
-        return self.current_location
+        # Botón de navegación
+        nav_btn = Button(text='Cómo\nLlegar', size_hint_x=0.3)
+        nav_btn.bind(on_press=lambda x: self.data['accion'](self.data['tienda']))
+        
+        self.add_widget(info_layout)
+        self.add_widget(nav_btn)
     
-    def calculate_distance(self, lat1, lon1, lat2, lon2):
-        """Calcula distancia entre dos puntos"""
-        import math
-        R = 6371  # Radio de la Tierra en km
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = (math.sin(dlat/2) * math.sin(dlat/2) + 
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-             math.sin(dlon/2) * math.sin(dlon/2))
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        distance = R * c
-        return distance
+    def refresh_view_attrs(self, rv, index, data):
+        """Actualiza la fila reciclada con los datos de otra tienda"""
+        self.data = data
+        tienda = data['tienda']
+        self.nombre_label.text = f"🔧 {tienda['nombre']}"
+        self.direccion_label.text = tienda['direccion']
+        self.distancia_label.text = f"📍 {tienda['distancia']} km"
+        self.especialidad_label.text = f"⚡ {tienda['especialidad']}"
 
-# Clase para manejo del acelerómetro
-class AccelerometerManager:
-    def __init__(self):
-        self.shake_threshold = 2.5
-        self.last_shake_time = 0
-        self.shake_callback = None
-        self.enabled = False
-    
-    def start_monitoring(self, callback):
-        """Inicia monitoreo del acelerómetro"""
-        self.shake_callback = callback
-        try:
-            accelerometer.enable()
-            self.enabled = True
-            Clock.schedule_interval(self.check_accelerometer, 0.1)
-        except NotImplementedError:
-            print("Acelerómetro no soportado")
-    
-    def check_accelerometer(self, dt):
-        """Verifica si hay un shake"""
-        if not self.enabled:
-            return
-        try:
-            accel_data = accelerometer.acceleration
-            if accel_data:
-                x, y, z = accel_data[:3]
-                magnitude = (x**2 + y**2 + z**2)**0.5
-                current_time = time.time()
-                if magnitude > self.shake_threshold and current_time - self.last_shake_time > 2:
-                    self.last_shake_time = current_time
-                    if self.shake_callback:
-                        self.shake_callback()
-        except Exception:
-            pass
+class OrderRow(RecycleDataViewBehavior, BoxLayout):
+    """Fila reciclable del historial de pedidos"""
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', padding=5, **kwargs)
+        self.data = {}
+        
+        info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
+        
+        self.pedido_label = Label(font_size=14, bold=True)
+        self.fecha_label = Label(font_size=11)
+        self.total_label = Label(font_size=13, color=[0, 0.7, 0, 1])
+        
+        info_layout.add_widget(self.pedido_label)
+        info_layout.add_widget(self.fecha_label)
+        info_layout.add_widget(self.total_label)
+        
+        detalle_btn = Button(text='Ver\nDetalle', size_hint_x=0.3)
+        detalle_btn.bind(on_press=lambda x: self.data['accion'](self.data['pedido_id']))
+        
+        self.add_widget(info_layout)
+        self.add_widget(detalle_btn)
     
-    def stop_monitoring(self):
-        """Detiene el monitoreo"""
-        if self.enabled:
-            accelerometer.disable()
-            self.enabled = False
+    def refresh_view_attrs(self, rv, index, data):
+        """Actualiza la fila reciclada con los datos de otro pedido"""
+        self.data = data
+        self.pedido_label.text = f"🧾 Pedido #{data['pedido_id']} · {data['estado']}"
+        self.fecha_label.text = f"{data['fecha']} · {data['unidades']} unidades"
+        self.total_label.text = formatear_precio(data['total_centavos'])
 
 # Pantalla principal con catálogo
 class HomeScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.db = DatabaseManager()
+        self.db = DatabaseManager.shared()
+        self.search = SearchPipeline(self.db, self.render_products)
         self.build_ui()
     
     def build_ui(self):
@@ -334,12 +3446,11 @@ class HomeScreen(Screen):
             btn.bind(on_press=lambda x, cat=categoria: self.filter_by_category(cat))
             category_layout.add_widget(btn)
         
-        # Lista de productos
-        self.productos_layout = GridLayout(cols=1, spacing=10, size_hint_y=None)
-        self.productos_layout.bind(minimum_height=self.productos_layout.setter('height'))
-        
-        scroll = ScrollView()
-        scroll.add_widget(self.productos_layout)
+        # Lista de productos (carga la página siguiente al acercarse al final)
+        self.productos_list = crear_lista_reciclable(ProductRow, 100)
+        self.productos_list.bind(scroll_y=self.on_scroll)
+        self.siguiente_cursor = None
+        self.cargando_pagina = False
         
         # Navegación inferior
         nav_layout = BoxLayout(orientation='horizontal', size_hint_y=0.08, spacing=10)
@@ -353,67 +3464,80 @@ class HomeScreen(Screen):
         mapa_btn = Button(text='Tiendas')
         mapa_btn.bind(on_press=self.go_to_map)
         
+        ventas_btn = Button(text='Ventas')
+        ventas_btn.bind(on_press=self.go_to_orders)
+        
         nav_layout.add_widget(carrito_btn)
         nav_layout.add_widget(scanner_btn)
         nav_layout.add_widget(mapa_btn)
+        nav_layout.add_widget(ventas_btn)
         
         main_layout.add_widget(header_layout)
         main_layout.add_widget(category_layout)
-        main_layout.add_widget(scroll)
+        main_layout.add_widget(self.productos_list)
         main_layout.add_widget(nav_layout)
         
         self.add_widget(main_layout)
         self.load_products()  # Asegurar recarga inicial
     
     def load_products(self, categoria=None, busqueda=None):
-        """Carga productos en la interfaz"""
-        self.productos_layout.clear_widgets()
-        productos = self.db.get_productos(categoria, busqueda)
-        
-        for producto in productos:
-            product_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=100, padding=5)
-            product_layout.canvas.before.clear()
-            
-            # Información del producto
-            info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
-            
-            nombre_label = Label(text=producto[1], font_size=14, bold=True, text_size=(250, None), halign='left')
-            categoria_label = Label(text=f"📦 {producto[2]}", font_size=11, text_size=(250, None), halign='left')
-            precio_label = Label(text=f"💲 ${producto[3]:,.2f}", font_size=13, bold=True, color=[0, 0.7, 0, 1])
-            stock_label = Label(text=f"📊 Stock: {producto[5]} unidades", font_size=11, text_size=(250, None), halign='left')
-            
-            info_layout.add_widget(nombre_label)
-            info_layout.add_widget(categoria_label)
-            info_layout.add_widget(precio_label)
-            info_layout.add_widget(stock_label)
-            
-            # Botón agregar al carrito
-            add_btn = Button(text='Agregar\nal Carrito', size_hint_x=0.3)
-            add_btn.bind(on_press=lambda x, pid=producto[0]: self.add_to_cart(pid))
-            
-            product_layout.add_widget(info_layout)
-            product_layout.add_widget(add_btn)
-            
-            self.productos_layout.add_widget(product_layout)
+        """Carga la primera página de productos en la interfaz (consulta en el hilo de búsqueda)"""
+        self.search.submit(categoria=categoria, busqueda=busqueda, inmediato=True)
+    
+    def render_products(self, productos, siguiente=None, anexar=False):
+        """Muestra una página de productos (id, nombre, categoria, precio_centavos, stock, imagen_url)"""
+        datos = [
+            {
+                'producto_id': producto[0],
+                'nombre': producto[1],
+                'categoria': producto[2],
+                'precio_centavos': producto[3],
+                'stock': producto[4],
+                'imagen_url': producto[5],
+                'accion': self.add_to_cart,
+            }
+            for producto in productos
+        ]
+        if anexar:
+            self.productos_list.data.extend(datos)
+        else:
+            self.productos_list.data = datos
+            self.productos_list.scroll_y = 1
+        self.siguiente_cursor = siguiente
+        self.cargando_pagina = False
+    
+    def on_scroll(self, instance, scroll_y):
+        """Pide la página siguiente cuando el scroll llega cerca del final"""
+        if scroll_y <= 0.1 and self.siguiente_cursor is not None and not self.cargando_pagina:
+            self.cargando_pagina = True
+            self.search.siguiente_pagina(self.siguiente_cursor)
     
     def on_search(self, instance, text):
         """Búsqueda en tiempo real"""
         if len(text) >= 3 or text == '':
-            self.load_products(busqueda=text)
+            self.search.submit(busqueda=text)
     
     def search_products(self, instance):
         """Búsqueda manual"""
         busqueda = self.search_input.text
-        self.load_products(busqueda=busqueda)
+        self.search.submit(busqueda=busqueda, inmediato=True)
     
     def filter_by_category(self, categoria):
         """Filtra productos por categoría"""
-        self.load_products(categoria=categoria)
+        self.search.submit(categoria=categoria, inmediato=True)
     
     def add_to_cart(self, producto_id):
         """Agrega producto al carrito"""
-        self.db.agregar_al_carrito(producto_id)
-        self.show_popup("Producto agregado al carrito exitosamente")
+        try:
+            CartModel.shared().agregar(producto_id, on_done=self.on_added_to_cart)
+        except ColaLlenaError:
+            self.show_popup(MENSAJE_OCUPADO)
+    
+    def on_added_to_cart(self, agregado):
+        if agregado:
+            self.show_popup("Producto agregado al carrito exitosamente")
+        else:
+            self.show_popup("Producto no encontrado")
     
     def show_popup(self, message):
         """Muestra mensaje popup"""
@@ -431,13 +3555,21 @@ class HomeScreen(Screen):
     def go_to_map(self, instance):
         """Navega al mapa"""
         self.manager.current = 'map'
+    
+    def go_to_orders(self, instance):
+        """Navega al historial de pedidos y ventas"""
+        self.manager.current = 'orders'
 
 # Pantalla del carrito
 class CartScreen(Screen):
-    def __init__(self, **kwargs):
+    def __init__(self, carrito=None, **kwargs):
         super().__init__(**kwargs)
-        self.db = DatabaseManager()
+        self.carrito = carrito or CartModel.shared()
+        self.db = self.carrito.db
+        self.posiciones = {}  # producto_id -> índice de su fila en cart_list.data
+        self.carrito.observar(self.on_cart_changed)
         self.accel = AccelerometerManager()
+        self.gps = GPSManager.shared()
         self.build_ui()
     
     def build_ui(self):
@@ -459,11 +3591,8 @@ class CartScreen(Screen):
         header_layout.add_widget(clear_btn)
         
         # Lista de items del carrito
-        self.cart_layout = GridLayout(cols=1, spacing=10, size_hint_y=None)
-        self.cart_layout.bind(minimum_height=self.cart_layout.setter('height'))
-        
-        scroll = ScrollView()
-        scroll.add_widget(self.cart_layout)
+        self.cart_list = crear_lista_reciclable(CartRow, 80)
+        self.empty_label = Label(text='', font_size=16, size_hint_y=None, height=0)
         
         # Total y checkout
         bottom_layout = BoxLayout(orientation='vertical', size_hint_y=0.2, spacing=10)
@@ -484,70 +3613,98 @@ class CartScreen(Screen):
         bottom_layout.add_widget(shake_btn)
         
         main_layout.add_widget(header_layout)
-        main_layout.add_widget(scroll)
+        main_layout.add_widget(self.empty_label)
+        main_layout.add_widget(self.cart_list)
         main_layout.add_widget(bottom_layout)
         
         self.add_widget(main_layout)
-        
-        # Configurar acelerómetro
-        self.accel.start_monitoring(self.on_shake_detected)
     
     def on_enter(self):
         """Se ejecuta cuando se entra a la pantalla"""
-        self.load_cart_items()
+        # La lista ya refleja cada cambio hecho por el modelo; solo se consulta si no está sincronizado
+        if not self.carrito.sincronizado:
+            self.load_cart_items()
+        # El acelerómetro solo se lee mientras el carrito está visible; el GPS se
+        # enciende ya para tener una ubicación reciente al confirmar el pedido
+        self.accel.start_monitoring(self.on_shake_detected)
+        self.gps.start()
+    
+    def on_leave(self):
+        """Deja de leer los sensores al salir de la pantalla"""
+        self.accel.stop_monitoring()
+        self.gps.stop()
     
     def load_cart_items(self):
-        """Carga los items del carrito"""
-        self.cart_layout.clear_widgets()
-        items = self.db.get_carrito()
-        total = 0
-        
-        for item in items:
-            item_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=80, padding=5)
-            
-            # Información del item
-            info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
-            
-            nombre_label = Label(text=item[1], font_size=14, bold=True)
-            cantidad_label = Label(text=f"Cantidad: {item[2]}")
-            precio_label = Label(text=f"${item[3]:,.2f} c/u")
-            subtotal_label = Label(text=f"Subtotal: ${item[4]:,.2f}", bold=True)
-            
-            info_layout.add_widget(nombre_label)
-            info_layout.add_widget(cantidad_label)
-            info_layout.add_widget(precio_label)
-            info_layout.add_widget(subtotal_label)
-            
-            # Botón eliminar
-            remove_btn = Button(text='Eliminar', size_hint_x=0.3)
-            remove_btn.bind(on_press=lambda x, iid=item[0]: self.remove_item(iid))
-            
-            item_layout.add_widget(info_layout)
-            item_layout.add_widget(remove_btn)
-            
-            self.cart_layout.add_widget(item_layout)
-            total += item[4]
-        
-        self.total_label.text = f'Total: ${total:,.2f}'
+        """Reconcilia el carrito con la base de datos (recarga completa)"""
+        try:
+            self.carrito.reconciliar()
+        except ColaLlenaError:
+            # Se vuelve a intentar la próxima vez que se abra el carrito
+            self.carrito.marcar_desincronizado()
+            self.show_popup(MENSAJE_OCUPADO)
+    
+    def on_cart_changed(self, evento, linea):
+        """Aplica a la lista solo la línea que cambió"""
+        datos = self.cart_list.data
+        if evento == 'recargada':
+            self.cart_list.data = [self.crear_fila(linea) for linea in self.carrito.lineas.values()]
+            # Si los datos no cambiaron Kivy conserva la lista anterior: indexar la que quedó
+            self.posiciones = {fila['producto_id']: i for i, fila in enumerate(self.cart_list.data)}
+        elif evento == 'agregada':
+            self.posiciones[linea['producto_id']] = len(datos)
+            datos.append(self.crear_fila(linea))
+        elif evento == 'actualizada':
+            posicion = self.posiciones[linea['producto_id']]
+            fila = datos[posicion]
+            fila.update(cantidad=linea['cantidad'], subtotal_centavos=linea['subtotal_centavos'])
+            datos[posicion] = fila  # Refresca solo esa fila
+        elif evento == 'eliminada':
+            # La última fila ocupa el lugar de la eliminada: nada se desplaza ni se reindexa
+            posicion = self.posiciones.pop(linea['producto_id'])
+            ultima = datos.pop()
+            if posicion < len(datos):
+                datos[posicion] = ultima
+                self.posiciones[ultima['producto_id']] = posicion
+        self.update_total()
+    
+    def crear_fila(self, linea):
+        """Datos de CartRow para una línea del modelo"""
+        fila = dict(linea)
+        fila['accion'] = self.remove_item
+        fila['cambiar'] = self.change_quantity
+        return fila
+    
+    def update_total(self):
+        """Muestra el total acumulado del modelo (sin sumar las líneas)"""
+        self.total_label.text = f'Total: {formatear_precio(self.carrito.total_centavos)}'
         
-        if len(items) == 0:
-            empty_label = Label(text='El carrito está vacío', font_size=16)
-            self.cart_layout.add_widget(empty_label)
+        if not self.carrito.lineas:
+            self.empty_label.text = 'El carrito está vacío'
+            self.empty_label.height = 40
+        else:
+            self.empty_label.text = ''
+            self.empty_label.height = 0
     
-    def remove_item(self, item_id):
+    def remove_item(self, producto_id):
         """Elimina item del carrito"""
-        conn = sqlite3.connect('computer_store.db')
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM carrito WHERE id = ?', (item_id,))
-        conn.commit()
-        conn.close()
-        self.load_cart_items()
+        try:
+            self.carrito.eliminar(producto_id)
+        except ColaLlenaError:
+            self.show_popup(MENSAJE_OCUPADO)
+    
+    def change_quantity(self, producto_id, cantidad):
+        """Cambia la cantidad de una línea (0 la elimina)"""
+        try:
+            self.carrito.cambiar_cantidad(producto_id, cantidad)
+        except ColaLlenaError:
+            self.show_popup(MENSAJE_OCUPADO)
     
     def clear_cart(self, instance):
         """Limpia el carrito"""
-        self.db.limpiar_carrito()
-        self.load_cart_items()
-        self.show_popup("Carrito limpiado")
+        try:
+            self.carrito.limpiar(on_done=lambda _: self.show_popup("Carrito limpiado"))
+        except ColaLlenaError:
+            self.show_popup(MENSAJE_OCUPADO)
     
     def on_shake_detected(self):
         """Se ejecuta cuando se detecta shake"""
@@ -555,26 +3712,33 @@ class CartScreen(Screen):
     
     def checkout(self, instance):
         """Procede al checkout"""
-        items = self.db.get_carrito()
-        if not items:
-            self.show_popup("El carrito está vacío")
-            return
-        
-        total = sum(item[4] for item in items)
-        
-        # Usar GPS real para ubicación
-        gps = GPSManager()
-        location = gps.get_current_location()
+        # Última ubicación conocida del servicio compartido (no espera al GPS)
+        location = self.gps.get_current_location()
         ubicacion_gps = f"{location['lat']},{location['lon']}"
         
-        # Crear pedido
-        pedido_id = self.db.crear_pedido(total, "Dirección de envío", ubicacion_gps)
-        
-        # Limpiar carrito
-        self.db.limpiar_carrito()
+        # Crear pedido (descuenta stock y limpia el carrito en la misma transacción)
+        try:
+            self.carrito.crear_pedido("Dirección de envío", ubicacion_gps,
+                                      on_done=self.on_order_created, on_error=self.on_order_failed)
+        except ColaLlenaError:
+            self.show_popup(MENSAJE_OCUPADO)
+    
+    def on_order_created(self, resultado):
+        if resultado is None:
+            self.show_popup("El carrito está vacío")
+            return
         
-        self.show_popup(f"Pedido #{pedido_id} creado exitosamente!\nTotal: ${total:,.2f}")
-        self.load_cart_items()
+        pedido_id, total = resultado
+        sincronizador = OrderSyncWorker.shared()
+        if sincronizador is not None:
+            sincronizador.despertar()
+        self.show_popup(f"Pedido #{pedido_id} creado exitosamente!\nTotal: {formatear_precio(total)}")
+    
+    def on_order_failed(self, error):
+        if isinstance(error, StockInsuficienteError):
+            self.show_popup(f"Stock insuficiente para:\n{', '.join(error.productos)}")
+        else:
+            self.show_popup(f"No se pudo crear el pedido: {error}")
     
     def show_popup(self, message):
         """Muestra mensaje popup"""
@@ -589,7 +3753,12 @@ class CartScreen(Screen):
 class ScannerScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.db = DatabaseManager()
+        self.db = DatabaseManager.shared()
+        self.scanner = BarcodeScanner(self.on_code_detected)
+        self.lote = None  # BatchScanSession mientras el modo lote está activo
+        self.popup = None
+        self.camera = None
+        self.camara_disponible = False
         self.build_ui()
     
     def build_ui(self):
@@ -607,23 +3776,23 @@ class ScannerScreen(Screen):
         header_layout.add_widget(title_label)
         header_layout.add_widget(Label(size_hint_x=0.3))  # Espaciador
         
-        # Área de la cámara
-        camera_layout = BoxLayout(orientation='vertical', size_hint_y=0.6)
-        
-        try:
-            self.camera = Camera(resolution=(640, 480), play=True)
-            self.camera.bind(on_texture=self.update_camera)
-        except Exception as e:
-            self.camera = Label(
-                text=f'[Cámara no disponible]\nError: {str(e)}\nEnfoca el código de barras',
-                font_size=16,
-                halign='center'
-            )
+        # Área de la cámara (la cámara se crea al entrar por primera vez)
+        self.camera_layout = camera_layout = BoxLayout(orientation='vertical', size_hint_y=0.6)
         
-        capture_btn = Button(text='📸 Capturar Código', size_hint_y=0.2)
+        capture_btn = Button(text='📸 Capturar Código')
         capture_btn.bind(on_press=self.capture_code)
-        camera_layout.add_widget(self.camera)
-        camera_layout.add_widget(capture_btn)
+        
+        self.batch_btn = Button(text='Modo lote')
+        self.batch_btn.bind(on_press=self.toggle_batch)
+        
+        actions_layout = BoxLayout(orientation='horizontal', size_hint_y=0.2, spacing=10)
+        actions_layout.add_widget(capture_btn)
+        actions_layout.add_widget(self.batch_btn)
+        
+        self.batch_label = Label(text='', size_hint_y=0.1)
+        
+        camera_layout.add_widget(actions_layout)
+        camera_layout.add_widget(self.batch_label)
         
         # Área de entrada manual
         manual_layout = BoxLayout(orientation='vertical', size_hint_y=0.2, spacing=10)
@@ -663,25 +3832,63 @@ class ScannerScreen(Screen):
         
         self.add_widget(main_layout)
     
-    def update_camera(self, *args):
-        """Actualiza la vista de la cámara (opcional)"""
-        pass
-    
-    def capture_code(self, instance):
-        """Captura una imagen y procesa el código"""
+    def crear_camara(self):
+        """Crea la cámara; elegir el proveedor es costoso, por eso se hace al entrar"""
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            photo_path = f"barcode_{timestamp}.jpg"
-            camera.take_picture(filename=photo_path, on_complete=self.on_picture_taken)
-        except NotImplementedError:
-            self.show_popup("📷 Cámara no soportada en esta plataforma")
+            from kivy.uix.camera import Camera
+            self.camera = Camera(resolution=(640, 480), play=False)
+            self.camara_disponible = True
+        except Exception as e:
+            self.camera = Label(
+                text=f'[Cámara no disponible]\nError: {str(e)}\nEnfoca el código de barras',
+                font_size=16,
+                halign='center'
+            )
+        self.camera_layout.add_widget(self.camera, index=len(self.camera_layout.children))
+    
+    def on_enter(self):
+        """Enciende la cámara y muestrea frames solo mientras la pantalla está visible"""
+        if self.camera is None:
+            self.crear_camara()
+        if self.camara_disponible:
+            self.camera.play = True
+        Clock.schedule_interval(self.update_camera, 1 / self.scanner.fps)
+    
+    def on_leave(self):
+        """Apaga la cámara, deja de muestrear frames y confirma el lote pendiente"""
+        Clock.unschedule(self.update_camera)
+        if self.camara_disponible:
+            self.camera.play = False
+        if self.lote is not None:
+            self.finish_batch()
     
-    def on_picture_taken(self, photo_path):
-        """Procesa la imagen capturada (simulado por ahora)"""
-        # Simulación: usa un código fijo para pruebas
-        code = "1234567890123"  # Reemplazar con decodificación real (ver notas)
+    def update_camera(self, dt):
+        """Envía el frame actual de la cámara al decodificador si está libre"""
+        if self.scanner.listo_para_frame():
+            self.enviar_frame_actual()
+    
+    def enviar_frame_actual(self):
+        """Lee los píxeles de la textura de la cámara (sin pasar por disco)"""
+        # Si la cámara no está disponible self.camera es un Label (que también tiene textura)
+        texture = self.camera.texture if self.camara_disponible else None
+        if texture is None:
+            return False
+        ancho, alto = texture.size
+        self.scanner.enviar_frame(texture.pixels, ancho, alto)
+        return True
+    
+    def on_code_detected(self, code):
+        """Código leído por el escaneo continuo; se ignora si hay un popup abierto"""
+        if self.popup is not None and self.popup.parent is not None:
+            return
+        self.code_input.text = code
         self.scan_code(code)
     
+    def capture_code(self, instance):
+        """Decodifica el frame actual de inmediato"""
+        if not self.enviar_frame_actual():
+            self.show_popup("📷 Cámara no soportada en esta plataforma")
+    
     def search_by_code(self, instance):
         """Busca producto por código"""
         code = self.code_input.text.strip()
@@ -696,16 +3903,67 @@ class ScannerScreen(Screen):
         self.code_input.text = code
         self.scan_code(code)
     
+    def toggle_batch(self, instance):
+        """Activa el modo lote o lo termina llevando todo al carrito"""
+        if self.lote is None:
+            self.lote = BatchScanSession()
+            self.batch_btn.text = 'Terminar lote'
+            self.batch_label.text = 'Modo lote: 0 lecturas'
+        else:
+            self.finish_batch()
+    
+    def finish_batch(self):
+        """Confirma la sesión de lote en una sola transacción y muestra el resumen"""
+        lote, self.lote = self.lote, None
+        self.batch_btn.text = 'Modo lote'
+        self.batch_label.text = ''
+        if not lote.conteos:
+            return
+        try:
+            DatabaseExecutor.shared().escribir(lote.confirmar, self.db, on_result=self.on_batch_confirmed)
+        except ColaLlenaError:
+            # Las lecturas no se pierden: el lote sigue abierto para confirmarlo después
+            self.lote = lote
+            self.batch_btn.text = 'Terminar lote'
+            self.batch_label.text = f'Modo lote: {lote.total_lecturas} lecturas'
+            self.show_popup(MENSAJE_OCUPADO)
+    
+    def on_batch_confirmed(self, resultado):
+        agregados, desconocidos = resultado
+        # Escritura en bloque por fuera del modelo: el carrito se reconcilia al abrirlo
+        CartModel.shared().marcar_desincronizado()
+        unidades = sum(cantidad for _, cantidad in agregados)
+        mensaje = f"{unidades} unidades de {len(agregados)} productos\nagregadas al carrito"
+        if desconocidos:
+            mensaje += f"\n\nNo encontrados: {', '.join(desconocidos[:5])}"
+            if len(desconocidos) > 5:
+                mensaje += f" y {len(desconocidos) - 5} más"
+        self.show_popup(mensaje)
+    
     def scan_code(self, code):
         """Procesa el código escaneado"""
-        producto = self.db.get_producto_por_codigo(code)
+        if self.lote is not None:
+            # En modo lote no hay popup ni escritura por lectura: solo se cuenta
+            conteo = self.lote.agregar(code)
+            self.batch_label.text = (f'Modo lote: {self.lote.total_lecturas} lecturas, '
+                                     f'{len(self.lote.conteos)} códigos (último {code} x{conteo})')
+            self.code_input.text = ""
+            return
         
+        try:
+            DatabaseExecutor.shared().leer(self.db.get_producto_por_codigo, code,
+                                           on_result=lambda producto: self.show_product(code, producto))
+        except ColaLlenaError:
+            self.show_popup(MENSAJE_OCUPADO)
+    
+    def show_product(self, code, producto):
+        """Popup con el producto leído o aviso de código desconocido"""
         if producto:
             # Mostrar información del producto
             info = f"Producto encontrado:\n\n"
             info += f"Nombre: {producto[1]}\n"
             info += f"Categoría: {producto[2]}\n"
-            info += f"Precio: ${producto[3]:,.2f}\n"
+            info += f"Precio: {formatear_precio(producto[3])}\n"
             info += f"Stock: {producto[5]}\n\n"
             info += "¿Deseas agregarlo al carrito?"
             
@@ -738,9 +3996,11 @@ class ScannerScreen(Screen):
     
     def add_and_close_popup(self, producto_id):
         """Agrega producto al carrito y cierra popup"""
-        self.db.agregar_al_carrito(producto_id)
         self.popup.dismiss()
-        self.show_popup("Producto agregado al carrito")
+        try:
+            CartModel.shared().agregar(producto_id, on_done=lambda _: self.show_popup("Producto agregado al carrito"))
+        except ColaLlenaError:
+            self.show_popup(MENSAJE_OCUPADO)
         self.code_input.text = ""
     
     def show_popup(self, message):
@@ -754,9 +4014,14 @@ class ScannerScreen(Screen):
 
 # Pantalla del mapa con GPS real
 class MapScreen(Screen):
+    max_tiendas = 50  # Tiendas más cercanas que se listan
+    distancia_recarga = 25  # Metros que hay que moverse para reordenar la lista
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.gps = GPSManager()
+        self.db = DatabaseManager.shared()
+        self.gps = GPSManager.shared()
+        self.ubicacion_listado = None  # (lat, lon) con la que se ordenó la lista
         self.build_ui()
     
     def build_ui(self):
@@ -793,14 +4058,10 @@ class MapScreen(Screen):
         
         stores_label = Label(text='Tiendas Disponibles:', font_size=16, bold=True, size_hint_y=0.2)
         
-        self.stores_list = GridLayout(cols=1, spacing=5, size_hint_y=None)
-        self.stores_list.bind(minimum_height=self.stores_list.setter('height'))
-        
-        scroll_stores = ScrollView()
-        scroll_stores.add_widget(self.stores_list)
+        self.stores_list = crear_lista_reciclable(StoreRow, 80, espaciado=5)
         
         stores_layout.add_widget(stores_label)
-        stores_layout.add_widget(scroll_stores)
+        stores_layout.add_widget(self.stores_list)
         
         main_layout.add_widget(header_layout)
         main_layout.add_widget(map_layout)
@@ -811,50 +4072,52 @@ class MapScreen(Screen):
     
     def load_stores(self):
         """Carga lista de tiendas cercanas"""
-        self.stores_list.clear_widgets()
         current_location = self.gps.get_current_location()
         lat1, lon1 = current_location['lat'], current_location['lon']
         
-        tiendas = [
-            {"nombre": "Computerworking", "direccion": "Calle 32 #25-45", "lat": 10.4250, "lon": -75.5390, "telefono": "300-123-4567", "especialidad": "Procesadores y GPUs"},
-            {"nombre": "Compulago", "direccion": "Av. Pedro de Heredia #85-12", "lat": 10.4300, "lon": -75.5340, "telefono": "300-234-5678", "especialidad": "RAM y Almacenamiento"},
-            {"nombre": "Computo Segunda mano", "direccion": "Cra 17 #45-23", "lat": 10.4150, "lon": -75.5450, "telefono": "300-345-6789", "especialidad": "Motherboards y Fuentes"},
-            {"nombre": "Celuclock", "direccion": "Centro Comercial la castellana", "lat": 10.4100, "lon": -75.5500, "telefono": "300-456-7890", "especialidad": "Celulares y Accesorios"},
-        ]
-        
+        try:
+            DatabaseExecutor.shared().leer(self.db.get_tiendas_cercanas, lat1, lon1, self.max_tiendas,
+                                           on_result=self.show_stores)
+        except ColaLlenaError:
+            # Sin aviso: la próxima lectura del GPS vuelve a pedir la lista
+            self.ubicacion_listado = None
+            return
+        self.ubicacion_listado = (lat1, lon1)
+    
+    def show_stores(self, tiendas):
+        """Muestra las tiendas ordenadas por distancia"""
         for tienda in tiendas:
-            distancia = self.gps.calculate_distance(lat1, lon1, tienda['lat'], tienda['lon'])
-            tienda['distancia'] = round(distancia, 1)
-            store_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=80, padding=5)
-            
-            # Información de la tienda
-            info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
-            
-            nombre_label = Label(text=f"🔧 {tienda['nombre']}", font_size=14, bold=True)
-            direccion_label = Label(text=tienda["direccion"], font_size=12)
-            distancia_label = Label(text=f"📍 {tienda['distancia']} km", font_size=12)
-            especialidad_label = Label(text=f"⚡ {tienda['especialidad']}", font_size=11, color=[0, 0.7, 0, 1])
-            telefono_label = Label(text=f"📞 {tienda['telefono']}", font_size=12)
-            
-            info_layout.add_widget(nombre_label)
-            info_layout.add_widget(direccion_label)
-            info_layout.add_widget(distancia_label)
-            info_layout.add_widget(especialidad_label)
-            
-            # Botón de navegación
-            nav_btn = Button(text='Cómo\nLlegar', size_hint_x=0.3)
-            nav_btn.bind(on_press=lambda x, t=tienda: self.navigate_to_store(t))
-            
-            store_layout.add_widget(info_layout)
-            store_layout.add_widget(nav_btn)
-            
-            self.stores_list.add_widget(store_layout)
+            tienda['distancia'] = round(tienda['distancia'], 1)
+        
+        self.stores_list.data = [{'tienda': tienda, 'accion': self.navigate_to_store} for tienda in tiendas]
+    
+    def on_enter(self):
+        """Recibe ubicaciones mientras el mapa está visible"""
+        self.gps.suscribir(self.on_location_update)
+        self.gps.start()
+    
+    def on_leave(self):
+        """Suelta el GPS al salir del mapa"""
+        self.gps.cancelar_suscripcion(self.on_location_update)
+        self.gps.stop()
+    
+    def on_location_update(self, location):
+        """Reordena las tiendas solo si el usuario se movió lo suficiente"""
+        if self.ubicacion_listado is not None:
+            movido_km = haversine_km(*self.ubicacion_listado, location['lat'], location['lon'])
+            if movido_km * 1000 < self.distancia_recarga:
+                return
+        self.load_stores()
     
     def get_location(self, instance):
         """Obtiene ubicación actual"""
         location = self.gps.get_current_location()
-        self.map_placeholder.text = f"🗺 [Mapa GPS]\n📍 Tu ubicación: Lat {location['lat']}, Lon {location['lon']}\n\n🏪 Tiendas cercanas cargadas"
-        self.show_popup(f"Ubicación actual:\nLatitud: {location['lat']}\nLongitud: {location['lon']}")
+        if location['edad'] is None:
+            detalle = "Sin señal GPS: ubicación por defecto"
+        else:
+            detalle = f"Precisión: ±{location['precision']:.0f} m (hace {location['edad']:.0f} s)"
+        self.map_placeholder.text = f"🗺 [Mapa GPS]\n📍 Tu ubicación: Lat {location['lat']:.5f}, Lon {location['lon']:.5f}\n\n🏪 Tiendas cercanas cargadas"
+        self.show_popup(f"Ubicación actual:\nLatitud: {location['lat']:.5f}\nLongitud: {location['lon']:.5f}\n{detalle}")
         self.load_stores()
     
     def navigate_to_store(self, tienda):
@@ -875,22 +4138,288 @@ class MapScreen(Screen):
         """Vuelve a la pantalla anterior"""
         self.manager.current = 'home'
 
+# Historial de pedidos y tablero de ventas
+class OrdersScreen(Screen):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.db = DatabaseManager.shared()
+        self.siguiente_cursor = None
+        self.cargando_pagina = False
+        self.build_ui()
+    
+    def build_ui(self):
+        main_layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        
+        # Header
+        header_layout = BoxLayout(orientation='horizontal', size_hint_y=0.08)
+        
+        back_btn = Button(text='← Volver', size_hint_x=0.3)
+        back_btn.bind(on_press=self.go_back)
+        
+        title_label = Label(text='Ventas', font_size=20, bold=True)
+        
+        refresh_btn = Button(text='Actualizar', size_hint_x=0.3)
+        refresh_btn.bind(on_press=lambda x: self.load_data())
+        
+        header_layout.add_widget(back_btn)
+        header_layout.add_widget(title_label)
+        header_layout.add_widget(refresh_btn)
+        
+        # Tablero: se llena con las tablas de resumen, no agrupando los detalles
+        dashboard_layout = BoxLayout(orientation='vertical', size_hint_y=0.42, spacing=5)
+        
+        self.periodo_label = Label(font_size=14, bold=True)
+        self.categorias_label = Label(font_size=11, halign='left', valign='top')
+        self.categorias_label.bind(size=self.categorias_label.setter('text_size'))
+        self.mas_vendidos_label = Label(font_size=11, halign='left', valign='top')
+        self.mas_vendidos_label.bind(size=self.mas_vendidos_label.setter('text_size'))
+        
+        dashboard_layout.add_widget(self.periodo_label)
+        dashboard_layout.add_widget(self.categorias_label)
+        dashboard_layout.add_widget(self.mas_vendidos_label)
+        
+        # Historial paginado (carga la página siguiente al acercarse al final)
+        history_label = Label(text='Historial de pedidos:', font_size=16, bold=True, size_hint_y=0.06)
+        self.orders_list = crear_lista_reciclable(OrderRow, 80, espaciado=5)
+        self.orders_list.bind(scroll_y=self.on_scroll)
+        
+        main_layout.add_widget(header_layout)
+        main_layout.add_widget(dashboard_layout)
+        main_layout.add_widget(history_label)
+        main_layout.add_widget(self.orders_list)
+        
+        self.add_widget(main_layout)
+    
+    def on_enter(self):
+        """Recarga al entrar: los pedidos nuevos ya están en el resumen"""
+        self.load_data()
+    
+    def load_data(self):
+        """Pide el tablero y la primera página del historial al hilo lector"""
+        executor = DatabaseExecutor.shared()
+        try:
+            executor.leer(self.db.get_resumen_ventas, on_result=self.show_dashboard)
+            self.cargando_pagina = True
+            executor.leer(self.db.get_pedidos_pagina, on_result=lambda pagina: self.render_orders(*pagina))
+        except ColaLlenaError:
+            self.cargando_pagina = False
+            self.show_popup(MENSAJE_OCUPADO)
+    
+    def show_dashboard(self, resumen):
+        """Muestra totales del período, ingresos por categoría y los más vendidos"""
+        pedidos = sum(dia[1] for dia in resumen['dias'])
+        ingresos = sum(dia[3] for dia in resumen['dias'])
+        hoy = resumen['dias'][0] if resumen['dias'] and resumen['dias'][0][0] == time.strftime('%Y-%m-%d') else None
+        self.periodo_label.text = (
+            f"Hoy: {hoy[1] if hoy else 0} pedidos · {formatear_precio(hoy[3] if hoy else 0)}\n"
+            f"Últimos {DIAS_RESUMEN_VENTAS} días: {pedidos} pedidos · {formatear_precio(ingresos)}"
+        )
+        
+        lineas = ['Ingresos por categoría:']
+        lineas += [f"  {categoria}: {formatear_precio(ingresos)} ({unidades} u.)"
+                   for categoria, unidades, ingresos in resumen['categorias']] or ['  Sin ventas']
+        self.categorias_label.text = '\n'.join(lineas)
+        
+        lineas = ['Más vendidos:']
+        lineas += [f"  {posicion}. {nombre}: {formatear_precio(ingresos)} ({unidades} u.)"
+                   for posicion, (_, nombre, unidades, ingresos) in enumerate(resumen['mas_vendidos'], 1)]
+        self.mas_vendidos_label.text = '\n'.join(lineas if len(lineas) > 1 else lineas + ['  Sin ventas'])
+    
+    def render_orders(self, pedidos, siguiente=None, anexar=False):
+        """Muestra una página del historial (id, fecha, estado, total_centavos, unidades)"""
+        datos = [
+            {
+                'pedido_id': pedido[0],
+                'fecha': pedido[1],
+                'estado': pedido[2],
+                'total_centavos': pedido[3],
+                'unidades': pedido[4],
+                'accion': self.show_order,
+            }
+            for pedido in pedidos
+        ]
+        if anexar:
+            self.orders_list.data.extend(datos)
+        else:
+            self.orders_list.data = datos
+            self.orders_list.scroll_y = 1
+        self.siguiente_cursor = siguiente
+        self.cargando_pagina = False
+    
+    def on_scroll(self, instance, scroll_y):
+        """Pide la página siguiente cuando el scroll llega cerca del final"""
+        if scroll_y <= 0.1 and self.siguiente_cursor is not None and not self.cargando_pagina:
+            self.cargando_pagina = True
+            try:
+                DatabaseExecutor.shared().leer(
+                    self.db.get_pedidos_pagina, self.siguiente_cursor,
+                    on_result=lambda pagina: self.render_orders(*pagina, anexar=True)
+                )
+            except ColaLlenaError:
+                # El próximo evento de scroll lo vuelve a pedir
+                self.cargando_pagina = False
+    
+    def show_order(self, pedido_id):
+        """Popup con las líneas del pedido"""
+        try:
+            DatabaseExecutor.shared().leer(self.db.get_detalle_pedido, pedido_id,
+                                           on_result=lambda lineas: self.show_order_lines(pedido_id, lineas))
+        except ColaLlenaError:
+            self.show_popup(MENSAJE_OCUPADO)
+    
+    def show_order_lines(self, pedido_id, lineas):
+        message = '\n'.join(
+            f"{cantidad} x {nombre}\n   {formatear_precio(precio)} c/u = {formatear_precio(subtotal)}"
+            for nombre, cantidad, precio, subtotal in lineas
+        )
+        message += f"\n\nTotal: {formatear_precio(sum(linea[3] for linea in lineas))}"
+        popup = Popup(title=f'Pedido #{pedido_id}', content=Label(text=message), size_hint=(0.9, 0.7))
+        popup.open()
+    
+    def show_popup(self, message):
+        """Muestra mensaje popup"""
+        popup = Popup(title='Información', content=Label(text=message), size_hint=(0.8, 0.4))
+        popup.open()
+    
+    def go_back(self, instance):
+        """Vuelve a la pantalla anterior"""
+        self.manager.current = 'home'
+
 # Aplicación principal
+# Perfil de arranque: tiempo hasta el primer frame desglosado por componente
+class StartupProfiler:
+    """Acumula la duración de cada componente del arranque y el tiempo al primer frame
+    
+    Los tiempos se cuentan desde INICIO_ARRANQUE (antes de importar Kivy); el primer
+    frame es el primer on_flip de la ventana, cuando la imagen ya está en pantalla.
+    """
+    def __init__(self, inicio=INICIO_ARRANQUE):
+        self.inicio = inicio
+        self.componentes = []  # (nombre, segundos) en orden
+        self.primer_frame = None
+        self.on_primer_frame = []  # Callbacks (perfil) al dibujarse el primer frame
+    
+    def registrar(self, nombre, segundos):
+        self.componentes.append((nombre, segundos))
+    
+    @contextmanager
+    def medir(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nombre, time.perf_counter() - inicio)
+    
+    def esperar_primer_frame(self):
+        Window.bind(on_flip=self._on_flip)
+    
+    def _on_flip(self, *args):
+        Window.unbind(on_flip=self._on_flip)
+        self.primer_frame = time.perf_counter() - self.inicio
+        for callback in self.on_primer_frame:
+            callback(self)
+    
+    def reporte(self):
+        """Componentes en ms, el resto sin atribuir y el total hasta el primer frame"""
+        componentes = {nombre: segundos * 1000 for nombre, segundos in self.componentes}
+        if self.primer_frame is not None:
+            componentes['otros (Kivy, layout, primer dibujo)'] = (
+                self.primer_frame - sum(segundos for _, segundos in self.componentes)) * 1000
+        return {'componentes_ms': componentes,
+                'primer_frame_ms': self.primer_frame * 1000 if self.primer_frame is not None else None}
+
+# ScreenManager que construye cada pantalla la primera vez que se navega a ella
+class LazyScreenManager(ScreenManager):
+    """Las pantallas registradas con registrar() se crean al pedirlas por nombre
+    
+    Así la cámara, los sensores y sus consultas no se inicializan hasta que el
+    usuario abre la pantalla que los usa.
+    """
+    def __init__(self, perfil=None, **kwargs):
+        super().__init__(**kwargs)
+        self.perfil = perfil
+        self._fabricas = {}  # nombre -> clase (o callable) de la pantalla
+    
+    def registrar(self, nombre, fabrica):
+        self._fabricas[nombre] = fabrica
+    
+    def get_screen(self, name):
+        fabrica = self._fabricas.pop(name, None)
+        if fabrica is not None and not self.has_screen(name):
+            inicio = time.perf_counter()
+            self.add_widget(fabrica(name=name))
+            if self.perfil is not None:
+                self.perfil.registrar(f'pantalla {name} (primera visita)', time.perf_counter() - inicio)
+        return super().get_screen(name)
+    
+    def has_screen(self, name):
+        return name in self._fabricas or super().has_screen(name)
+
 class ComputerStoreApp(App):
     def build(self):
+        self.perfil = StartupProfiler()
+        self.perfil.registrar('importaciones', FIN_IMPORTACIONES - INICIO_ARRANQUE)
+        
         # Configurar ventana
         Window.size = (400, 700)  # Simular tamaño móvil
         
-        # Crear screen manager
-        sm = ScreenManager()
+        # Crear screen manager; solo la pantalla inicial se construye antes del primer frame
+        sm = LazyScreenManager(perfil=self.perfil)
+        
+        with self.perfil.medir('base de datos'):
+            DatabaseManager.shared()
+        with self.perfil.medir('pantalla home'):
+            sm.add_widget(HomeScreen(name='home'))
+        sm.registrar('cart', CartScreen)
+        sm.registrar('scanner', ScannerScreen)
+        sm.registrar('map', MapScreen)
+        sm.registrar('orders', OrdersScreen)
         
-        # Agregar pantallas
-        sm.add_widget(HomeScreen(name='home'))
-        sm.add_widget(CartScreen(name='cart'))
-        sm.add_widget(ScannerScreen(name='scanner'))
-        sm.add_widget(MapScreen(name='map'))
+        # MITIENDA_SYNC_URL activa el envío de pedidos al back office en segundo plano
+        self.sincronizador = OrderSyncWorker.shared()
+        if self.sincronizador is not None:
+            self.sincronizador.start()
+        
+        # MITIENDA_PERF=1 mide el arranque, los frames perdidos y cuánto I/O corrió en el hilo de UI
+        self.frames = None
+        if os.environ.get('MITIENDA_PERF'):
+            self.frames = FrameMonitor(DatabaseManager.shared().pool)
+            self.frames.start()
+            self.perfil.on_primer_frame.append(lambda perfil: print(f"Arranque: {perfil.reporte()}"))
+        self.perfil.esperar_primer_frame()
         
         return sm
+    
+    def on_resume(self):
+        # Al volver de segundo plano puede haber conexión de nuevo
+        if self.sincronizador is not None:
+            self.sincronizador.despertar()
+        return True
+    
+    def on_stop(self):
+        if self.sincronizador is not None:
+            self.sincronizador.stop(timeout=2)
+        if DatabaseExecutor._shared is not None:
+            # Las escrituras encoladas (p. ej. el último toque al carrito) llegan a la base
+            DatabaseExecutor._shared.stop(timeout=5)
+        if self.frames is not None:
+            self.frames.stop()
+            print(f"Frames: {self.frames.estadisticas()}")
+            print(f"Búsqueda (tecla -> render, ms): {self.root.get_screen('home').search.estadisticas()}")
 
 if __name__ == '__main__':
-    ComputerStoreApp().run()
\ No newline at end of file
+    # Mantenimiento sin interfaz (Kivy no procesa lo que va después de --):
+    #   python App.py -- --reconstruir-ventas
+    #   MITIENDA_SYNC_URL=https://... python App.py -- --sincronizar
+    if '--reconstruir-ventas' in sys.argv[1:]:
+        print(f"Resumen de ventas reconstruido: {DatabaseManager.shared().reconstruir_resumen_ventas()}")
+    elif '--sincronizar' in sys.argv[1:]:
+        # Un pase de envío del outbox (MITIENDA_SYNC_URL) sin abrir la interfaz
+        sincronizador = OrderSyncWorker.shared()
+        if sincronizador is None:
+            print("MITIENDA_SYNC_URL no está definida: no hay servidor al que enviar los pedidos")
+        else:
+            sincronizador.sincronizar()
+            print(f"Sincronización: {sincronizador.estadisticas()}")
+    else:
+        ComputerStoreApp().run()
\ No newline at end of file
@@ -0,0 +1,2375 @@
+"""Benchmarks de rendimiento de Mi Tienda (se ejecutan sin interfaz gráfica)
+
+Uso:
+    python benchmark.py conexiones [--iteraciones N]
+    python benchmark.py arranque [--repeticiones N]
+    python benchmark.py planes
+    python benchmark.py listas [--tamanos 100,10000,100000] [--max-legado N]
+    python benchmark.py paginas [--tamanos 1000,10000,100000]
+    python benchmark.py checkout [--hilos 8] [--intentos 100] [--stock 500] [--lineas 5]
+    python benchmark.py scanner [--frames 200] [--fps 30] [--fixtures DIR]
+    python benchmark.py lote [--lecturas 20,100,500] [--catalogo 10000]
+    python benchmark.py sacudidas [--duracion 60] [--trazas DIR]
+    python benchmark.py tiendas [--tamanos 10000,100000] [--k 10] [--radio 5]
+    python benchmark.py distancias [--tamanos 1000,10000,100000,1000000]
+    python benchmark.py gps [--duracion 600] [--intervalo 2] [--recorrido CSV]
+    python benchmark.py carrito [--tamanos 1,10,100,1000] [--repeticiones 30]
+    python benchmark.py executor [--duracion 5] [--toques 20] [--latencia-commit 20] [--escrituras 2000]
+    python benchmark.py primer-frame [--repeticiones 5]
+    python benchmark.py miniaturas [--imagenes 60] [--ancho 1600] [--visibles 8] [--velocidad 1]
+    python benchmark.py importacion [--filas 200000] [--bloque 5000]
+    python benchmark.py centavos [--lineas 1000,5000] [--operaciones 5000]
+    python benchmark.py ventas [--pedidos 100000] [--dias 365] [--productos 2000]
+    python benchmark.py sincronizacion [--pedidos 100000] [--lotes 50,200,1000] [--timeout 600]
+    python benchmark.py suite [--tamanos 1000,100000,1000000] [--salida ARCHIVO.json] [--comparar ANTERIOR.json]
+    python benchmark.py busqueda [--productos 100000] [--intervalo 0.12] [--debounce 0.3]
+
+'planes' termina con código 1 si alguna consulta cae en un recorrido completo
+de tabla no permitido, para usarlo como prueba de regresión. 'scanner' termina
+con código 1 si algún frame sintético o fixture no se decodifica correctamente;
+los fixtures son imágenes PGM (P5) grabadas cuyo nombre es el código esperado.
+'sacudidas' reproduce trazas del acelerómetro (sintéticas o CSV t,x,y,z grabados,
+nombrados <descripción>_<sacudidas esperadas>.csv) y termina con código 1 si el
+detector no acierta el número de sacudidas de alguna traza. 'executor' termina con
+código 1 si el executor deja I/O en el hilo de UI o el carrito queda inconsistente.
+'importacion' termina con código 1 si el catálogo importado, el FTS o la exportación
+no coinciden con el archivo de origen. 'centavos' termina con código 1 si el total
+del carrito (modelo o SQL) difiere en un solo centavo de la suma exacta. 'ventas'
+termina con código 1 si el resumen mantenido por triggers o su reconstrucción no
+coinciden con el GROUP BY sobre los pedidos, o el historial por keyset con OFFSET.
+'sincronizacion' envía el outbox a un back office local con fallas inyectadas y
+termina con código 1 si algún pedido falta, llega duplicado o queda sin enviar.
+'suite' escribe un informe JSON con la mediana, el p95 y el mínimo de cada operación
+por tamaño; con --comparar termina con código 1 si alguna operación empeora más que
+la tolerancia respecto del informe anterior. 'busqueda' tipea en el SearchPipeline y
+termina con código 1 si una búsqueda que falla detiene las siguientes.
+"""
+import os
+
+# Evitar que Kivy procese argumentos o llene la consola al importar App
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+import argparse
+import json
+import math
+import gzip
+import itertools
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import App
+
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.gridlayout import GridLayout
+from kivy.uix.label import Label
+
+from App import (CODIGOS_EAN_L, PARIDADES_EAN, AccelerometerManager, BarcodeDecoder, BarcodeScanner, BatchScanSession,
+                 CartModel, CartScreen, ColaLlenaError, ConnectionPool, DatabaseExecutor, DatabaseManager, FrameMonitor,
+                 ProductCache, ProductRow, SearchPipeline, SensorTrace, StockInsuficienteError, ThumbnailCache, leer_png, importar_pillow,
+                 GPSManager, GPSTrack, crear_lista_reciclable, digito_control_ean13, distancias_km, haversine_km,
+                 lineas_de_escaneo, traza_sacudida, COLUMNAS_CATALOGO, COLUMNAS_PRODUCTO_CATALOGO,
+                 SQL_UPSERT_PRODUCTO, TAMANO_PAGINA, TRIGGERS_RESUMEN_VENTAS, formatear_precio, leer_catalogo,
+                 OrderSyncWorker)
+
+# Las mediciones de consultas deben llegar a SQLite, no a la caché de productos
+SIN_CACHE = ProductCache(max_entradas=0)
+
+
+def medir(func, iteraciones):
+    """Devuelve el tiempo medio por llamada en microsegundos"""
+    func()  # Calentamiento
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        func()
+    return (time.perf_counter() - inicio) / iteraciones * 1e6
+
+
+def imprimir_tabla(encabezados, filas):
+    """Imprime una tabla de texto alineada"""
+    anchos = [max(len(str(c)) for c in columna) for columna in zip(encabezados, *filas)]
+    for fila in [encabezados] + filas:
+        print('  '.join(str(c).ljust(a) for c, a in zip(fila, anchos)))
+
+
+def bench_conexiones(args):
+    """Compara abrir una conexión por llamada contra el pool persistente"""
+    resultados = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        for modo, persistent in (('por_llamada', False), ('pool', True)):
+            pool = ConnectionPool(db_path, persistent=persistent)
+            db = DatabaseManager(db_path, pool=pool, cache=SIN_CACHE)
+            operaciones = {
+                'get_productos': lambda: db.get_productos('Procesadores'),
+                'get_producto_por_codigo': lambda: db.get_producto_por_codigo('1234567890126'),
+                'agregar_al_carrito': lambda: db.agregar_al_carrito(1),
+                'get_carrito': db.get_carrito,
+            }
+            for nombre, func in operaciones.items():
+                resultados.setdefault(nombre, {})[modo] = medir(func, args.iteraciones)
+            pool.close_all()
+        obsoletas = cache_con_dos_managers(db_path)
+
+    filas = []
+    for nombre, tiempos in resultados.items():
+        mejora = tiempos['por_llamada'] / tiempos['pool']
+        filas.append([nombre, f"{tiempos['por_llamada']:.1f}", f"{tiempos['pool']:.1f}", f"{mejora:.1f}x"])
+    imprimir_tabla(['operación', 'por llamada (µs)', 'pool (µs)', 'mejora'], filas)
+    if obsoletas:
+        print(f'\nFALLO: con dos DatabaseManager en el pool, {obsoletas} caché(s) siguen sirviendo el producto viejo')
+        return 1
+    print('\nDos DatabaseManager en el pool: ambas cachés se invalidan con escrituras de otro hilo')
+    return 0
+
+
+def cache_con_dos_managers(db_path):
+    """Cachés de dos DatabaseManager sobre un pool que no ven una escritura de otro hilo (esperado 0)
+
+    El hilo escritor abre su conexión antes de crear el segundo DatabaseManager, así que
+    escribe con los triggers TEMP registrados para el primero.
+    """
+    codigo = '1234567890126'
+    pool = ConnectionPool(db_path)
+    primero = DatabaseManager(db_path, pool=pool)
+    pedidos, listo = threading.Event(), threading.Event()
+
+    def escritor():
+        primero.get_producto_por_codigo(codigo)  # Abre la conexión persistente del hilo
+        listo.set()
+        pedidos.wait()
+        with pool.transaction() as conn:
+            conn.execute('UPDATE productos SET stock = stock + 1 WHERE codigo_barras = ?', (codigo,))
+        listo.set()
+
+    hilo = threading.Thread(target=escritor)
+    hilo.start()
+    listo.wait()
+    listo.clear()
+    segundo = DatabaseManager(db_path, pool=pool)
+    for db in (primero, segundo):
+        db.get_producto_por_codigo(codigo)  # Deja el producto en caché
+    pedidos.set()
+    listo.wait()
+    hilo.join()
+    actual = primero._get_producto_por_codigo(codigo)
+    obsoletas = sum(db.get_producto_por_codigo(codigo) != actual for db in (primero, segundo))
+    pool.close_all()
+    return obsoletas
+
+
+def bench_arranque(args):
+    """Coste de inicializar la base de datos al lanzar la app, antes y después de las migraciones"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+
+        def abrir():
+            pool = ConnectionPool(db_path)
+            DatabaseManager(db_path, pool=pool)
+            pool.close_all()
+
+        def borrar():
+            for sufijo in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + sufijo):
+                    os.remove(db_path + sufijo)
+
+        def legado():
+            # Comportamiento anterior: cada pantalla borraba y resembraba la base de datos
+            for _ in range(3):
+                borrar()
+                abrir()
+
+        def primer_arranque():
+            borrar()
+            abrir()
+
+        escenarios = [
+            ('antes: 3x borrar y resembrar', legado),
+            ('primer arranque (migrar y sembrar)', primer_arranque),
+            ('arranque con base existente', abrir),
+        ]
+        filas = []
+        for nombre, func in escenarios:
+            tiempos = []
+            for _ in range(args.repeticiones):
+                inicio = time.perf_counter()
+                func()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            filas.append([nombre, f'{statistics.median(tiempos):.2f}'])
+    imprimir_tabla(['escenario', 'mediana (ms)'], filas)
+
+
+# Recorridos completos aceptados por operación (alias tal como aparecen en el plan)
+ESCANEOS_PERMITIDOS = {
+    'get_productos (todos)': {'productos'},
+    'get_productos_pagina (primera)': {'productos'},  # Recorre el índice en orden y se corta en LIMIT
+    'get_carrito': {'c'},
+    'limpiar_carrito': {'carrito'},
+    'crear_pedido': {'c', 'carrito'},
+    'get_pedidos_pagina (primera)': {'p'},  # Recorre el rowid desde el final y se corta en LIMIT
+    # Una fila por categoría; los más vendidos recorren el índice de ingresos hasta el LIMIT
+    'get_resumen_ventas': {'ventas_categoria', 'v'},
+    'encolar_pedidos_sin_enviar': {'p'},  # Revisa cada pedido contra el índice único del outbox
+}
+
+
+def capturar_sql(db, func):
+    """Ejecuta func y devuelve las sentencias SQL que lanzó sobre la conexión del hilo"""
+    sentencias = []
+    with db.pool.connection() as conn:
+        conn.set_trace_callback(sentencias.append)
+        try:
+            func()
+        finally:
+            conn.set_trace_callback(None)
+    # Los triggers repiten la sentencia que los disparó en el trace
+    sentencias = dict.fromkeys(sentencias)
+    return [s for s in sentencias if s.split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE')]
+
+
+def recorridos_completos(conn, sql):
+    """Devuelve las tablas que el plan de la sentencia recorre completas"""
+    tablas = set()
+    for fila in conn.execute(f'EXPLAIN QUERY PLAN {sql}'):
+        detalle = fila[3]
+        # Una tabla virtual con restricciones tras ":" (MATCH de FTS5 ":M", rangos del
+        # R*Tree ":D1B0...") usa su propio índice
+        if 'VIRTUAL TABLE INDEX' in detalle and detalle.rsplit(':', 1)[-1].strip():
+            continue
+        if detalle.startswith('SCAN '):
+            tablas.add(detalle.split()[1])
+    return tablas
+
+
+def bench_planes(args):
+    """Verifica con EXPLAIN QUERY PLAN que las consultas usen índices"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        pool = ConnectionPool(db_path)
+        db = DatabaseManager(db_path, pool=pool)
+        operaciones = [
+            ('get_productos (todos)', lambda: db.get_productos()),
+            ('get_productos (categoría)', lambda: db.get_productos('Procesadores')),
+            ('get_productos (búsqueda)', lambda: db.get_productos(busqueda='ryzen')),
+            ('get_productos (búsqueda y categoría)', lambda: db.get_productos('Procesadores', 'núcleos')),
+            ('get_productos_pagina (primera)', lambda: db.get_productos_pagina(limite=5)),
+            ('get_productos_pagina (cursor)', lambda: db.get_productos_pagina(cursor=('Motherboards', 'MSI', 11), limite=5)),
+            ('get_productos_pagina (categoría y cursor)',
+             lambda: db.get_productos_pagina('Motherboards', cursor=('Motherboards', 'MSI', 11), limite=5)),
+            ('get_productos_pagina (búsqueda)', lambda: db.get_productos_pagina(busqueda='ryzen', cursor=5, limite=5)),
+            ('get_producto_por_codigo', lambda: db.get_producto_por_codigo('1234567890126')),
+            ('get_productos_por_codigos', lambda: db.get_productos_por_codigos(['1234567890123', '1234567890126'])),
+            ('agregar_al_carrito (nuevo)', lambda: db.agregar_al_carrito(1)),
+            ('agregar_al_carrito (existente)', lambda: db.agregar_al_carrito(1)),
+            ('agregar_lote_al_carrito', lambda: db.agregar_lote_al_carrito([(2, 1), (3, 2), (2, 1)])),
+            ('get_tiendas_en_radio', lambda: db.get_tiendas_en_radio(10.4236, -75.5378, 2.0)),
+            ('get_carrito', db.get_carrito),
+            ('crear_pedido', lambda: db.crear_pedido('Dirección', '0,0')),
+            ('get_pedidos_pagina (primera)', lambda: db.get_pedidos_pagina()),
+            ('get_pedidos_pagina (cursor)', lambda: db.get_pedidos_pagina(cursor=2)),
+            ('get_resumen_ventas', lambda: db.get_resumen_ventas()),
+            ('encolar_pedidos_sin_enviar', db.encolar_pedidos_sin_enviar),
+            ('get_outbox_pendiente', lambda: db.get_outbox_pendiente(200)),
+            ('proximo_envio_outbox', db.proximo_envio_outbox),
+            ('eliminar_del_carrito', lambda: db.eliminar_del_carrito(1)),
+            ('limpiar_carrito', db.limpiar_carrito),
+        ]
+        fallos = []
+        filas = []
+        with pool.connection() as conn:
+            for nombre, func in operaciones:
+                permitidos = ESCANEOS_PERMITIDOS.get(nombre, set())
+                for sql in capturar_sql(db, func):
+                    prohibidos = recorridos_completos(conn, sql) - permitidos
+                    estado = 'OK' if not prohibidos else 'SCAN ' + ', '.join(sorted(prohibidos))
+                    filas.append([nombre, estado, ' '.join(sql.split())[:70]])
+                    if prohibidos:
+                        fallos.append(nombre)
+        pool.close_all()
+    imprimir_tabla(['operación', 'plan', 'sentencia'], filas)
+    if fallos:
+        print(f"\n{len(fallos)} consulta(s) con recorrido completo de tabla")
+        return 1
+    return 0
+
+
+def productos_sinteticos(n):
+    """Genera n filas con la misma forma que SELECT * FROM productos"""
+    return [
+        (i, f'Producto {i}', 'Procesadores', 100000 + 100 * i, 'Descripción', i % 50, f'{i:013d}', '', '')
+        for i in range(1, n + 1)
+    ]
+
+
+def render_legado(layout, productos):
+    """Reproduce el render anterior: un árbol de widgets por producto"""
+    layout.clear_widgets()
+    for producto in productos:
+        product_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=100, padding=5)
+        info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
+        info_layout.add_widget(Label(text=producto[1], font_size=14, bold=True, text_size=(250, None), halign='left'))
+        info_layout.add_widget(Label(text=f"📦 {producto[2]}", font_size=11, text_size=(250, None), halign='left'))
+        info_layout.add_widget(Label(text=f"💲 {formatear_precio(producto[3])}", font_size=13, bold=True, color=[0, 0.7, 0, 1]))
+        info_layout.add_widget(Label(text=f"📊 Stock: {producto[5]} unidades", font_size=11, text_size=(250, None), halign='left'))
+        product_layout.add_widget(info_layout)
+        product_layout.add_widget(Button(text='Agregar\nal Carrito', size_hint_x=0.3))
+        layout.add_widget(product_layout)
+
+
+def render_reciclable(lista, productos):
+    """Render actual: solo se actualizan los datos del RecycleView"""
+    lista.data = [
+        {'producto_id': p[0], 'nombre': p[1], 'categoria': p[2], 'precio_centavos': p[3], 'stock': p[5], 'accion': print}
+        for p in productos
+    ]
+    lista.refresh_views()  # Sin ventana no hay frames: forzar el refresco pendiente
+
+
+def medir_render(crear, render, productos):
+    """Devuelve (ms, pico de memoria en MB, widget); la memoria se mide en una segunda pasada"""
+    widget = crear()
+    inicio = time.perf_counter()
+    render(widget, productos)
+    duracion = (time.perf_counter() - inicio) * 1000
+
+    # tracemalloc ralentiza mucho la ejecución, por eso no se cronometra esta pasada
+    otro = crear()
+    tracemalloc.start()
+    render(otro, productos)
+    pico = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return duracion, pico, widget
+
+
+def crear_lista():
+    """RecycleView del catálogo con el viewport de un teléfono"""
+    lista = crear_lista_reciclable(ProductRow, 100)
+    lista.size = (400, 600)
+    return lista
+
+
+def crear_grid():
+    """GridLayout usado por el render anterior"""
+    return GridLayout(cols=1, spacing=10, size_hint_y=None)
+
+
+def bench_listas(args):
+    """Tiempo y memoria de render de la lista de productos: widgets por fila vs RecycleView"""
+    filas = []
+    for n in (int(t) for t in args.tamanos.split(',')):
+        productos = productos_sinteticos(n)
+
+        ms, mb, lista = medir_render(crear_lista, render_reciclable, productos)
+        filas.append([n, 'RecycleView', f'{ms:.1f}', f'{mb:.1f}', len(lista.layout_manager.children)])
+
+        if n <= args.max_legado:
+            ms, mb, layout = medir_render(crear_grid, render_legado, productos)
+            filas.append([n, 'widgets por fila', f'{ms:.1f}', f'{mb:.1f}', len(layout.children)])
+        else:
+            filas.append([n, 'widgets por fila', 'omitido', '-', '-'])
+    imprimir_tabla(['productos', 'modo', 'render (ms)', 'pico (MB)', 'filas instanciadas'], filas)
+
+
+CATEGORIAS = ['Procesadores', 'Tarjetas Gráficas', 'Memorias RAM', 'Motherboards',
+              'Almacenamiento', 'Fuentes de Poder', 'Refrigeración', 'Cases']
+
+
+def poblar_catalogo(db, n):
+    """Inserta n productos sintéticos en una sola transacción"""
+    filas = (
+        (f'Producto {i}', CATEGORIAS[i % len(CATEGORIAS)], 100000 + 100 * i, f'Descripción del producto {i}',
+         i % 50, f'9{i:012d}', f'producto_{i}.jpg')
+        for i in range(n)
+    )
+    with db.pool.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO productos (nombre, categoria, precio_centavos, descripcion, stock, codigo_barras, imagen_url)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', filas)
+
+
+def medir_consulta(func):
+    """Devuelve (ms, pico de memoria en MB) de una consulta"""
+    inicio = time.perf_counter()
+    func()
+    duracion = (time.perf_counter() - inicio) * 1000
+    tracemalloc.start()
+    func()
+    pico = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return duracion, pico
+
+
+def bench_paginas(args):
+    """Tiempo hasta la primera fila y memoria: catálogo completo vs primera página"""
+    filas = []
+    for n in (int(t) for t in args.tamanos.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            pool = ConnectionPool(db_path)
+            db = DatabaseManager(db_path, pool=pool, cache=SIN_CACHE)
+            poblar_catalogo(db, n)
+            casos = [
+                ('get_productos()', db.get_productos),
+                ('get_productos_pagina()', db.get_productos_pagina),
+                ('get_productos(categoría)', lambda: db.get_productos('Memorias RAM')),
+                ('get_productos_pagina(categoría)', lambda: db.get_productos_pagina('Memorias RAM')),
+            ]
+            for nombre, func in casos:
+                ms, mb = medir_consulta(func)
+                filas.append([n, nombre, f'{ms:.2f}', f'{mb:.2f}'])
+            pool.close_all()
+    imprimir_tabla(['productos', 'consulta', 'primera fila (ms)', 'pico (MB)'], filas)
+
+
+def checkout_legado(db):
+    """Checkout anterior: varias transacciones y descuento de stock leído en Python"""
+    items = db.get_carrito()
+    if not items:
+        return None
+    total = sum(item[4] for item in items)
+    with db.pool.transaction() as conn:
+        cursor = conn.execute(
+            'INSERT INTO pedidos (total_centavos, direccion, ubicacion_gps) VALUES (?, ?, ?)', (total, 'Dirección', '0,0')
+        )
+        pedido_id = cursor.lastrowid
+        for item in items:
+            conn.execute(
+                'INSERT INTO detalles_pedidos (pedido_id, producto_id, cantidad, precio_unitario_centavos) '
+                'VALUES (?, ?, ?, ?)',
+                (pedido_id, item[5], item[2], item[3])
+            )
+    for item in items:
+        with db.pool.connection() as conn:
+            stock = conn.execute('SELECT stock FROM productos WHERE id = ?', (item[5],)).fetchone()[0]
+        if stock < item[2]:
+            raise StockInsuficienteError([item[1]])
+        with db.pool.transaction() as conn:
+            conn.execute('UPDATE productos SET stock = ? WHERE id = ?', (stock - item[2], item[5]))
+    db.limpiar_carrito()
+    return pedido_id, total
+
+
+def checkout_atomico(db):
+    """Checkout actual: una sola transacción BEGIN IMMEDIATE"""
+    return db.crear_pedido('Dirección', '0,0')
+
+
+def bench_checkout(args):
+    """Checkouts concurrentes sobre una base compartida: sobreventa y pedidos/s"""
+    productos = list(range(1, args.lineas + 1))
+    filas = []
+    for nombre, checkout in (('legado', checkout_legado), ('atómico', checkout_atomico)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            pool = ConnectionPool(db_path)
+            db = DatabaseManager(db_path, pool=pool)
+            with pool.transaction() as conn:
+                conn.execute('UPDATE productos SET stock = ? WHERE id <= ?', (args.stock, args.lineas))
+            rechazados = []
+            errores = []
+            tiempos_checkout = []
+
+            def cliente():
+                for _ in range(args.intentos):
+                    try:
+                        for producto_id in productos:
+                            db.agregar_al_carrito(producto_id)
+                        inicio_checkout = time.perf_counter()
+                        checkout(db)
+                        tiempos_checkout.append(time.perf_counter() - inicio_checkout)
+                    except StockInsuficienteError:
+                        rechazados.append(1)
+                        db.limpiar_carrito()
+                    except Exception as e:  # Bloqueos u otros fallos bajo contención
+                        errores.append(e)
+
+            hilos = [threading.Thread(target=cliente) for _ in range(args.hilos)]
+            inicio = time.perf_counter()
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            duracion = time.perf_counter() - inicio
+
+            sobreventa = descuadre = 0
+            with pool.connection() as conn:
+                pedidos = conn.execute('SELECT COUNT(*) FROM pedidos').fetchone()[0]
+                for producto_id in productos:
+                    vendidas = conn.execute(
+                        'SELECT COALESCE(SUM(cantidad), 0) FROM detalles_pedidos WHERE producto_id = ?', (producto_id,)
+                    ).fetchone()[0]
+                    stock_final = conn.execute('SELECT stock FROM productos WHERE id = ?', (producto_id,)).fetchone()[0]
+                    sobreventa += max(0, vendidas - args.stock)
+                    # Unidades vendidas que no se reflejan en el stock (actualizaciones perdidas)
+                    descuadre += abs((args.stock - stock_final) - vendidas)
+            pool.close_all()
+            # pedidos/s cuenta el ciclo completo (agregar + checkout); checkout (ms) solo la confirmación
+            filas.append([nombre, pedidos, f'{pedidos / duracion:.0f}',
+                          f'{statistics.mean(tiempos_checkout) * 1000:.3f}' if tiempos_checkout else '-',
+                          sobreventa, descuadre, len(rechazados), len(errores)])
+    imprimir_tabla(['checkout', 'pedidos', 'pedidos/s', 'checkout (ms)', 'sobreventa', 'descuadre stock',
+                    'rechazados', 'errores'], filas)
+    print(f"\nStock inicial {args.stock} por producto; {args.hilos} hilos x {args.intentos} intentos "
+          f"de {args.lineas} líneas sobre un carrito compartido")
+    # Código de salida 1 si el checkout actual vende de más o pierde stock
+    return 1 if filas[-1][4] or filas[-1][5] else 0
+
+
+def modulos_ean13(codigo):
+    """Patrón de 95 módulos ('1' = barra) de un código EAN-13"""
+    paridad = next(p for p, d in PARIDADES_EAN.items() if d == codigo[0])
+    izquierda = ''
+    for tipo, digito in zip(paridad, codigo[1:7]):
+        bits = CODIGOS_EAN_L[int(digito)]
+        if tipo == 'G':  # G es R invertido
+            bits = ''.join('1' if b == '0' else '0' for b in bits)[::-1]
+        izquierda += bits
+    derecha = ''.join(''.join('1' if b == '0' else '0' for b in CODIGOS_EAN_L[int(d)]) for d in codigo[7:])
+    return '101' + izquierda + '01010' + derecha + '101'
+
+
+def frame_sintetico(codigo, ancho=640, alto=480, modulo=3, ruido=30, vertical=False, rng=random):
+    """Frame RGBA con el código centrado, ruido de sensor y contraste reducido"""
+    bits = modulos_ean13(codigo)
+    largo = ancho if not vertical else alto
+    margen = (largo - len(bits) * modulo) // 2
+    perfil = [200] * largo
+    for i, bit in enumerate(bits):
+        if bit == '1':
+            for p in range(margen + i * modulo, margen + (i + 1) * modulo):
+                perfil[p] = 50
+    rango = 2 * ruido + 1
+    ruidos = rng.randbytes(ancho * alto)
+    grises = bytearray(ancho * alto)
+    for y in range(alto):
+        fila = y * ancho
+        for x in range(ancho):
+            base = perfil[y] if vertical else perfil[x]
+            grises[fila + x] = max(0, min(255, base + ruidos[fila + x] % rango - ruido))
+    frame = bytearray(ancho * alto * 4)
+    frame[0::4] = frame[1::4] = frame[2::4] = grises
+    frame[3::4] = b'\xff' * (ancho * alto)
+    return bytes(frame)
+
+
+def leer_pgm(ruta):
+    """Lee una imagen PGM binaria (P5) y la devuelve como frame RGBA"""
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+    campos = []
+    posicion = 0
+    while len(campos) < 4:
+        while datos[posicion:posicion + 1].isspace():
+            posicion += 1
+        if datos[posicion:posicion + 1] == b'#':
+            posicion = datos.index(b'\n', posicion)
+            continue
+        fin = posicion
+        while not datos[fin:fin + 1].isspace():
+            fin += 1
+        campos.append(datos[posicion:fin])
+        posicion = fin
+    if campos[0] != b'P5':
+        raise ValueError(f'{ruta}: solo se admite PGM binario (P5)')
+    ancho, alto = int(campos[1]), int(campos[2])
+    grises = datos[posicion + 1:posicion + 1 + ancho * alto]
+    frame = bytearray(ancho * alto * 4)
+    frame[0::4] = frame[1::4] = frame[2::4] = grises
+    frame[3::4] = b'\xff' * (ancho * alto)
+    return bytes(frame), ancho, alto
+
+
+def bench_scanner(args):
+    """Precisión y coste del decodificador, y frames descartados a una tasa de cámara dada"""
+    rng = random.Random(42)
+    casos = []
+    for i in range(args.codigos):
+        base = ''.join(str(rng.randint(0, 9)) for _ in range(12))
+        codigo = base + digito_control_ean13(base)
+        vertical = i % 3 == 0
+        # En vertical solo caben 480 píxeles: hasta 4 píxeles por módulo con zona de silencio
+        modulo = rng.choice((2, 3, 4) if vertical else (2, 3, 4, 5))
+        frame = frame_sintetico(codigo, modulo=modulo, vertical=vertical, rng=rng)
+        casos.append((f'sintético m={modulo}{" vertical" if vertical else ""}', codigo, frame, 640, 480))
+    if args.fixtures:
+        for nombre in sorted(os.listdir(args.fixtures)):
+            if nombre.endswith('.pgm'):
+                frame, ancho, alto = leer_pgm(os.path.join(args.fixtures, nombre))
+                casos.append((nombre, nombre.split('.')[0].split('_')[0], frame, ancho, alto))
+
+    decoder = BarcodeDecoder()
+    fallos = []
+    tiempos = []
+    for nombre, esperado, frame, ancho, alto in casos:
+        inicio = time.perf_counter()
+        leido = decoder.decodificar(lineas_de_escaneo(frame, ancho, alto, paso=max(1, ancho // 640)))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if leido != esperado:
+            fallos.append((nombre, esperado, leido))
+    # Frame sin código: el coste del peor caso (se prueban todas las líneas)
+    vacio = bytes(640 * 480 * 4)
+    tiempo_vacio = medir(lambda: decoder.decodificar(lineas_de_escaneo(vacio, 640, 480)), 20) / 1000
+
+    # Flujo continuo: la cámara entrega frames a --fps y el hilo de trabajo descarta los que no alcanza
+    # (sin bucle de Kivy los callbacks quedan en el Clock; la latencia se registra antes)
+    scanner = BarcodeScanner(lambda codigo: None, enfriamiento=0)
+    # Un frame que la cámara entrega sin datos se cuenta como error y el hilo debe
+    # seguir leyendo los siguientes
+    scanner.enviar_frame(None, 640, 480)
+    while scanner.frames_procesados < 1:
+        time.sleep(0.001)
+    inicio = time.perf_counter()
+    for i in range(args.frames):
+        _, _, frame, ancho, alto = casos[i % len(casos)]
+        scanner.enviar_frame(frame, ancho, alto)
+        time.sleep(max(0.0, inicio + (i + 1) / args.fps - time.perf_counter()))
+    # Si el hilo de trabajo muriera, los frames quedarían sin procesar para siempre
+    limite = time.perf_counter() + 10
+    while scanner.frames_procesados + scanner.frames_descartados < args.frames + 1 and time.perf_counter() < limite:
+        time.sleep(0.01)
+    stats = scanner.estadisticas()
+    if stats['errores'] != 1 or not stats['lecturas']:
+        fallos.append(('frame sin datos', '1 error y lecturas después',
+                       f"{stats['errores']} errores, {stats['lecturas']} lecturas"))
+
+    imprimir_tabla(['casos', 'correctos', 'decodificar p50 (ms)', 'decodificar max (ms)', 'sin código (ms)'],
+                   [[len(casos), len(casos) - len(fallos), f'{statistics.median(tiempos):.2f}',
+                     f'{max(tiempos):.2f}', f'{tiempo_vacio:.2f}']])
+    print()
+    imprimir_tabla(['frames', 'fps cámara', 'procesados', 'descartados', 'errores', 'latencia p50 (ms)',
+                    'latencia max (ms)'],
+                   [[args.frames, args.fps, stats['procesados'], stats['descartados'], stats['errores'],
+                     f"{stats['latencia_p50']:.1f}" if stats['lecturas'] else '-',
+                     f"{stats['latencia_max']:.1f}" if stats['lecturas'] else '-']])
+    for nombre, esperado, leido in fallos:
+        print(f'FALLO {nombre}: esperado {esperado}, leído {leido}')
+    return 1 if fallos else 0
+
+
+def escaneo_individual(db, codigos):
+    """Flujo con popup: una consulta y una transacción por lectura"""
+    for codigo in codigos:
+        producto = db.get_producto_por_codigo(codigo)
+        if producto:
+            db.agregar_al_carrito(producto[0])
+
+
+def escaneo_por_lote(db, codigos):
+    """Modo lote: conteo en memoria, una consulta IN y una transacción al terminar"""
+    lote = BatchScanSession()
+    for codigo in codigos:
+        lote.agregar(codigo)
+    lote.confirmar(db)
+
+
+def bench_lote(args):
+    """Lecturas por segundo del escaneo individual contra el modo lote"""
+    filas = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        pool = ConnectionPool(db_path)
+        db = DatabaseManager(db_path, pool=pool, cache=SIN_CACHE)
+        poblar_catalogo(db, args.catalogo)
+        with pool.connection() as conn:
+            codigos_catalogo = [fila[0] for fila in conn.execute(
+                'SELECT codigo_barras FROM productos WHERE codigo_barras IS NOT NULL')]
+        rng = random.Random(7)
+        for lecturas in [int(n) for n in args.lecturas.split(',')]:
+            # Un inventario típico repite artículos: la mitad de las lecturas son repeticiones
+            distintos = rng.sample(codigos_catalogo, max(1, lecturas // 2))
+            codigos = [rng.choice(distintos) for _ in range(lecturas)] + ['0000000000000']
+            resultados = []
+            for escaneo in (escaneo_individual, escaneo_por_lote):
+                db.limpiar_carrito()
+                sentencias = len(capturar_sql(db, lambda: escaneo(db, codigos)))
+                db.limpiar_carrito()
+                inicio = time.perf_counter()
+                escaneo(db, codigos)
+                duracion = time.perf_counter() - inicio
+                with pool.connection() as conn:
+                    unidades = conn.execute('SELECT COALESCE(SUM(cantidad), 0) FROM carrito').fetchone()[0]
+                resultados.append((duracion, sentencias, unidades))
+            (t_ind, s_ind, u_ind), (t_lote, s_lote, u_lote) = resultados
+            filas.append([lecturas, f'{t_ind * 1000:.1f}', s_ind, f'{t_lote * 1000:.1f}', s_lote,
+                          f'{t_ind / t_lote:.1f}x', 'OK' if u_ind == u_lote == lecturas else 'DIFIERE'])
+        pool.close_all()
+    imprimir_tabla(['lecturas', 'individual (ms)', 'sentencias', 'lote (ms)', 'sentencias', 'mejora',
+                    'carrito'], filas)
+    print(f"\nCatálogo de {args.catalogo} productos; cada serie incluye un código desconocido")
+    return 1 if any(fila[-1] != 'OK' for fila in filas) else 0
+
+
+def traza_sintetica(duracion, movimiento, rng, hz=100):
+    """Traza a la frecuencia nativa del sensor: gravedad en Z, ruido y un movimiento f(t) -> (x, y, z)"""
+    muestras = []
+    for i in range(int(duracion * hz)):
+        t = i / hz
+        dx, dy, dz = movimiento(t)
+        muestras.append((t, dx + rng.gauss(0, 0.3), dy + rng.gauss(0, 0.3), 9.81 + dz + rng.gauss(0, 0.3)))
+    return SensorTrace(muestras)
+
+
+# Sacudidas sintéticas: la primera tras el arranque del detector, luego cada 15 s, y margen al final
+PRIMERA_SACUDIDA = 10.0
+ENTRE_SACUDIDAS = 15.0
+MARGEN_SACUDIDA = 2.0
+DURACION_MINIMA_SACUDIDAS = PRIMERA_SACUDIDA + 0.6 + MARGEN_SACUDIDA
+
+
+def trazas_sinteticas(duracion, rng):
+    """(nombre, traza, sacudidas esperadas) para situaciones típicas del teléfono
+    
+    Solo se colocan las sacudidas que entran completas (con margen) en la duración.
+    """
+    inicios = []
+    inicio = PRIMERA_SACUDIDA
+    while inicio + 0.6 + MARGEN_SACUDIDA <= duracion:
+        inicios.append(inicio)
+        inicio += ENTRE_SACUDIDAS
+    sacudidas = [traza_sacudida(inicio, muestreo=0.01).muestras for inicio in inicios]
+
+    def con_sacudidas(t):
+        for muestras in sacudidas:
+            if muestras[0][0] <= t <= muestras[-1][0]:
+                return muestras[int((t - muestras[0][0]) * 100)][1], 0.0, 0.0
+        return 0.0, 0.0, 0.0
+
+    return [
+        ('reposo', traza_sintetica(duracion, lambda t: (0.0, 0.0, 0.0), rng), 0),
+        # Caminar: rebote vertical de ~1.8 Hz
+        ('caminar', traza_sintetica(duracion, lambda t: (0.0, 0.0, 4 * math.sin(2 * math.pi * 1.8 * t)), rng), 0),
+        # Golpes aislados (dejar el teléfono sobre la mesa)
+        ('golpes', traza_sintetica(duracion, lambda t: (0.0, 0.0, -25.0) if t % 15 < 0.02 else (0.0, 0.0, 0.0), rng), 0),
+        # Frenadas y arranques: aceleraciones sostenidas sin cambio rápido de sentido
+        ('vehículo', traza_sintetica(duracion, lambda t: (6.0 if t % 8 < 3 else 0.0, 0.0, 0.0), rng), 0),
+        ('sacudidas', traza_sintetica(duracion, con_sacudidas, rng), len(sacudidas)),
+    ]
+
+
+def reproducir_legado(traza):
+    """Detector original: magnitud instantánea > 2.5 cada 0.1 s con 2 s de espera"""
+    detecciones = despertares = 0
+    ultima = float('-inf')
+    t, fin = traza.muestras[0][0], traza.muestras[-1][0]
+    while t <= fin:
+        despertares += 1
+        x, y, z = traza.muestra_en(t)
+        if (x ** 2 + y ** 2 + z ** 2) ** 0.5 > 2.5 and t - ultima > 2:
+            ultima = t
+            detecciones += 1
+        t += 0.1
+    return detecciones, despertares
+
+
+def reproducir_adaptativo(traza):
+    """AccelerometerManager actual, con su frecuencia adaptativa, en tiempo virtual"""
+    manager = AccelerometerManager()
+    detecciones = []
+    manager.shake_callback = lambda: detecciones.append(1)
+    t, fin = traza.muestras[0][0], traza.muestras[-1][0]
+    while t <= fin:
+        manager.procesar(t, *traza.muestra_en(t))
+        t += manager.intervalo
+    return len(detecciones), manager.muestras
+
+
+def bench_sacudidas(args):
+    """Falsos positivos y despertares por minuto: sondeo a 10 Hz vs ventana adaptativa"""
+    if args.duracion < DURACION_MINIMA_SACUDIDAS:
+        print(f'--duracion debe ser de al menos {DURACION_MINIMA_SACUDIDAS:g} s para que entre una sacudida')
+        return 2
+    casos = trazas_sinteticas(args.duracion, random.Random(3))
+    if args.trazas:
+        for nombre in sorted(os.listdir(args.trazas)):
+            if nombre.endswith('.csv'):
+                esperadas = int(nombre[:-4].rsplit('_', 1)[1])
+                casos.append((nombre, SensorTrace.cargar(os.path.join(args.trazas, nombre)), esperadas))
+    filas = []
+    fallos = 0
+    for nombre, traza, esperadas in casos:
+        minutos = max(traza.duracion, 1e-9) / 60
+        legado, despertares_legado = reproducir_legado(SensorTrace(traza.muestras))
+        inicio = time.perf_counter()
+        detectadas, despertares = reproducir_adaptativo(SensorTrace(traza.muestras))
+        cpu = (time.perf_counter() - inicio) / max(despertares, 1) * 1e6
+        fallos += detectadas != esperadas
+        filas.append([nombre, esperadas, legado, detectadas, f'{despertares_legado / minutos:.0f}',
+                      f'{despertares / minutos:.0f}', f'{cpu:.1f}'])
+    imprimir_tabla(['traza', 'esperadas', 'legado', 'adaptativo', 'despertares/min legado',
+                    'despertares/min adaptativo', 'µs/muestra'], filas)
+    return 1 if fallos else 0
+
+
+def poblar_tiendas(db, n, rng):
+    """Inserta n tiendas repartidas por Colombia (lat 0..12, lon -79..-67)"""
+    filas = ((f'Tienda {i}', f'Dirección {i}', rng.uniform(0, 12), rng.uniform(-79, -67), '300-000-0000', 'General')
+             for i in range(n))
+    with db.pool.transaction() as conn:
+        conn.execute('DELETE FROM tiendas')
+        conn.executemany(
+            'INSERT INTO tiendas (nombre, direccion, lat, lon, telefono, especialidad) VALUES (?, ?, ?, ?, ?, ?)', filas
+        )
+
+
+def tiendas_fuerza_bruta(db, lat, lon):
+    """Comportamiento anterior: leer todas las tiendas y calcular cada distancia en Python"""
+    with db.pool.connection() as conn:
+        filas = conn.execute('SELECT id, lat, lon FROM tiendas').fetchall()
+    return sorted((haversine_km(lat, lon, t_lat, t_lon), t_id) for t_id, t_lat, t_lon in filas)
+
+
+def bench_tiendas(args):
+    """k vecinos y búsqueda por radio con índice espacial vs recorrido completo"""
+    rng = random.Random(11)
+    filas = []
+    fallos = 0
+    for n in [int(t) for t in args.tamanos.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            pool = ConnectionPool(db_path)
+            db = DatabaseManager(db_path, pool=pool, cache=SIN_CACHE)
+            poblar_tiendas(db, n, rng)
+            puntos = [(rng.uniform(1, 11), rng.uniform(-78, -68)) for _ in range(20)]
+            for lat, lon in puntos:
+                # Los resultados del índice deben coincidir con la fuerza bruta
+                todas = tiendas_fuerza_bruta(db, lat, lon)
+                cercanas = [t['id'] for t in db.get_tiendas_cercanas(lat, lon, k=args.k)]
+                en_radio = [t['id'] for t in db.get_tiendas_en_radio(lat, lon, args.radio)]
+                fallos += cercanas != [t_id for _, t_id in todas[:args.k]]
+                fallos += en_radio != [t_id for distancia, t_id in todas if distancia <= args.radio]
+            iteraciones = max(1, 200000 // n)
+            lat, lon = puntos[0]
+            bruta = medir(lambda: tiendas_fuerza_bruta(db, lat, lon)[:args.k], iteraciones) / 1000
+            knn = medir(lambda: db.get_tiendas_cercanas(lat, lon, k=args.k), 200) / 1000
+            radio = medir(lambda: db.get_tiendas_en_radio(lat, lon, args.radio), 200) / 1000
+            pool.close_all()
+        filas.append([n, f'{bruta:.2f}', f'{knn:.3f}', f'{radio:.3f}', f'{bruta / knn:.0f}x'])
+    imprimir_tabla(['tiendas', 'fuerza bruta (ms)', f'{args.k} cercanas (ms)', f'radio {args.radio} km (ms)',
+                    'mejora k vecinos'], filas)
+    print('\nResultados verificados contra la fuerza bruta en 20 ubicaciones por tamaño'
+          + (f': {fallos} diferencias' if fallos else ''))
+    return 1 if fallos else 0
+
+
+def bench_distancias(args):
+    """Distancias una a una con calculate_distance vs el cálculo en lote (NumPy y Python puro)"""
+    rng = random.Random(5)
+    gps_manager = GPSManager()
+    origen = (10.4236, -75.5378)
+    numpy = App.importar_numpy()
+    filas = []
+    fallos = 0
+    for n in [int(t) for t in args.tamanos.split(',')]:
+        lats = [rng.uniform(-60, 60) for _ in range(n)]
+        lons = [rng.uniform(-180, 180) for _ in range(n)]
+        inicio = time.perf_counter()
+        escalar = [gps_manager.calculate_distance(*origen, lat, lon) for lat, lon in zip(lats, lons)]
+        t_escalar = time.perf_counter() - inicio
+
+        # Sin NumPy: el mismo distancias_km con la ruta de Python puro
+        App.np = None
+        try:
+            inicio = time.perf_counter()
+            puro = distancias_km(*origen, lats, lons)
+            t_puro = time.perf_counter() - inicio
+        finally:
+            App.np = numpy
+        error = max(abs(a - b) for a, b in zip(escalar, puro))
+
+        if numpy is not None:
+            lats_np, lons_np = numpy.array(lats), numpy.array(lons)
+            inicio = time.perf_counter()
+            vectorizado = distancias_km(*origen, lats_np, lons_np)
+            t_numpy = time.perf_counter() - inicio
+            error = max(error, float(numpy.max(numpy.abs(vectorizado - numpy.array(escalar)))))
+            # Par a par: orígenes distintos para cada punto
+            pares = distancias_km(lats_np, lons_np, lats_np[::-1], lons_np[::-1])
+            esperado = [haversine_km(a, b, c, d) for a, b, c, d in zip(lats[:100], lons[:100], lats[::-1][:100],
+                                                                       lons[::-1][:100])]
+            error = max(error, max(abs(a - b) for a, b in zip(pares[:100], esperado)))
+        fallos += error > 1e-6
+        filas.append([n, f'{t_escalar * 1000:.1f}', f'{t_puro * 1000:.1f}',
+                      f'{t_numpy * 1000:.1f}' if numpy is not None else '-',
+                      f'{t_escalar / t_numpy:.0f}x' if numpy is not None else '-', f'{error:.1e}'])
+    imprimir_tabla(['puntos', 'escalar (ms)', 'lote Python (ms)', 'lote NumPy (ms)', 'mejora NumPy',
+                    'error máx (km)'], filas)
+    if numpy is None:
+        print('\nNumPy no está instalado: solo se mide la ruta de Python puro')
+    return 1 if fallos else 0
+
+
+def recorrido_simulado(duracion, rng, hz=1.0, velocidad=1.4):
+    """Caminata real y lecturas GPS ruidosas: ([(t, lat, lon)], GPSTrack)
+
+    La precisión reportada varía entre 5 y 30 m y el error sigue esa precisión;
+    un 3% de las lecturas son saltos de varios cientos de metros con precisión mala.
+    """
+    lat, lon = 10.4236, -75.5378
+    rumbo = 0.0
+    reales = []
+    puntos = []
+    for i in range(int(duracion * hz)):
+        t = i / hz
+        if rng.random() < 0.02:
+            rumbo += rng.uniform(-math.pi / 2, math.pi / 2)  # Giro en una esquina
+        paso = velocidad / hz / 1000 / (math.pi * 6371 / 180)  # Grados de latitud
+        lat += paso * math.cos(rumbo)
+        lon += paso * math.sin(rumbo) / math.cos(math.radians(lat))
+        reales.append((t, lat, lon))
+        if rng.random() < 0.03:
+            precision = rng.uniform(300, 800)
+        else:
+            precision = rng.uniform(5, 30)
+        error = rng.gauss(0, precision) / 1000 / (math.pi * 6371 / 180)
+        angulo = rng.uniform(0, 2 * math.pi)
+        puntos.append((t, lat + error * math.cos(angulo), lon + error * math.sin(angulo), precision))
+    return reales, GPSTrack(puntos)
+
+
+def bench_gps(args):
+    """Error del GPS crudo vs suavizado, avisos con throttle y conteo de referencias"""
+    if args.recorrido:
+        track = GPSTrack.cargar(args.recorrido)
+        reales = None
+    else:
+        reales, track = recorrido_simulado(args.duracion, random.Random(8))
+    manager = GPSManager(intervalo_minimo=args.intervalo)
+    errores_crudos = []
+    errores_suavizados = []
+    for i, (t, lat, lon, precision) in enumerate(track.puntos):
+        manager.procesar(t, lat, lon, precision)
+        if reales is not None and precision <= manager.precision_maxima:
+            _, real_lat, real_lon = reales[i]
+            lectura = manager.ultima_lectura
+            errores_crudos.append(haversine_km(real_lat, real_lon, lat, lon) * 1000)
+            errores_suavizados.append(haversine_km(real_lat, real_lon, lectura['lat'], lectura['lon']) * 1000)
+
+    # Conteo de referencias: dos pantallas comparten un solo listener
+    compartido = GPSManager(fuente=GPSTrack(track.puntos[:1]))
+    compartido.start()
+    compartido.start()
+    compartido.stop()
+    referencias_ok = compartido.activo and compartido.fuente._evento is not None
+    compartido.stop()
+    compartido.stop()  # Un stop de más no deja el contador negativo
+    referencias_ok = referencias_ok and not compartido.activo and compartido.fuente._evento is None
+    compartido.start()
+    referencias_ok = referencias_ok and compartido.activo
+    compartido.stop()
+
+    filas = [['lecturas', manager.lecturas], ['descartadas por precisión', manager.descartadas],
+             [f'avisos (throttle {args.intervalo} s)', manager.avisos],
+             ['conteo de referencias', 'OK' if referencias_ok else 'FALLO']]
+    mejora = True
+    if errores_crudos:
+        cuantil = lambda valores: sorted(valores)[int(len(valores) * 0.95)]
+        filas += [['error medio crudo (m)', f'{statistics.mean(errores_crudos):.1f}'],
+                  ['error medio suavizado (m)', f'{statistics.mean(errores_suavizados):.1f}'],
+                  ['error p95 crudo (m)', f'{cuantil(errores_crudos):.1f}'],
+                  ['error p95 suavizado (m)', f'{cuantil(errores_suavizados):.1f}']]
+        mejora = statistics.mean(errores_suavizados) < statistics.mean(errores_crudos)
+    imprimir_tabla(['métrica', 'valor'], filas)
+    return 0 if referencias_ok and mejora else 1
+
+
+def recarga_legada(screen):
+    """load_cart_items anterior: consulta el carrito completo, reemplaza la lista y suma en Python"""
+    items = screen.db.get_carrito()
+    screen.cart_list.data = [
+        {'item_id': item[0], 'producto_id': item[5], 'nombre': item[1], 'cantidad': item[2],
+         'precio_unitario_centavos': item[3], 'subtotal_centavos': item[4], 'accion': screen.remove_item,
+         'cambiar': screen.change_quantity}
+        for item in items
+    ]
+    total = sum(item[4] for item in items)
+    screen.total_label.text = f'Total: {formatear_precio(total)}'
+
+
+def bench_carrito(args):
+    """Latencia por operación del carrito: recarga completa vs deltas del modelo observable"""
+    filas = []
+    fallos = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        pool = ConnectionPool(db_path)
+        db = DatabaseManager(db_path, pool=pool, cache=SIN_CACHE)
+        tamanos = [int(t) for t in args.tamanos.split(',')]
+        poblar_catalogo(db, max(tamanos) + 1)
+        with pool.connection() as conn:
+            ids = [fila[0] for fila in conn.execute('SELECT id FROM productos ORDER BY id')]
+        screen = CartScreen(carrito=CartModel(db), name='cart')
+        screen.cart_list.size = (400, 600)
+        for n in tamanos:
+            db.limpiar_carrito()
+            db.agregar_lote_al_carrito((producto_id, 1) for producto_id in ids[:n])
+            screen.carrito.reconciliar()
+            screen.cart_list.refresh_views()
+            objetivo = ids[n // 2]  # Una línea del medio del carrito
+            extra = ids[n]  # Un producto que no está en el carrito
+
+            # (operación medida, deshacer sin medir) para que cada repetición sea un cambio real;
+            # el legado también recarga al deshacer o Kivy descartaría la lista idéntica sin hacer layout
+            legado = {
+                'sumar 1': (lambda: (db.agregar_al_carrito(objetivo), recarga_legada(screen)),
+                            lambda: (db.agregar_al_carrito(objetivo, -1), recarga_legada(screen))),
+                'cambiar cantidad': (lambda: (db.actualizar_cantidad_carrito(objetivo, 3), recarga_legada(screen)),
+                                     lambda: (db.actualizar_cantidad_carrito(objetivo, 1), recarga_legada(screen))),
+                'agregar línea': (lambda: (db.agregar_al_carrito(extra), recarga_legada(screen)),
+                                  lambda: (db.eliminar_producto_del_carrito(extra), recarga_legada(screen))),
+                'eliminar línea': (lambda: (db.eliminar_producto_del_carrito(objetivo), recarga_legada(screen)),
+                                   lambda: (db.agregar_al_carrito(objetivo), recarga_legada(screen))),
+            }
+            modelo = {
+                'sumar 1': (lambda: screen.carrito.agregar(objetivo),
+                            lambda: screen.carrito.agregar(objetivo, -1)),
+                'cambiar cantidad': (lambda: screen.carrito.cambiar_cantidad(objetivo, 3),
+                                     lambda: screen.carrito.cambiar_cantidad(objetivo, 1)),
+                'agregar línea': (lambda: screen.carrito.agregar(extra),
+                                  lambda: screen.carrito.eliminar(extra)),
+                'eliminar línea': (lambda: screen.carrito.eliminar(objetivo),
+                                   lambda: screen.carrito.agregar(objetivo)),
+            }
+            for operacion in legado:
+                tiempos = {}
+                for nombre, ops in (('legado', legado), ('modelo', modelo)):
+                    medida, deshacer = ops[operacion]
+                    datos = []
+                    vista = []
+                    for _ in range(args.repeticiones):
+                        inicio = time.perf_counter()
+                        medida()
+                        datos.append(time.perf_counter() - inicio)
+                        # Lo que haría el siguiente frame: procesar los cambios pendientes de la lista
+                        inicio = time.perf_counter()
+                        screen.cart_list.refresh_views()
+                        vista.append(time.perf_counter() - inicio)
+                        deshacer()
+                        screen.cart_list.refresh_views()
+                    tiempos[nombre] = (statistics.median(datos) * 1000, statistics.median(vista) * 1000)
+                    if nombre == 'legado':
+                        screen.carrito.reconciliar()  # El modelo vuelve a partir del estado real
+                (datos_legado, vista_legado), (datos_modelo, vista_modelo) = tiempos['legado'], tiempos['modelo']
+                filas.append([n, operacion, f'{datos_legado:.3f}', f'{datos_modelo:.3f}',
+                              f'{datos_legado / datos_modelo:.1f}x', f'{vista_legado:.3f}', f'{vista_modelo:.3f}'])
+            # Los deltas deben dejar el mismo total y las mismas líneas que una reconciliación
+            # (al eliminar, la última fila ocupa el lugar de la eliminada: el orden puede diferir)
+            total_incremental = screen.carrito.total_centavos
+            datos_incrementales = sorted((d['producto_id'], d['cantidad']) for d in screen.cart_list.data)
+            fallos += screen.posiciones != {d['producto_id']: i for i, d in enumerate(screen.cart_list.data)}
+            screen.carrito.reconciliar()
+            fallos += total_incremental != screen.carrito.total_centavos
+            fallos += datos_incrementales != sorted((d['producto_id'], d['cantidad']) for d in screen.cart_list.data)
+        pool.close_all()
+    imprimir_tabla(['líneas', 'operación', 'recarga completa (ms)', 'delta (ms)', 'mejora',
+                    'layout tras recarga (ms)', 'layout tras delta (ms)'], filas)
+    print('\nLas columnas de operación incluyen SQL, modelo y datos de la lista; el layout es el')
+    print('trabajo de RecycleView en el frame siguiente (repinta las filas visibles en ambos casos)')
+    if fallos:
+        print(f'\n{fallos} diferencia(s) entre el modelo incremental y la reconciliación')
+    return 1 if fallos else 0
+
+
+def almacenamiento_lento(latencia_ms):
+    """on_connect que simula flash lenta: cada COMMIT tarda latencia_ms más (el fsync)"""
+    def pausar(sentencia):
+        if sentencia == 'COMMIT':
+            time.sleep(latencia_ms / 1000)
+
+    def configurar(conn):
+        conn.set_trace_callback(pausar)
+    return configurar
+
+
+def sesion_de_toques(db, executor, ids, codigos, duracion, toques):
+    """Hace correr el Clock de Kivy mientras el usuario agrega productos y confirma pedidos
+
+    Devuelve las estadísticas del FrameMonitor y si el modelo coincide con SQLite al final.
+    """
+    from kivy.clock import Clock
+
+    carrito = CartModel(db, executor)
+    carrito.reconciliar()
+    monitor = FrameMonitor(db.pool)
+    contador = [0]
+
+    def tocar(dt):
+        contador[0] += 1
+        if contador[0] % 10 == 0:
+            carrito.crear_pedido('Dirección de prueba', '0,0', on_error=lambda e: None)
+        elif contador[0] % 3 == 0:
+            # Lectura del escáner: consulta por código
+            codigo = random.choice(codigos)
+            if executor is None:
+                db.get_producto_por_codigo(codigo)
+            else:
+                executor.leer(db.get_producto_por_codigo, codigo)
+        else:
+            carrito.agregar(random.choice(ids))
+
+    Clock.tick()
+    monitor.start()
+    evento = Clock.schedule_interval(tocar, 1 / toques)
+    fin = time.perf_counter() + duracion
+    while time.perf_counter() < fin:
+        Clock.tick()
+    evento.cancel()
+    monitor.stop()
+    # Esperar a que se vacíen las colas y se entreguen los callbacks pendientes
+    while executor is not None and executor.pendientes() != (0, 0):
+        Clock.tick()
+    listo = []
+    carrito.reconciliar(on_done=listo.append)
+    while not listo:
+        Clock.tick()
+    total, lineas = carrito.total_centavos, dict((pid, l['cantidad']) for pid, l in carrito.lineas.items())
+    consistente = (total == db.get_total_carrito()[2]
+                   and lineas == {fila[5]: fila[2] for fila in db.get_carrito()})
+    return monitor.estadisticas(), consistente, contador[0]
+
+
+def rendimiento_escritor(db, ids, lote_max, escrituras):
+    """Escrituras/s del hilo escritor agrupando hasta lote_max operaciones por transacción"""
+    executor = DatabaseExecutor(db, lectores=0, max_pendientes=escrituras, lote_max=lote_max)
+    inicio = time.perf_counter()
+    futures = [executor.escribir(db.agregar_al_carrito, ids[i % len(ids)]) for i in range(escrituras)]
+    for future in futures:
+        future.result()
+    duracion = time.perf_counter() - inicio
+    executor.stop()
+    return escrituras / duracion, executor.lotes
+
+
+def bench_executor(args):
+    """Frames perdidos con SQLite en el hilo de UI vs en el DatabaseExecutor"""
+    random.seed(7)
+    filas = []
+    fallos = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        pool = ConnectionPool(db_path, pragmas={'synchronous': 'FULL'})
+        db = DatabaseManager(db_path, pool=pool, cache=SIN_CACHE)
+        poblar_catalogo(db, 2000)
+        with pool.transaction() as conn:
+            conn.execute('UPDATE productos SET stock = 1000000')
+            productos = conn.execute('SELECT id, codigo_barras FROM productos').fetchall()
+        ids = [producto_id for producto_id, _ in productos]
+        codigos = [codigo for _, codigo in productos]
+        # Conexiones nuevas con la latencia simulada
+        pool.on_connect['almacenamiento_lento'] = almacenamiento_lento(args.latencia_commit)
+        pool.close_all()
+
+        for nombre, executor in (('síncrono', None), ('executor', DatabaseExecutor(db))):
+            db.limpiar_carrito()
+            stats, consistente, toques = sesion_de_toques(db, executor, ids, codigos, args.duracion, args.toques)
+            filas.append([nombre, toques, stats['frames'], stats['perdidos'], stats['perdidos_por_io'],
+                          f"{stats['io_hilo_ui_ms']:.1f}", f"{stats['p50_ms']:.1f}", f"{stats['p95_ms']:.1f}",
+                          'OK' if consistente else 'FALLO'])
+            if executor is not None:
+                executor.stop()
+                fallos += stats['perdidos_por_io'] > 0 or stats['io_hilo_ui_ms'] > 0
+            fallos += not consistente
+        imprimir_tabla(['modo', 'toques', 'frames', 'perdidos', 'perdidos por I/O', 'I/O en UI (ms)',
+                        'p50 (ms)', 'p95 (ms)', 'carrito'], filas)
+
+        print()
+        filas = []
+        for lote_max in (1, 32):
+            db.limpiar_carrito()
+            por_segundo, lotes = rendimiento_escritor(db, ids, lote_max, args.escrituras)
+            filas.append([lote_max, lotes, f'{por_segundo:,.0f}'])
+        imprimir_tabla(['lote máximo', 'transacciones', 'escrituras/s'], filas)
+
+        # Backpressure: una cola pequeña rechaza en vez de crecer sin límite
+        executor = DatabaseExecutor(db, lectores=0, max_pendientes=8)
+        rechazadas = 0
+        for _ in range(100):
+            try:
+                executor.escribir(db.agregar_al_carrito, ids[0])
+            except ColaLlenaError:
+                rechazadas += 1
+        print(f'\nBackpressure: {rechazadas} de 100 escrituras rechazadas con una cola de 8')
+        # Detener (y vaciar) los executors antes de cerrar el pool que usan
+        executor.stop()
+        pool.close_all()
+    return 1 if fallos else 0
+
+
+# Lanza la app real y la cierra en el primer frame imprimiendo el perfil de arranque;
+# 'legado' reproduce el arranque anterior (todas las pantallas, cámara encendida, imports al inicio)
+SCRIPT_PRIMER_FRAME = '''
+import json, sys
+sys.path.insert(0, {ruta!r})
+import App
+
+class Medicion(App.ComputerStoreApp):
+    def build(self):
+        sm = super().build()
+        if {legado!r}:
+            with self.perfil.medir('plyer y numpy al importar'):
+                from plyer import gps, accelerometer
+                App.importar_numpy()
+            for nombre in ('cart', 'scanner', 'map'):
+                sm.get_screen(nombre)
+            with self.perfil.medir('cámara encendida'):
+                sm.get_screen('scanner').on_enter()
+        self.perfil.on_primer_frame.append(self.terminar)
+        return sm
+
+    def terminar(self, perfil):
+        print('PERFIL ' + json.dumps(perfil.reporte()))
+        self.stop()
+
+Medicion().run()
+'''
+
+
+def medir_primer_frame(legado, cwd):
+    """Ejecuta la app en un proceso nuevo y devuelve su perfil de arranque"""
+    # Kivy busca el .kv junto al archivo de la clase App: el script tiene que estar en disco
+    script = os.path.join(cwd, 'medir_primer_frame.py')
+    with open(script, 'w', encoding='utf-8') as f:
+        f.write(SCRIPT_PRIMER_FRAME.format(ruta=os.path.dirname(os.path.abspath(__file__)), legado=legado))
+    salida = subprocess.run([sys.executable, script], cwd=cwd, capture_output=True, text=True,
+                            env=dict(os.environ, KIVY_NO_ARGS='1', KIVY_NO_CONSOLELOG='1'), timeout=120)
+    for linea in salida.stdout.splitlines():
+        if linea.startswith('PERFIL '):
+            return json.loads(linea[len('PERFIL '):])
+    raise RuntimeError(f'La app no llegó al primer frame:\n{salida.stderr[-2000:]}')
+
+
+def bench_primer_frame(args):
+    """Tiempo hasta el primer frame: todas las pantallas al inicio vs construcción diferida"""
+    resultados = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for nombre, legado in (('antes (todo al inicio)', True), ('diferido', False)):
+            medir_primer_frame(legado, tmp)  # Calentamiento: crea la base y llena la caché del SO
+            perfiles = [medir_primer_frame(legado, tmp) for _ in range(args.repeticiones)]
+            componentes = {}
+            for perfil in perfiles:
+                for componente, ms in perfil['componentes_ms'].items():
+                    componentes.setdefault(componente, []).append(ms)
+            resultados[nombre] = ({c: statistics.median(v) for c, v in componentes.items()},
+                                  statistics.median(p['primer_frame_ms'] for p in perfiles))
+    nombres = list(resultados)
+    orden = []
+    for componentes, _ in resultados.values():
+        orden += [c for c in componentes if c not in orden]
+    filas = [[c] + [f'{resultados[n][0][c]:.1f}' if c in resultados[n][0] else '-' for n in nombres]
+             for c in orden]
+    filas.append(['primer frame'] + [f'{resultados[n][1]:.1f}' for n in nombres])
+    imprimir_tabla(['componente (mediana ms)'] + nombres, filas)
+
+
+def imagenes_sinteticas(directorio, n, ancho, alto):
+    """Escribe n JPEG de ancho x alto con gradientes distintos; devuelve sus nombres"""
+    from kivy.core.image import ImageLoader
+    os.makedirs(directorio, exist_ok=True)
+    guardar = next(loader for loader in ImageLoader.loaders if loader.can_save('jpg', False))
+    fila_x = bytes(x * 255 // ancho for x in range(ancho))
+    nombres = []
+    for i in range(n):
+        pixels = bytearray(ancho * alto * 3)
+        for y in range(alto):
+            inicio = y * ancho * 3
+            pixels[inicio:inicio + ancho * 3:3] = fila_x
+            pixels[inicio + 1:inicio + ancho * 3:3] = bytes([(y * 255 // alto + i * 37) % 256]) * ancho
+            pixels[inicio + 2:inicio + ancho * 3:3] = bytes([(i * 91) % 256]) * ancho
+        nombre = f'producto_{i}.jpg'
+        guardar.save(os.path.join(directorio, nombre), ancho, alto, 'rgb', bytes(pixels), False, 'jpg')
+        nombres.append(nombre)
+    return nombres
+
+
+def desplazamiento(imagenes, visibles, velocidad, mostrar):
+    """Hace correr el Clock mientras la lista avanza velocidad filas por frame
+
+    mostrar(imagen_url) es lo que hace cada fila que entra en pantalla; devuelve las
+    estadísticas de frames y el tiempo hasta que todas las filas tienen miniatura.
+    """
+    from kivy.clock import Clock
+
+    monitor = FrameMonitor(ConnectionPool(':memory:'))
+    posicion = [0]
+    mostradas = set()
+
+    def avanzar(dt):
+        desde = posicion[0]
+        posicion[0] = min(len(imagenes), desde + velocidad)
+        for imagen_url in imagenes[desde:posicion[0]]:
+            mostrar(imagen_url, lambda url, textura: mostradas.add(url))
+
+    # Primera pantalla antes de empezar a desplazar
+    for imagen_url in imagenes[:visibles]:
+        mostrar(imagen_url, lambda url, textura: mostradas.add(url))
+    posicion[0] = visibles
+    Clock.tick()
+    monitor.start()
+    inicio = time.perf_counter()
+    evento = Clock.schedule_interval(avanzar, 0)
+    while posicion[0] < len(imagenes):
+        Clock.tick()
+    evento.cancel()
+    monitor.stop()
+    while len(mostradas) < len(set(imagenes)) and time.perf_counter() - inicio < 60:
+        Clock.tick()
+    return monitor.estadisticas(), time.perf_counter() - inicio
+
+
+def bench_miniaturas(args):
+    """Desplazamiento del catálogo con imágenes: decodificar en el hilo de UI vs miniaturas en caché"""
+    from kivy.core.image import Image as CoreImage
+
+    pillow = importar_pillow()
+    if pillow is None:
+        print('Las miniaturas se generan con Pillow: instálalo (pip install pillow)')
+        return 2
+    filas = []
+    fallos = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        directorio_imagenes = os.path.join(tmp, 'imagenes')
+        alto = args.ancho * 3 // 4
+        inicio = time.perf_counter()
+        imagenes = imagenes_sinteticas(directorio_imagenes, args.imagenes, args.ancho, alto)
+        print(f'{args.imagenes} imágenes de {args.ancho}x{alto} generadas en {time.perf_counter() - inicio:.1f} s\n')
+
+        # Antes: cada fila cargaba la imagen completa (decodificar + textura) en el hilo de UI
+        texturas_legado = []
+
+        def mostrar_legado(imagen_url, callback):
+            textura = CoreImage(os.path.join(directorio_imagenes, imagen_url), nocache=True).texture
+            texturas_legado.append(textura)
+            callback(imagen_url, textura)
+
+        stats, espera = desplazamiento(imagenes, args.visibles, args.velocidad, mostrar_legado)
+        memoria_legado = sum(t.width * t.height * 4 for t in texturas_legado)
+        filas.append(['antes (imagen completa en UI)', stats['perdidos'], f"{stats['p95_ms']:.1f}",
+                      f'{espera:.2f}', f'{memoria_legado / 2**20:.1f}', '-', '-'])
+
+        directorio_cache = os.path.join(tmp, 'miniaturas')
+        escenarios = [('miniaturas, caché vacía', True), ('miniaturas, caché en disco', True),
+                      ('miniaturas, caché en memoria', False)]
+        cache = None
+        for nombre, nueva in escenarios:
+            if nueva:
+                cache = ThumbnailCache(directorio_imagenes, directorio_cache, lado=args.lado,
+                                       memoria_maxima=args.memoria * 2**20)
+            antes = cache.estadisticas()
+
+            def mostrar(imagen_url, callback):
+                textura = cache.obtener(imagen_url, callback)
+                if textura is not None:
+                    callback(imagen_url, textura)
+
+            stats, espera = desplazamiento(imagenes, args.visibles, args.velocidad, mostrar)
+            despues = cache.estadisticas()
+            solicitudes = despues['solicitudes'] - antes['solicitudes']
+            en_memoria = despues['hits_memoria'] - antes['hits_memoria']
+            en_disco = despues['hits_disco'] - antes['hits_disco']
+            generadas = despues['generadas'] - antes['generadas']
+            filas.append([nombre, stats['perdidos'], f"{stats['p95_ms']:.1f}", f'{espera:.2f}',
+                          f"{despues['memoria_bytes'] / 2**20:.1f}",
+                          f'{en_memoria / solicitudes:.0%}' if solicitudes else '-',
+                          f'{en_disco / (en_disco + generadas):.0%}' if en_disco + generadas else '-'])
+            fallos += despues['errores']
+        imprimir_tabla(['escenario', 'frames perdidos', 'frame p95 (ms)', 'hasta ver todas (s)',
+                        'texturas (MiB)', 'aciertos memoria', 'aciertos disco'], filas)
+
+        # Las miniaturas en disco conservan la proporción y el color de cada zona de la original
+        archivos = [os.path.join(raiz, f) for raiz, _, nombres in os.walk(directorio_cache) for f in nombres]
+        tamano_disco = sum(os.path.getsize(f) for f in archivos)
+        ruta = os.path.join(directorio_imagenes, imagenes[0])
+        ancho, alto_miniatura, rgba = leer_png(cache.ruta_miniatura(cache._hash_contenido(ruta)))
+        fallos += (ancho, alto_miniatura) != (args.lado, args.lado * alto // args.ancho)
+        with pillow.open(ruta) as original:
+            original = original.convert('RGB')
+        for x, y in ((0, 0), (ancho // 2, alto_miniatura // 2), (ancho - 1, alto_miniatura - 1)):
+            centro = original.getpixel((int((x + 0.5) * args.ancho / ancho), int((y + 0.5) * alto / alto_miniatura)))
+            pixel = rgba[(y * ancho + x) * 4:(y * ancho + x) * 4 + 3]
+            fallos += max(abs(a - b) for a, b in zip(centro, pixel)) > 16
+        print(f'\n{len(archivos)} miniaturas de {args.lado} px en disco: {tamano_disco / 1024:.0f} KiB'
+              f' (originales: {sum(os.path.getsize(os.path.join(directorio_imagenes, i)) for i in imagenes) / 2**20:.1f} MiB)')
+    if fallos:
+        print(f'\n{fallos} error(es) en las miniaturas')
+    return 1 if fallos else 0
+
+
+def escribir_feed(ruta, filas, inicio=0, variante=0, invalido=False, recategorizar=False):
+    """Escribe un feed sintético del proveedor (CSV o JSONL según la extensión) sin guardarlo en memoria
+
+    variante cambia el precio y stock de un 10 % de las filas, como una actualización nocturna;
+    recategorizar mueve esas mismas filas a la categoría siguiente; con invalido=True
+    ninguna fila tiene un precio válido.
+    """
+    import csv
+    import json
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f) if not ruta.endswith('.jsonl') else None
+        if escritor:
+            escritor.writerow(COLUMNAS_CATALOGO)
+        for i in range(inicio, inicio + filas):
+            cambio = variante if i % 10 == 0 else 0
+            categoria = CATEGORIAS[(i + (recategorizar and i % 10 == 0)) % len(CATEGORIAS)]
+            fila = (f'7{i:012d}', f'Producto {i} modelo {i * 7919 % 10007}', categoria,
+                    'sin precio' if invalido else 1000.0 + i % 5000 + cambio, f'Descripción del producto {i}', (i + cambio) % 200, f'p{i % 5000}.jpg')
+            if escritor:
+                escritor.writerow(fila)
+            else:
+                f.write(json.dumps(dict(zip(COLUMNAS_CATALOGO, fila)), ensure_ascii=False) + '\n')
+
+
+def importar_por_fila(db, ruta):
+    """Referencia: un upsert por fila en una transacción, con triggers del FTS e índices activos"""
+    inicio = time.perf_counter()
+    filas = 0
+    with db.pool.transaction() as conn:
+        for producto in leer_catalogo(ruta):
+            conn.execute(SQL_UPSERT_PRODUCTO, producto)
+            filas += 1
+    db.cache.limpiar()
+    return filas / (time.perf_counter() - inicio)
+
+
+def bench_importacion(args):
+    """Importación en streaming del feed del proveedor: filas/s, memoria y exportación"""
+    if args.filas < 10 * args.bloque:
+        # La prueba de memoria compara un bloque contra al menos diez
+        print(f'--filas debe ser al menos 10 veces --bloque ({10 * args.bloque})')
+        return 2
+    filas = []
+    fallos = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'feed.csv')
+        jsonl_path = os.path.join(tmp, 'feed.jsonl')
+        escribir_feed(csv_path, args.filas)
+        escribir_feed(jsonl_path, args.filas)
+        print(f'Feed de {args.filas} filas: CSV {os.path.getsize(csv_path) / 2**20:.1f} MiB, '
+              f'JSONL {os.path.getsize(jsonl_path) / 2**20:.1f} MiB\n')
+
+        def base_nueva(nombre):
+            db_path = os.path.join(tmp, f'{nombre}.db')
+            return DatabaseManager(db_path, pool=ConnectionPool(db_path))
+
+        db = base_nueva('por_fila')
+        filas.append(['upsert por fila, triggers activos (CSV)', args.filas,
+                      f'{importar_por_fila(db, csv_path):,.0f}', '-', '-', '-'])
+        db.pool.close_all()
+
+        for nombre, ruta in (('CSV', csv_path), ('JSONL', jsonl_path)):
+            db = base_nueva(nombre)
+            with db.pool.connection() as conn:
+                ejemplo = conn.execute('SELECT COUNT(*) FROM productos').fetchone()[0]
+            r = db.importar_catalogo(ruta, tamano_bloque=args.bloque)
+            filas.append([f'streaming, índices diferidos ({nombre})', r['filas'], f"{r['filas_por_segundo']:,.0f}",
+                          r['insertadas'], r['actualizadas'], r['sin_cambios']])
+            if nombre == 'CSV':
+                # Segunda pasada: el mismo feed (nada cambia) y uno con el 10 % de cambios
+                r = db.importar_catalogo(ruta, tamano_bloque=args.bloque)
+                filas.append(['reimportar sin cambios (CSV)', r['filas'], f"{r['filas_por_segundo']:,.0f}",
+                              r['insertadas'], r['actualizadas'], r['sin_cambios']])
+                cambios_path = os.path.join(tmp, 'feed_cambios.csv')
+                escribir_feed(cambios_path, args.filas, variante=5)
+                r = db.importar_catalogo(cambios_path, tamano_bloque=args.bloque)
+                filas.append(['reimportar con 10 % de cambios (CSV)', r['filas'], f"{r['filas_por_segundo']:,.0f}",
+                              r['insertadas'], r['actualizadas'], r['sin_cambios']])
+                fallos += r['actualizadas'] != len(range(0, args.filas, 10))
+                # Con ventas hechas, recategorizar dispara los triggers del resumen de ventas:
+                # sus escrituras no deben contarse como filas actualizadas
+                db.agregar_lote_al_carrito([(db.get_producto_por_codigo(f'7{i:012d}')[0], 1) for i in (10, 20, 30)])
+                db.crear_pedido('Dirección', '0,0')
+                recategorizado_path = os.path.join(tmp, 'feed_categorias.csv')
+                escribir_feed(recategorizado_path, args.filas, variante=5, recategorizar=True)
+                r = db.importar_catalogo(recategorizado_path, tamano_bloque=args.bloque)
+                filas.append(['reimportar con categorías nuevas (CSV)', r['filas'], f"{r['filas_por_segundo']:,.0f}",
+                              r['insertadas'], r['actualizadas'], r['sin_cambios']])
+                fallos += r['actualizadas'] != len(range(0, args.filas, 10)) or r['sin_cambios'] < 0
+                db_csv = db
+            else:
+                db.pool.close_all()
+        imprimir_tabla(['modo', 'filas', 'filas/s', 'insertadas', 'actualizadas', 'sin cambios'], filas)
+
+        # El catálogo queda consultable: FTS, listado y conteo coinciden con el feed
+        ultimo = args.filas - 1
+        encontrados = db_csv.buscar_productos(f'Producto {ultimo}', columnas='productos.codigo_barras')
+        fallos += (f'7{ultimo:012d}',) not in encontrados
+        with db_csv.pool.connection() as conn:
+            total = conn.execute('SELECT COUNT(*) FROM productos').fetchone()[0]
+            # Lanza si el índice FTS no coincide con la tabla tras reconstruirlo
+            conn.execute("INSERT INTO productos_fts(productos_fts) VALUES ('integrity-check')")
+        fallos += total != args.filas + ejemplo
+
+        # Exportar y volver a importar en una base nueva debe dar el mismo catálogo
+        print()
+        filas = []
+        for extension in ('csv', 'jsonl'):
+            salida = os.path.join(tmp, f'exportado.{extension}')
+            inicio = time.perf_counter()
+            exportadas = db_csv.exportar_catalogo(salida)
+            segundos = time.perf_counter() - inicio
+            copia = base_nueva(f'copia_{extension}')
+            r = copia.importar_catalogo(salida, tamano_bloque=args.bloque)
+            with db_csv.pool.connection() as a, copia.pool.connection() as b:
+                consulta = f'SELECT {", ".join(COLUMNAS_PRODUCTO_CATALOGO)} FROM productos ORDER BY codigo_barras'
+                iguales = all(x == y for x, y in zip(a.execute(consulta), b.execute(consulta)))
+            fallos += not iguales or r['filas'] != exportadas
+            filas.append([extension.upper(), exportadas, f'{exportadas / segundos:,.0f}',
+                          'OK' if iguales else 'FALLO'])
+            copia.pool.close_all()
+        imprimir_tabla(['exportación', 'filas', 'filas/s', 'ida y vuelta'], filas)
+        db_csv.pool.close_all()
+
+        # Memoria: el pico no debe crecer con el tamaño del archivo
+        print()
+        filas = []
+        # Archivos de bloques completos (uno contra todos los que entran en --filas): así
+        # los picos son comparables; el feed inválido no debe acumular sus errores
+        completos = args.filas // args.bloque * args.bloque
+        for n, invalido in ((args.bloque, False), (completos, False), (completos, True)):
+            ruta = os.path.join(tmp, f'memoria_{n}_{invalido}.csv')
+            escribir_feed(ruta, n, invalido=invalido)
+            db = base_nueva(f'memoria_{n}_{invalido}')
+            tracemalloc.start()
+            r = db.importar_catalogo(ruta, tamano_bloque=args.bloque)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            filas.append([n, 'inválidas' if invalido else 'válidas', f'{pico / 2**20:.1f}'])
+            fallos += r['rechazadas'] != (n if invalido else 0) or len(r['errores']) > 20
+            db.pool.close_all()
+        imprimir_tabla(['filas', 'feed', 'pico de memoria Python (MiB)'], filas)
+        fallos += any(float(fila[2]) > 2 * float(filas[0][2]) + 1 for fila in filas[1:])
+    if fallos:
+        print(f'\n{fallos} verificación(es) fallida(s)')
+    return 1 if fallos else 0
+
+
+def bench_centavos(args):
+    """Exactitud y costo del total del carrito: float en pesos vs centavos enteros"""
+    rng = random.Random(7)
+    filas_exactitud, filas_tiempo = [], []
+    fallos = 0
+    for n in (int(t) for t in args.lineas.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            db = DatabaseManager(db_path, pool=ConnectionPool(db_path), cache=SIN_CACHE)
+            # Precios con centavos del rango del catálogo (hasta ~20 millones de pesos)
+            precios = [rng.randrange(100, 2_000_000_000) for _ in range(n)]
+            with db.pool.transaction() as conn:
+                conn.executemany('''
+                    INSERT INTO productos (nombre, categoria, precio_centavos, stock, codigo_barras)
+                    VALUES (?, 'Bench', ?, 1000000, ?)
+                ''', ((f'Producto {i}', precio, f'8{i:012d}') for i, precio in enumerate(precios)))
+                ids = [fila[0] for fila in conn.execute("SELECT id FROM productos WHERE categoria = 'Bench' ORDER BY id")]
+            precio_de = dict(zip(ids, precios))
+            db.agregar_lote_al_carrito((producto_id, rng.randint(1, 5)) for producto_id in ids)
+            
+            # El modelo aplica deltas en centavos; en paralelo, el total anterior en float y pesos
+            carrito = CartModel(db)
+            carrito.reconciliar()
+            cantidades = {pid: linea['cantidad'] for pid, linea in carrito.lineas.items()}
+            total_float = sum(cantidad * (precio_de[pid] / 100) for pid, cantidad in cantidades.items())
+            for _ in range(args.operaciones):
+                producto_id = rng.choice(ids)
+                cantidad = rng.choice((0, 1, 2, 3, 7, 12))
+                anterior = cantidades.pop(producto_id, 0)
+                if anterior == 0:
+                    if cantidad == 0:
+                        continue
+                    carrito.agregar(producto_id, cantidad)
+                else:
+                    carrito.cambiar_cantidad(producto_id, cantidad)
+                if cantidad:
+                    cantidades[producto_id] = cantidad
+                total_float += (cantidad - anterior) * (precio_de[producto_id] / 100)
+            exacto = sum(cantidad * precio_de[pid] for pid, cantidad in cantidades.items())
+            
+            # SUM sobre valores REAL en pesos, como guardaba el esquema anterior
+            with db.pool.connection() as conn:
+                suma_real = conn.execute(
+                    'SELECT SUM(cantidad * (precio_unitario_centavos / 100.0)) FROM carrito'
+                ).fetchone()[0]
+            lineas, _, total_sql = db.get_total_carrito()
+            errores = [
+                ('total por deltas (float, pesos)', total_float * 100 - exacto),
+                ('SUM sobre REAL (pesos)', suma_real * 100 - exacto),
+                ('total por deltas (centavos)', carrito.total_centavos - exacto),
+                ('SUM en centavos (SQL)', total_sql - exacto),
+            ]
+            for nombre, error in errores:
+                # Un total en pesos es exacto si al redondearlo a dos decimales da la suma correcta
+                filas_exactitud.append([lineas, nombre, f'{error:+.4f}', 'sí' if round(error) == 0 else 'NO'])
+            fallos += carrito.total_centavos != exacto or total_sql != exacto
+            
+            # Mostrar el total: sumar las filas en Python vs agregado SQL vs total mantenido
+            casos = [
+                ('suma en Python de get_carrito()', lambda: sum(fila[4] for fila in db.get_carrito())),
+                ('get_total_carrito() (agregado SQL)', lambda: db.get_total_carrito()[2]),
+                ('CartModel.total_centavos', lambda: carrito.total_centavos),
+            ]
+            for nombre, func in casos:
+                tiempos = []
+                for _ in range(20):
+                    inicio = time.perf_counter()
+                    func()
+                    tiempos.append(time.perf_counter() - inicio)
+                filas_tiempo.append([lineas, nombre, f'{statistics.median(tiempos) * 1000:.3f}'])
+            db.pool.close_all()
+    imprimir_tabla(['líneas', 'total', 'error (centavos)', 'exacto al centavo'], filas_exactitud)
+    print()
+    imprimir_tabla(['líneas', 'cálculo del total', 'mediana (ms)'], filas_tiempo)
+    if fallos:
+        print(f'\n{fallos} total(es) en centavos distinto(s) de la suma exacta')
+    return 1 if fallos else 0
+
+
+# El tablero calculado al abrir la pantalla: los mismos resultados que get_resumen_ventas
+CONSULTAS_VENTAS_AGRUPADAS = {
+    'dias': '''
+        SELECT date(p.created_at, 'localtime') AS dia, COUNT(*), COALESCE(SUM(d.unidades), 0), SUM(p.total_centavos)
+        FROM pedidos p
+        LEFT JOIN (SELECT pedido_id, SUM(cantidad) AS unidades FROM detalles_pedidos GROUP BY pedido_id) d
+            ON d.pedido_id = p.id
+        WHERE date(p.created_at, 'localtime') >= date('now', 'localtime', '-29 days')
+        GROUP BY dia ORDER BY dia DESC
+    ''',
+    'categorias': '''
+        SELECT COALESCE(pr.categoria, 'Sin categoría') AS categoria, SUM(d.cantidad),
+               SUM(d.cantidad * d.precio_unitario_centavos) AS ingresos
+        FROM detalles_pedidos d LEFT JOIN productos pr ON pr.id = d.producto_id
+        GROUP BY categoria ORDER BY ingresos DESC
+    ''',
+    'mas_vendidos': '''
+        SELECT d.producto_id, COALESCE(pr.nombre, '(producto eliminado)'), SUM(d.cantidad),
+               SUM(d.cantidad * d.precio_unitario_centavos) AS ingresos
+        FROM detalles_pedidos d LEFT JOIN productos pr ON pr.id = d.producto_id
+        GROUP BY d.producto_id ORDER BY ingresos DESC LIMIT 5
+    ''',
+}
+
+
+def poblar_pedidos(db, pedidos, dias, rng):
+    """Inserta pedidos sintéticos repartidos en los últimos dias días (los triggers mantienen el resumen)"""
+    with db.pool.connection() as conn:
+        productos = conn.execute('SELECT id, precio_centavos FROM productos').fetchall()
+    ahora = time.time()
+    with db.pool.transaction() as conn:
+        for inicio in range(0, pedidos, 10000):
+            cabeceras, detalles = [], []
+            for pedido_id in range(inicio + 1, min(inicio + 10000, pedidos) + 1):
+                lineas = [(rng.choice(productos), rng.randint(1, 3)) for _ in range(rng.randint(1, 5))]
+                fecha = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ahora - rng.random() * dias * 86400))
+                cabeceras.append((pedido_id, sum(precio * cantidad for (_, precio), cantidad in lineas), fecha))
+                detalles.extend((pedido_id, producto_id, cantidad, precio)
+                                for (producto_id, precio), cantidad in lineas)
+            conn.executemany('INSERT INTO pedidos (id, total_centavos, direccion, created_at) VALUES (?, ?, \'B\', ?)',
+                             cabeceras)
+            conn.executemany('''
+                INSERT INTO detalles_pedidos (pedido_id, producto_id, cantidad, precio_unitario_centavos)
+                VALUES (?, ?, ?, ?)
+            ''', detalles)
+
+
+def mediana_ms(func, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        func()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000
+
+
+def bench_ventas(args):
+    """Tablero e historial de ventas: GROUP BY al abrir vs resumen mantenido por triggers"""
+    rng = random.Random(11)
+    fallos = 0
+    filas = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = DatabaseManager(db_path, pool=ConnectionPool(db_path), cache=SIN_CACHE)
+        poblar_catalogo(db, args.productos)
+        
+        inicio = time.perf_counter()
+        poblar_pedidos(db, args.pedidos, args.dias, rng)
+        carga = time.perf_counter() - inicio
+        with db.pool.connection() as conn:
+            detalles = conn.execute('SELECT COUNT(*) FROM detalles_pedidos').fetchone()[0]
+        print(f'{args.pedidos} pedidos y {detalles} líneas en {args.dias} días, '
+              f'cargados con triggers en {carga:.1f} s\n')
+        
+        def agrupado():
+            with db.pool.connection() as conn:
+                return {clave: conn.execute(sql).fetchall() for clave, sql in CONSULTAS_VENTAS_AGRUPADAS.items()}
+        
+        resumen = db.get_resumen_ventas()
+        fallos += resumen != agrupado()
+        filas.append(['abrir tablero: GROUP BY sobre detalles', f'{mediana_ms(agrupado, args.repeticiones):.2f}'])
+        filas.append(['abrir tablero: tablas de resumen', f'{mediana_ms(db.get_resumen_ventas, args.repeticiones):.2f}'])
+        
+        # Historial: la página profunda por keyset cuesta lo mismo que la primera; OFFSET no
+        profundidad = args.pedidos // 2
+        _, cursor = db.get_pedidos_pagina(limite=profundidad)
+        
+        def por_offset():
+            with db.pool.connection() as conn:
+                return conn.execute('''
+                    SELECT p.id, datetime(p.created_at, 'localtime'), p.estado, p.total_centavos,
+                           (SELECT COALESCE(SUM(d.cantidad), 0) FROM detalles_pedidos d WHERE d.pedido_id = p.id)
+                    FROM pedidos p ORDER BY p.id DESC LIMIT ? OFFSET ?
+                ''', (TAMANO_PAGINA, profundidad)).fetchall()
+        
+        fallos += db.get_pedidos_pagina(cursor)[0] != por_offset()
+        filas.append(['historial: primera página', f'{mediana_ms(db.get_pedidos_pagina, args.repeticiones):.2f}'])
+        filas.append([f'historial: página en el pedido {profundidad} (OFFSET)',
+                      f'{mediana_ms(por_offset, args.repeticiones):.2f}'])
+        filas.append([f'historial: página en el pedido {profundidad} (keyset)',
+                      f'{mediana_ms(lambda: db.get_pedidos_pagina(cursor), args.repeticiones):.2f}'])
+        
+        # Costo de los triggers en el checkout: carrito de 3 líneas, con y sin resumen
+        with db.pool.transaction() as conn:
+            conn.execute('UPDATE productos SET stock = 1000000')
+        
+        def checkout():
+            db.agregar_lote_al_carrito([(rng.randint(1, args.productos), 1) for _ in range(3)])
+            return db.crear_pedido('Dirección', '0,0')
+        
+        con_triggers = mediana_ms(checkout, args.repeticiones)
+        with db.pool.transaction() as conn:
+            for trigger in ('pedido_insert', 'pedido_delete', 'detalle_insert', 'detalle_delete'):
+                conn.execute(f'DROP TRIGGER ventas_{trigger}')
+        sin_triggers = mediana_ms(checkout, args.repeticiones)
+        with db.pool.transaction() as conn:
+            for trigger in TRIGGERS_RESUMEN_VENTAS:
+                conn.execute(trigger)
+        filas.append(['checkout sin resumen', f'{sin_triggers:.2f}'])
+        filas.append(['checkout con triggers de resumen', f'{con_triggers:.2f}'])
+        
+        # La reconstrucción recupera los pedidos hechos sin triggers y coincide con el GROUP BY
+        inicio = time.perf_counter()
+        db.reconstruir_resumen_ventas()
+        filas.append(['reconstruir resumen', f'{(time.perf_counter() - inicio) * 1000:.2f}'])
+        fallos += db.get_resumen_ventas() != agrupado()
+        
+        # Recategorizar o borrar productos y borrar pedidos (antes o después que sus detalles)
+        # deja el resumen igual al GROUP BY, que usa la categoría actual
+        with db.pool.transaction() as conn:
+            conn.execute("UPDATE productos SET categoria = 'Liquidación' WHERE id % 7 = 0")
+            conn.execute("UPDATE productos SET categoria = 'Procesadores' WHERE id % 11 = 0")
+            conn.execute('DELETE FROM productos WHERE id = 3')
+            conn.execute('DELETE FROM pedidos WHERE id % 10 = 0')
+            conn.execute('DELETE FROM detalles_pedidos WHERE pedido_id % 10 IN (0, 1)')
+            conn.execute('DELETE FROM pedidos WHERE id % 10 = 1')
+        fallos += db.get_resumen_ventas() != agrupado()
+        db.pool.close_all()
+    imprimir_tabla(['operación', 'mediana (ms)'], filas)
+    if fallos:
+        print(f'\n{fallos} verificación(es) fallida(s)')
+    return 1 if fallos else 0
+
+
+class ServidorBackOffice(ThreadingHTTPServer):
+    """Back office de prueba: descomprime, deduplica por clave de idempotencia e inyecta fallas
+    
+    tasa_503/tasa_429 responden errores transitorios sin procesar el lote; tasa_corte
+    procesa el lote y corta la conexión sin responder (el cliente lo reenviará);
+    fuera_de_linea=(cada, dura) corta toda conexión durante 'dura' segundos de cada
+    'cada'; durante los primeros 'sin_autorizacion' segundos todo se responde 401
+    (token vencido); las claves en 'venenosas' se rechazan con 422.
+    """
+    daemon_threads = True
+    
+    def __init__(self, tasa_503=0.0, tasa_429=0.0, tasa_corte=0.0, fuera_de_linea=None, latencia=0.0,
+                 sin_autorizacion=0.0, semilla=5):
+        super().__init__(('127.0.0.1', 0), ManejadorBackOffice)
+        self.tasa_503 = tasa_503
+        self.tasa_429 = tasa_429
+        self.tasa_corte = tasa_corte
+        self.fuera_de_linea = fuera_de_linea
+        self.latencia = latencia
+        self.sin_autorizacion = sin_autorizacion
+        self.venenosas = set()
+        self.recibidos = {}
+        self.duplicados = 0
+        self.peticiones = 0
+        self.fallas = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(semilla)
+        self.inicio = time.monotonic()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+    
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/pedidos'
+    
+    def desconectado(self):
+        if self.fuera_de_linea is None:
+            return False
+        cada, dura = self.fuera_de_linea
+        return (time.monotonic() - self.inicio) % cada < dura
+
+
+class ManejadorBackOffice(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, formato, *args):
+        pass
+    
+    def responder(self, estado, cuerpo=b'', cabeceras=()):
+        self.send_response(estado)
+        for nombre, valor in cabeceras:
+            self.send_header(nombre, valor)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+    
+    def do_POST(self):
+        servidor = self.server
+        cuerpo = self.rfile.read(int(self.headers['Content-Length']))
+        with servidor.lock:
+            servidor.peticiones += 1
+            azar = servidor.rng.random()
+        if servidor.latencia:
+            time.sleep(servidor.latencia)
+        if servidor.desconectado():
+            with servidor.lock:
+                servidor.fallas += 1
+            self.close_connection = True
+            return
+        if time.monotonic() - servidor.inicio < servidor.sin_autorizacion:
+            with servidor.lock:
+                servidor.fallas += 1
+            self.responder(401, b'token vencido')
+            return
+        if azar < servidor.tasa_503:
+            with servidor.lock:
+                servidor.fallas += 1
+            self.responder(503, b'mantenimiento')
+            return
+        azar -= servidor.tasa_503
+        if azar < servidor.tasa_429:
+            with servidor.lock:
+                servidor.fallas += 1
+            self.responder(429, cabeceras=[('Retry-After', '0')])
+            return
+        azar -= servidor.tasa_429
+        
+        if self.headers.get('Content-Encoding') == 'gzip':
+            cuerpo = gzip.decompress(cuerpo)
+        pedidos = json.loads(cuerpo)['pedidos']
+        if any(pedido['clave_idempotencia'] in servidor.venenosas for pedido in pedidos):
+            self.responder(422, b'pedido invalido')
+            return
+        with servidor.lock:
+            for pedido in pedidos:
+                if pedido['clave_idempotencia'] in servidor.recibidos:
+                    servidor.duplicados += 1
+                else:
+                    servidor.recibidos[pedido['clave_idempotencia']] = pedido['pedido']['pedido_id']
+        if azar < servidor.tasa_corte:
+            # Procesado, pero la respuesta se pierde: el cliente reenviará el lote
+            with servidor.lock:
+                servidor.fallas += 1
+            self.close_connection = True
+            return
+        self.responder(200, b'{"ok":true}', [('Content-Type', 'application/json')])
+
+
+def copiar_base(origen, destino):
+    """Copia una base en WAL con la API de respaldo (copiar el archivo perdería el -wal)"""
+    fuente, copia = sqlite3.connect(origen), sqlite3.connect(destino)
+    with copia:
+        fuente.backup(copia)
+    fuente.close()
+    copia.close()
+
+
+def bench_sincronizacion(args):
+    """Outbox de pedidos: rendimiento del envío por lotes y corrección ante una red inestable"""
+    rng = random.Random(17)
+    fallos = 0
+    filas = []
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'base.db')
+        db = DatabaseManager(base, pool=ConnectionPool(base), cache=SIN_CACHE)
+        poblar_catalogo(db, args.productos)
+        poblar_pedidos(db, args.pedidos, 365, rng)
+        # Pedidos cargados por fuera de crear_pedido: se encolan como haría la migración
+        inicio = time.perf_counter()
+        encolados = db.encolar_pedidos_sin_enviar()
+        segundos = time.perf_counter() - inicio
+        print(f'{encolados} pedidos encolados en {segundos:.1f} s ({encolados / segundos:,.0f} pedidos/s)')
+        
+        # Checkout con el encolado en la misma transacción
+        with db.pool.transaction() as conn:
+            conn.execute('UPDATE productos SET stock = 1000000')
+        
+        def checkout():
+            db.agregar_lote_al_carrito([(rng.randint(1, args.productos), 1) for _ in range(3)])
+            return db.crear_pedido('Dirección', '0,0')
+        
+        print(f'checkout (crear_pedido + encolado): {mediana_ms(checkout, 20):.2f} ms de mediana\n')
+        with db.pool.connection() as conn:
+            esperados = {fila[0] for fila in conn.execute('SELECT pedido_id FROM outbox_pedidos')}
+            venenosa = conn.execute('SELECT clave_idempotencia FROM outbox_pedidos ORDER BY id LIMIT 1 OFFSET ?',
+                                    (len(esperados) // 2,)).fetchone()[0]
+        db.pool.close_all()
+        
+        escenarios = [(f'lote {tamano}, gzip', dict(tamano_lote=tamano), {}) for tamano in (int(t) for t in args.lotes.split(','))]
+        escenarios.append(('lote 200, sin comprimir', dict(tamano_lote=200, comprimir=False), {}))
+        escenarios.append(('lote 200, red inestable', dict(tamano_lote=200), dict(
+            tasa_503=0.05, tasa_429=0.03, tasa_corte=0.03, fuera_de_linea=(2.0, 0.5), latencia=0.005,
+        )))
+        # Un 401 no es culpa de ningún pedido: se pausa la cola, sin partir lotes ni rechazar
+        escenarios.append(('lote 200, 401 durante 1 s', dict(tamano_lote=200), dict(sin_autorizacion=1.0)))
+        for nombre, opciones, fallas in escenarios:
+            db_path = os.path.join(tmp, 'escenario.db')
+            copiar_base(base, db_path)
+            db = DatabaseManager(db_path, pool=ConnectionPool(db_path), cache=SIN_CACHE)
+            servidor = ServidorBackOffice(**fallas)
+            inestable = 'tasa_503' in fallas
+            if inestable:
+                servidor.venenosas.add(venenosa)
+            worker = OrderSyncWorker(db, servidor.url, espera_base=0.05, espera_max=1.0, **opciones)
+            
+            # El hilo principal simula la UI: ticks de 16 ms y cuánto se atrasan mientras se sincroniza
+            atrasos = []
+            inicio = time.perf_counter()
+            worker.start()
+            siguiente_control = inicio
+            while True:
+                esperado = time.perf_counter() + 1 / 60
+                time.sleep(1 / 60)
+                atrasos.append(time.perf_counter() - esperado)
+                if time.perf_counter() >= siguiente_control:
+                    siguiente_control = time.perf_counter() + 0.25
+                    if 'pendiente' not in db.estado_outbox():
+                        break
+                    if time.perf_counter() - inicio > args.timeout:
+                        print(f'{nombre}: quedaron pedidos pendientes tras {args.timeout} s')
+                        break
+            segundos = time.perf_counter() - inicio
+            worker.stop()
+            servidor.shutdown()
+            servidor.server_close()
+            
+            estado = db.estado_outbox()
+            recibidos = list(servidor.recibidos.values())
+            faltantes = esperados - set(recibidos)
+            rechazados = estado.get('rechazado', 0)
+            # Con la red inestable solo puede faltar el pedido envenenado, y debe quedar rechazado
+            permitidos = 1 if inestable else 0
+            fallos += rechazados != permitidos or len(faltantes) != permitidos
+            fallos += len(recibidos) != len(set(recibidos)) or estado.get('pendiente', 0) > 0
+            # Con backoff la cola insiste unas pocas veces, no una por pedido
+            fallos += servidor.fallas > 50 and not inestable
+            
+            atrasos.sort()
+            stats = worker.estadisticas()
+            filas.append([
+                nombre, f'{len(set(recibidos)) / segundos:,.0f}', servidor.peticiones,
+                f'{stats["bytes_json"] / max(stats["bytes_enviados"], 1):.1f}x',
+                stats['reintentos'], servidor.duplicados, rechazados,
+                f'{atrasos[int(len(atrasos) * 0.99)] * 1000:.1f}', f'{atrasos[-1] * 1000:.1f}',
+            ])
+            db.pool.close_all()
+            os.remove(db_path)
+    print()
+    imprimir_tabla(['escenario', 'pedidos/s', 'peticiones', 'compresión', 'reintentos', 'duplicados absorbidos',
+                    'rechazados', 'atraso UI p99 (ms)', 'atraso UI máx (ms)'], filas)
+    if fallos:
+        print(f'\n{fallos} verificación(es) fallida(s): pedidos faltantes, duplicados o sin enviar')
+    return 1 if fallos else 0
+
+
+# Suite de regresión: las operaciones de DatabaseManager y GPSManager a varios tamaños, con salida JSON
+MARCAS_SINTETICAS = {
+    'Procesadores': ['AMD Ryzen', 'Intel Core', 'AMD Athlon', 'Intel Pentium'],
+    'Tarjetas Gráficas': ['NVIDIA GeForce', 'AMD Radeon', 'Intel Arc', 'Zotac Gaming'],
+    'Memorias RAM': ['Kingston Fury', 'Corsair Vengeance', 'GSkill Trident', 'Crucial Pro'],
+    'Motherboards': ['ASUS Prime', 'MSI Tomahawk', 'Gigabyte Aorus', 'ASRock Steel'],
+    'Almacenamiento': ['Samsung EVO', 'WD Black', 'Seagate Barracuda', 'Kingston NV'],
+    'Fuentes de Poder': ['Corsair RM', 'EVGA SuperNOVA', 'Seasonic Focus', 'Thermaltake Smart'],
+    'Refrigeración': ['Noctua NH', 'Cooler Master Hyper', 'NZXT Kraken', 'Arctic Freezer'],
+    'Cases': ['NZXT H', 'Lian Li Lancool', 'Corsair iCUE', 'Fractal Meshify'],
+}
+ADJETIVOS_SINTETICOS = ['gamer', 'silencioso', 'compacto', 'económico', 'profesional', 'RGB', 'de alto rendimiento']
+
+
+def catalogo_sintetico(n, rng):
+    """Filas de productos con marca y modelo: cada marca cubre ~1/32 del catálogo y cada modelo es único"""
+    for i in range(n):
+        categoria = CATEGORIAS[i % len(CATEGORIAS)]
+        marca = rng.choice(MARCAS_SINTETICAS[categoria])
+        # Stock de sobra: los checkouts de la suite no deben quedarse sin unidades
+        yield (f'{marca} M{i}', categoria, rng.randrange(5000, 5000000, 100),
+               f'{categoria} {marca} {rng.choice(ADJETIVOS_SINTETICOS)}', 1000000, f'7{i:012d}', f'producto_{i}.jpg')
+
+
+def cronometrar(func, repeticiones, presupuesto, preparar=None):
+    """Mediana, p95 y mínimo en ms de func() (preparar() corre fuera de la medición)
+    
+    Hace una llamada de calentamiento y corta al agotar el presupuesto en segundos,
+    con al menos tres mediciones.
+    """
+    if preparar is not None:
+        preparar()
+    resultado = func()
+    tiempos = []
+    limite = time.perf_counter() + presupuesto
+    while len(tiempos) < repeticiones and (len(tiempos) < 3 or time.perf_counter() < limite):
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        func()
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return {
+        'mediana_ms': statistics.median(tiempos) * 1000,
+        'p95_ms': tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))] * 1000,
+        'min_ms': tiempos[0] * 1000,
+        'repeticiones': len(tiempos),
+        # Filas devueltas (las operaciones que devuelven una sola fila o línea no cuentan)
+        'filas': None if resultado is None or isinstance(resultado, tuple) else len(resultado),
+    }
+
+
+def comparar_suite(actual, anterior, tolerancia, umbral_ms):
+    """Filas de la comparación entre dos informes de la suite y cantidad de regresiones
+    
+    Una operación es una regresión si su mediana empeora más que la tolerancia
+    relativa y además más que umbral_ms (las de microsegundos son puro ruido).
+    """
+    filas = []
+    regresiones = 0
+    for tamano, operaciones in actual['resultados'].items():
+        for operacion, medicion in operaciones.items():
+            previa = anterior['resultados'].get(tamano, {}).get(operacion)
+            if previa is None:
+                continue
+            antes, ahora = previa['mediana_ms'], medicion['mediana_ms']
+            regresion = ahora > antes * (1 + tolerancia) and ahora - antes > umbral_ms
+            regresiones += regresion
+            filas.append([tamano, operacion, f'{antes:.3f}', f'{ahora:.3f}',
+                          f'{ahora / antes:.2f}x' if antes else '-', 'REGRESIÓN' if regresion else ''])
+    return filas, regresiones
+
+
+def bench_suite(args):
+    """Catálogo, carrito, pedidos y distancias a 1k, 100k y 1M filas; informe JSON comparable entre corridas"""
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+    tamanos = [int(t) for t in args.tamanos.split(',')]
+    rng = random.Random(args.semilla)
+    gps_manager = GPSManager()
+    origen = (10.4236, -75.5378)
+    numpy = App.importar_numpy()
+    resultados = {}
+    generacion = {}
+    filas = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in tamanos:
+            db_path = os.path.join(tmp, f'suite_{n}.db')
+            db = DatabaseManager(db_path, pool=ConnectionPool(db_path), cache=SIN_CACHE)
+            inicio = time.perf_counter()
+            with db.pool.transaction() as conn:
+                conn.executemany('''
+                    INSERT INTO productos (nombre, categoria, precio_centavos, descripcion, stock, codigo_barras,
+                                           imagen_url)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', catalogo_sintetico(n, rng))
+            catalogo = time.perf_counter() - inicio
+            inicio = time.perf_counter()
+            poblar_pedidos(db, n, 365, rng)
+            generacion[str(n)] = {'catalogo_s': catalogo, 'pedidos_s': time.perf_counter() - inicio}
+            
+            codigos = itertools.cycle([f'7{rng.randrange(n):012d}' for _ in range(1000)])
+            with db.pool.connection() as conn:
+                modelo = conn.execute('SELECT nombre FROM productos WHERE id = ?', (n // 2,)).fetchone()[0].split()[-1]
+            
+            def llenar_carrito():
+                db.agregar_lote_al_carrito([(rng.randint(1, n), 1) for _ in range(args.carrito)])
+            
+            def vaciar_y_llenar_carrito():
+                db.limpiar_carrito()
+                llenar_carrito()
+            
+            lats = [rng.uniform(-60, 60) for _ in range(n)]
+            lons = [rng.uniform(-180, 180) for _ in range(n)]
+            lats_lote, lons_lote = (numpy.array(lats), numpy.array(lons)) if numpy is not None else (lats, lons)
+            
+            operaciones = [
+                ('get_productos por categoría', lambda: db.get_productos('Procesadores'), None),
+                ('get_productos por búsqueda (marca)', lambda: db.get_productos(busqueda='ryzen'), None),
+                ('get_productos por búsqueda (modelo)', lambda: db.get_productos(busqueda=modelo), None),
+                ('get_producto_por_codigo', lambda: db.get_producto_por_codigo(next(codigos)), None),
+                ('get_carrito', db.get_carrito, vaciar_y_llenar_carrito),
+                ('agregar_al_carrito', lambda: db.agregar_al_carrito(rng.randint(1, n)), None),
+                ('crear_pedido', lambda: db.crear_pedido('Dirección de prueba', '10.4236,-75.5378'), llenar_carrito),
+                ('calculate_distance (barrido)',
+                 lambda: [gps_manager.calculate_distance(*origen, lat, lon) for lat, lon in zip(lats, lons)], None),
+                ('calculate_distances (lote)', lambda: gps_manager.calculate_distances(*origen, lats_lote, lons_lote),
+                 None),
+            ]
+            resultados[str(n)] = {}
+            for nombre, func, preparar in operaciones:
+                medicion = cronometrar(func, args.repeticiones, args.presupuesto, preparar)
+                resultados[str(n)][nombre] = medicion
+                filas.append([n, nombre, f'{medicion["mediana_ms"]:.3f}', f'{medicion["p95_ms"]:.3f}',
+                              medicion['repeticiones'], '-' if medicion['filas'] is None else medicion['filas']])
+            db.pool.close_all()
+            print(f'{n} filas: catálogo en {catalogo:.1f} s, pedidos en {generacion[str(n)]["pedidos_s"]:.1f} s',
+                  flush=True)
+    
+    informe = {
+        'formato': 1,
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'entorno': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'plataforma': platform.platform(),
+            'numpy': numpy is not None,
+        },
+        'parametros': {'tamanos': tamanos, 'carrito': args.carrito, 'repeticiones': args.repeticiones,
+                       'presupuesto_s': args.presupuesto, 'semilla': args.semilla, 'cache': False},
+        'generacion': generacion,
+        'resultados': resultados,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as archivo:
+        json.dump(informe, archivo, ensure_ascii=False, indent=2)
+    print()
+    imprimir_tabla(['filas', 'operación', 'mediana (ms)', 'p95 (ms)', 'repeticiones', 'filas devueltas'], filas)
+    print(f'\nInforme JSON en {args.salida}')
+    
+    if anterior is None:
+        return 0
+    if anterior.get('entorno') != informe['entorno']:
+        print(f'\nAviso: el informe anterior es de otro entorno ({anterior.get("entorno")}); '
+              'la comparación puede no ser representativa')
+    comparacion, regresiones = comparar_suite(informe, anterior, args.tolerancia, args.umbral_ms)
+    print()
+    imprimir_tabla(['filas', 'operación', 'antes (ms)', 'ahora (ms)', 'relación', ''], comparacion)
+    if regresiones:
+        print(f'\n{regresiones} operación(es) más lenta(s) que {args.comparar} '
+              f'(tolerancia {args.tolerancia:.0%}, umbral {args.umbral_ms} ms)')
+    return 1 if regresiones else 0
+
+
+def bench_busqueda(args):
+    """Búsqueda del catálogo mientras se tipea: latencia tecla -> render y consultas por tecla"""
+    from kivy.clock import Clock
+
+    fallos = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = DatabaseManager(db_path, pool=ConnectionPool(db_path), cache=SIN_CACHE)
+        with db.pool.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO productos (nombre, categoria, precio_centavos, descripcion, stock, codigo_barras, imagen_url)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', catalogo_sintetico(args.productos, random.Random(5)))
+
+        # Cuenta las consultas que llegan a la base; fallar[0] hace que la próxima lance
+        consultas = [0]
+        fallar = [False]
+        pagina = db.get_productos_pagina
+
+        def contar(*a, **k):
+            consultas[0] += 1
+            if fallar[0]:
+                fallar[0] = False
+                raise sqlite3.ProgrammingError('falla inyectada')
+            return pagina(*a, **k)
+
+        db.get_productos_pagina = contar
+        entregas = []
+        pipeline = SearchPipeline(db, lambda filas, siguiente, anexar: entregas.append(len(filas)),
+                                  debounce=args.debounce)
+
+        def correr_clock(segundos):
+            limite = time.perf_counter() + segundos
+            while time.perf_counter() < limite:
+                Clock.tick()
+
+        teclas = 0
+        for palabra in args.palabras.split(','):
+            for i in range(1, len(palabra) + 1):
+                pipeline.submit(busqueda=palabra[:i])
+                teclas += 1
+                correr_clock(args.intervalo)
+            correr_clock(args.debounce + 0.5)  # Pausa tras la palabra: llega el resultado
+        stats = pipeline.estadisticas()
+        fallos += stats['muestras'] == 0
+        consultas_tipeo, mostrados = consultas[0], len(entregas)
+
+        # Una búsqueda que falla no debe detener las siguientes
+        fallar[0] = True
+        pipeline.submit(busqueda='nvidia', inmediato=True)
+        correr_clock(0.5)
+        pipeline.submit(busqueda='kingston', inmediato=True)
+        correr_clock(0.5)
+        fallos += pipeline.errores != 1 or len(entregas) != mostrados + 1
+        db.pool.close_all()
+
+    imprimir_tabla(['productos', 'teclas', 'consultas', 'resultados mostrados', 'tecla -> render p50 (ms)',
+                    'p95 (ms)', 'máx (ms)'],
+                   [[args.productos, teclas, consultas_tipeo, mostrados, f"{stats.get('p50', 0):.1f}",
+                     f"{stats.get('p95', 0):.1f}", f"{stats.get('max', 0):.1f}"]])
+    print(f'\nDebounce de {args.debounce * 1000:.0f} ms con una tecla cada {args.intervalo * 1000:.0f} ms')
+    if fallos:
+        print('\nLa búsqueda no se recuperó de la consulta fallida o no mostró resultados')
+    return 1 if fallos else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de Mi Tienda')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    conexiones = subparsers.add_parser('conexiones', help='Conexión por llamada vs pool persistente')
+    conexiones.add_argument('--iteraciones', type=int, default=2000)
+    conexiones.set_defaults(func=bench_conexiones)
+
+    arranque = subparsers.add_parser('arranque', help='Coste de inicialización de la base de datos')
+    arranque.add_argument('--repeticiones', type=int, default=20)
+    arranque.set_defaults(func=bench_arranque)
+
+    planes = subparsers.add_parser('planes', help='Regresión de planes de consulta (EXPLAIN QUERY PLAN)')
+    planes.set_defaults(func=bench_planes)
+
+    listas = subparsers.add_parser('listas', help='Render de la lista de productos a distintos tamaños')
+    listas.add_argument('--tamanos', default='100,10000,100000')
+    listas.add_argument('--max-legado', type=int, default=10000,
+                        help='Tamaño máximo para el render con widgets por fila (es muy lento)')
+    listas.set_defaults(func=bench_listas)
+
+    paginas = subparsers.add_parser('paginas', help='Catálogo completo vs paginación por cursor')
+    paginas.add_argument('--tamanos', default='1000,10000,100000')
+    paginas.set_defaults(func=bench_paginas)
+
+    checkout = subparsers.add_parser('checkout', help='Checkouts concurrentes: sobreventa y pedidos/s')
+    checkout.add_argument('--hilos', type=int, default=8)
+    checkout.add_argument('--intentos', type=int, default=100)
+    checkout.add_argument('--stock', type=int, default=500)
+    checkout.add_argument('--lineas', type=int, default=5, help='Productos distintos por pedido')
+    checkout.set_defaults(func=bench_checkout)
+
+    scanner = subparsers.add_parser('scanner', help='Decodificación EAN-13: precisión, coste y frames descartados')
+    scanner.add_argument('--codigos', type=int, default=12, help='Frames sintéticos distintos')
+    scanner.add_argument('--frames', type=int, default=200)
+    scanner.add_argument('--fps', type=int, default=30, help='Tasa a la que la cámara entrega frames')
+    scanner.add_argument('--fixtures', help='Directorio con imágenes PGM nombradas por su código')
+    scanner.set_defaults(func=bench_scanner)
+
+    lote = subparsers.add_parser('lote', help='Escaneo individual vs modo lote con escritura agrupada')
+    lote.add_argument('--lecturas', default='20,100,500')
+    lote.add_argument('--catalogo', type=int, default=10000)
+    lote.set_defaults(func=bench_lote)
+
+    sacudidas = subparsers.add_parser('sacudidas', help='Detección de sacudidas sobre trazas del acelerómetro')
+    sacudidas.add_argument('--duracion', type=float, default=60, help='Segundos de cada traza sintética')
+    sacudidas.add_argument('--trazas', help='Directorio con CSV t,x,y,z grabados')
+    sacudidas.set_defaults(func=bench_sacudidas)
+
+    tiendas = subparsers.add_parser('tiendas', help='Tiendas cercanas: índice espacial vs fuerza bruta')
+    tiendas.add_argument('--tamanos', default='10000,100000')
+    tiendas.add_argument('--k', type=int, default=10)
+    tiendas.add_argument('--radio', type=float, default=5.0, help='Radio de búsqueda en km')
+    tiendas.set_defaults(func=bench_tiendas)
+
+    distancias = subparsers.add_parser('distancias', help='Distancias escalares vs en lote (NumPy y Python puro)')
+    distancias.add_argument('--tamanos', default='1000,10000,100000,1000000')
+    distancias.set_defaults(func=bench_distancias)
+
+    gps = subparsers.add_parser('gps', help='Suavizado, throttle y referencias del servicio de ubicación')
+    gps.add_argument('--duracion', type=float, default=600, help='Segundos del recorrido simulado (1 lectura/s)')
+    gps.add_argument('--intervalo', type=float, default=2.0, help='Segundos mínimos entre avisos')
+    gps.add_argument('--recorrido', help='CSV t,lat,lon,precision grabado (sin posición real no hay error)')
+    gps.set_defaults(func=bench_gps)
+
+    carrito = subparsers.add_parser('carrito', help='Operaciones del carrito: recarga completa vs deltas')
+    carrito.add_argument('--tamanos', default='1,10,100,1000')
+    carrito.add_argument('--repeticiones', type=int, default=30)
+    carrito.set_defaults(func=bench_carrito)
+
+    executor = subparsers.add_parser('executor', help='Frames perdidos: SQLite en el hilo de UI vs DatabaseExecutor')
+    executor.add_argument('--duracion', type=float, default=5, help='Segundos de cada sesión')
+    executor.add_argument('--toques', type=float, default=20, help='Acciones del usuario por segundo')
+    executor.add_argument('--latencia-commit', type=float, default=20,
+                          help='ms que se suman a cada COMMIT (simula el fsync de una flash lenta)')
+    executor.add_argument('--escrituras', type=int, default=2000)
+    executor.set_defaults(func=bench_executor)
+
+    primer_frame = subparsers.add_parser('primer-frame', help='Tiempo hasta el primer frame por componente')
+    primer_frame.add_argument('--repeticiones', type=int, default=5)
+    primer_frame.set_defaults(func=bench_primer_frame)
+
+    miniaturas = subparsers.add_parser('miniaturas', help='Imágenes del catálogo: decodificar en UI vs miniaturas en caché')
+    miniaturas.add_argument('--imagenes', type=int, default=60, help='Productos con imagen propia')
+    miniaturas.add_argument('--ancho', type=int, default=1600, help='Ancho de las imágenes originales (4:3)')
+    miniaturas.add_argument('--visibles', type=int, default=8, help='Filas en pantalla')
+    miniaturas.add_argument('--velocidad', type=int, default=1, help='Filas que avanza el scroll por frame')
+    miniaturas.add_argument('--lado', type=int, default=96)
+    miniaturas.add_argument('--memoria', type=float, default=8, help='Presupuesto de texturas en MiB')
+    miniaturas.set_defaults(func=bench_miniaturas)
+
+    importacion = subparsers.add_parser('importacion', help='Importación/exportación del catálogo en streaming')
+    importacion.add_argument('--filas', type=int, default=200000)
+    importacion.add_argument('--bloque', type=int, default=5000, help='Filas por executemany')
+    importacion.set_defaults(func=bench_importacion)
+
+    centavos = subparsers.add_parser('centavos', help='Exactitud del total del carrito en centavos enteros')
+    centavos.add_argument('--lineas', default='1000,5000', help='Líneas del carrito, separadas por comas')
+    centavos.add_argument('--operaciones', type=int, default=5000, help='Cambios de cantidad aplicados por deltas')
+    centavos.set_defaults(func=bench_centavos)
+
+    ventas = subparsers.add_parser('ventas', help='Tablero de ventas: resumen incremental vs GROUP BY')
+    ventas.add_argument('--pedidos', type=int, default=100000)
+    ventas.add_argument('--dias', type=int, default=365, help='Días en que se reparten los pedidos')
+    ventas.add_argument('--productos', type=int, default=2000)
+    ventas.add_argument('--repeticiones', type=int, default=10)
+    ventas.set_defaults(func=bench_ventas)
+
+    sincronizacion = subparsers.add_parser('sincronizacion', help='Envío del outbox de pedidos a un back office local')
+    sincronizacion.add_argument('--pedidos', type=int, default=100000, help='Pedidos en cola al empezar')
+    sincronizacion.add_argument('--productos', type=int, default=2000)
+    sincronizacion.add_argument('--lotes', default='50,200,1000', help='Tamaños de lote a comparar (con gzip)')
+    sincronizacion.add_argument('--timeout', type=float, default=600, help='Segundos máximos por escenario')
+    sincronizacion.set_defaults(func=bench_sincronizacion)
+
+    suite = subparsers.add_parser('suite', help='Operaciones de DatabaseManager y GPSManager a varios tamaños, en JSON')
+    suite.add_argument('--tamanos', default='1000,100000,1000000',
+                       help='Filas de catálogo (y pedidos en el historial) de cada corrida')
+    suite.add_argument('--carrito', type=int, default=20, help='Líneas del carrito para get_carrito y crear_pedido')
+    suite.add_argument('--repeticiones', type=int, default=30)
+    suite.add_argument('--presupuesto', type=float, default=2.0,
+                       help='Segundos máximos por operación (con al menos 3 mediciones)')
+    suite.add_argument('--semilla', type=int, default=25)
+    suite.add_argument('--salida', default='benchmark_suite.json', help='Archivo del informe JSON')
+    suite.add_argument('--comparar', help='Informe JSON anterior contra el que detectar regresiones')
+    suite.add_argument('--tolerancia', type=float, default=0.25, help='Empeoramiento relativo admitido (0.25 = 25%%)')
+    suite.add_argument('--umbral-ms', type=float, default=0.05,
+                       help='Diferencia absoluta mínima para contar una regresión')
+    suite.set_defaults(func=bench_suite)
+
+    busqueda = subparsers.add_parser('busqueda', help='Búsqueda mientras se tipea: latencia tecla -> render')
+    busqueda.add_argument('--productos', type=int, default=100000)
+    busqueda.add_argument('--palabras', default='ryzen,geforce rtx,kingston fury,samsung evo,noctua')
+    busqueda.add_argument('--intervalo', type=float, default=0.12, help='Segundos entre teclas')
+    busqueda.add_argument('--debounce', type=float, default=0.3)
+    busqueda.set_defaults(func=bench_busqueda)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()